@@ -0,0 +1,342 @@
+"""Load test and latency benchmark for the admin and student FastAPI services.
+
+Both services are started in-process as the combined ``lib.server`` app
+(lifespan included) and driven through
+httpx's ASGI transport against a throwaway MongoDB database, so results
+measure the handlers and MongoDB, not the network or uvicorn.
+
+Run from the repository root (needs ``httpx`` on top of requirement.txt):
+
+    python -m benchmarks.load_test --scale 1000 10000 --concurrency 10 50 \\
+        --duration 15 --output bench-main.json
+
+    # compare against an earlier run; exits 1 on a regression
+    python -m benchmarks.load_test --scale 10000 --output bench-pr.json \\
+        --compare bench-main.json
+
+By default a temporary ``mongod`` is spawned when one is on PATH; otherwise
+pass ``--mongo-uri`` for an existing local server. The benchmark database is
+dropped afterwards.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+BENCH_DB = "studentERP_bench"
+PASSWORD = "bench-password"
+ACADEMIC_YEAR = "FE"
+COURSES = ["CS", "ENTC", "Mechanical", "AIDS", "Civil"]
+SEED_BATCH = 1000
+
+# (app, label, weight): the traffic mix each benchmark worker samples from
+SCENARIOS = [
+    ("admin", "POST /admin_login", 1),
+    ("admin", "GET /admin/students", 2),
+    ("admin", "GET /student/get-fees/{id}", 3),
+    ("admin", "POST /student/pay-fees", 2),
+    ("student", "POST /student/login", 2),
+    ("student", "GET /get_student_profile", 4),
+    ("student", "POST /pay_fees", 1),
+    ("student", "GET /all_student_profiles", 1),
+    ("student", "GET /notifications/{id}", 2),
+]
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@contextmanager
+def spawned_mongod():
+    """Start a throwaway mongod on a free port and yield its URI."""
+    dbpath = tempfile.mkdtemp(prefix="erp-bench-")
+    port = _free_port()
+    process = subprocess.Popen(
+        ["mongod", "--dbpath", dbpath, "--port", str(port), "--bind_ip", "127.0.0.1", "--quiet"],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            try:
+                socket.create_connection(("127.0.0.1", port), timeout=0.5).close()
+                break
+            except OSError:
+                time.sleep(0.2)
+        else:
+            raise RuntimeError("mongod did not start within 30s")
+        yield f"mongodb://127.0.0.1:{port}"
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+        shutil.rmtree(dbpath, ignore_errors=True)
+
+
+async def seed(db, scale: int, password_hash: str):
+    """Insert ``scale`` students with profiles, fee records and notifications."""
+    await db.admins.insert_many(
+        [{"employee_id": f"EMP{n:03d}", "password": password_hash} for n in range(10)]
+    )
+
+    now = datetime.utcnow()
+    for start in range(0, scale, SEED_BATCH):
+        numbers = range(start, min(start + SEED_BATCH, scale))
+        students, profiles, fees, notifications = [], [], [], []
+        for n in numbers:
+            email = f"student{n}@erp-bench.edu"
+            total = float(random.choice([50000, 75000, 100000]))
+            paid = float(random.choice([0, total / 2, total]))
+            students.append({
+                "student_id": f"STU{n + 9_000_000:07d}",
+                "name": f"Student {n}",
+                "email": email,
+                "course": random.choice(COURSES),
+                "academic_year": ACADEMIC_YEAR,
+                "total_fees": total,
+                "paid_fees": paid,
+                "remaining_fees": total - paid,
+                "password": password_hash,
+            })
+            profiles.append({
+                "email": email,
+                "full_name": f"Student {n}",
+                "branch": random.choice(COURSES),
+                "dob": "2004-05-17",
+                "phone": f"9{n:09d}",
+                "semester": "1",
+            })
+            fees.append({
+                "email": email,
+                "academic_year": ACADEMIC_YEAR,
+                "total_fees": total,
+                "paid_fees": paid,
+                "remaining_fees": total - paid,
+                "exam_fees": 0,
+                "paid_exam_fees": 0,
+            })
+            notifications.extend(
+                {
+                    "student_id": f"STU{n + 9_000_000:07d}",
+                    "message": f"Notice {k}",
+                    "timestamp": now - timedelta(hours=k),
+                    "read": k > 0,
+                }
+                for k in range(3)
+            )
+        await asyncio.gather(
+            db.students.insert_many(students, ordered=False),
+            db.student_profiles.insert_many(profiles, ordered=False),
+            db.fees.insert_many(fees, ordered=False),
+            db.notifications.insert_many(notifications, ordered=False),
+        )
+
+
+def _request(label: str, scale: int):
+    n = random.randrange(scale)
+    email = f"student{n}@erp-bench.edu"
+    student_id = f"STU{n + 9_000_000:07d}"
+    after = f"STU{random.randrange(max(scale - 100, 1)) + 9_000_000:07d}"
+
+    if label == "POST /admin_login":
+        return "POST", "/admin_login", {"json": {"employee_id": f"EMP{random.randrange(10):03d}", "password": PASSWORD}}
+    if label == "GET /admin/students":
+        return "GET", "/admin/students", {"params": {"limit": 50, "after": after}}
+    if label == "GET /student/get-fees/{id}":
+        return "GET", f"/student/get-fees/{student_id}", {}
+    if label == "POST /student/pay-fees":
+        return "POST", "/student/pay-fees", {"json": {"student_id": student_id, "amount_paid": 10}}
+    if label == "POST /student/login":
+        return "POST", "/student/login", {"json": {"name": f"Student {n}", "email": email}}
+    if label == "GET /get_student_profile":
+        return "GET", "/get_student_profile", {"params": {"email": email}}
+    if label == "POST /pay_fees":
+        return "POST", "/pay_fees", {"json": {"email": email, "academic_year": ACADEMIC_YEAR, "amount": 10}}
+    if label == "GET /all_student_profiles":
+        return "GET", "/all_student_profiles", {"params": {"limit": 50, "after": f"student{n}@erp-bench.edu"}}
+    if label == "GET /notifications/{id}":
+        return "GET", f"/notifications/{student_id}", {"params": {"limit": 20}}
+    raise ValueError(label)
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(int(round(fraction * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+async def run_level(clients, scale: int, concurrency: int, duration: float) -> Dict[str, dict]:
+    labels = [label for _, label, _ in SCENARIOS]
+    weights = [weight for _, _, weight in SCENARIOS]
+    app_of = {label: app for app, label, _ in SCENARIOS}
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    statuses: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+    deadline = time.perf_counter() + duration
+
+    async def worker():
+        while time.perf_counter() < deadline:
+            label = random.choices(labels, weights)[0]
+            method, path, kwargs = _request(label, scale)
+            started = time.perf_counter()
+            try:
+                response = await clients[app_of[label]].request(method, path, **kwargs)
+                status = str(response.status_code)
+            except Exception as e:
+                status = type(e).__name__
+            latencies[label].append(time.perf_counter() - started)
+            statuses[label][status] += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    report = {}
+    for label in labels:
+        values = sorted(latencies[label])
+        report[label] = {
+            "requests": len(values),
+            "rps": round(len(values) / elapsed, 2),
+            "p50_ms": round(percentile(values, 0.50) * 1000, 3),
+            "p95_ms": round(percentile(values, 0.95) * 1000, 3),
+            "p99_ms": round(percentile(values, 0.99) * 1000, 3),
+            "statuses": dict(statuses[label]),
+        }
+    total = sum(len(values) for values in latencies.values())
+    report["_all"] = {"requests": total, "rps": round(total / elapsed, 2), "seconds": round(elapsed, 3)}
+    return report
+
+
+async def benchmark(args) -> dict:
+    # The app reads its database settings when its lifespan connects
+    os.environ["MONGODB_URI"] = args.mongo_uri
+    os.environ["ERP_DB_NAME"] = args.db_name
+
+    import httpx
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    from lib.common.passwords import password_service
+    from lib.server import app
+
+    seed_client = AsyncIOMotorClient(args.mongo_uri)
+    results = {}
+    try:
+        for scale in args.scale:
+            await seed_client.drop_database(args.db_name)
+            started = time.perf_counter()
+            await seed(seed_client[args.db_name], scale, await password_service.hash(PASSWORD))
+            print(f"seeded {scale} students in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+
+            async with app.router.lifespan_context(app), httpx.AsyncClient(
+                transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=60
+            ) as client:
+                clients = {"admin": client, "student": client}
+
+                results[str(scale)] = {}
+                for concurrency in args.concurrency:
+                    report = await run_level(clients, scale, concurrency, args.duration)
+                    results[str(scale)][str(concurrency)] = report
+                    print(
+                        f"scale={scale} concurrency={concurrency}: "
+                        f"{report['_all']['rps']} req/s over {report['_all']['requests']} requests",
+                        file=sys.stderr,
+                    )
+    finally:
+        if not args.keep_data:
+            await seed_client.drop_database(args.db_name)
+        seed_client.close()
+
+    return {
+        "meta": {
+            "created_at": datetime.utcnow().isoformat(),
+            "duration_s": args.duration,
+            "seed": args.seed,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "git_rev": _git_rev(),
+        },
+        "results": results,
+    }
+
+
+def _git_rev() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except Exception:
+        return None
+
+
+def compare(baseline: dict, current: dict, threshold: float) -> List[str]:
+    """List endpoints whose p95 grew or throughput fell by more than ``threshold``."""
+    regressions = []
+    for scale, levels in current["results"].items():
+        for concurrency, endpoints in levels.items():
+            old_endpoints = baseline.get("results", {}).get(scale, {}).get(concurrency, {})
+            for label, stats in endpoints.items():
+                old = old_endpoints.get(label)
+                if label == "_all" or not old or not old["requests"] or not stats["requests"]:
+                    continue
+                where = f"scale={scale} concurrency={concurrency} {label}"
+                if old["p95_ms"] and stats["p95_ms"] > old["p95_ms"] * (1 + threshold):
+                    regressions.append(f"{where}: p95 {old['p95_ms']}ms -> {stats['p95_ms']}ms")
+                if stats["rps"] < old["rps"] * (1 - threshold):
+                    regressions.append(f"{where}: rps {old['rps']} -> {stats['rps']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scale", type=int, nargs="+", default=[1000], help="students to seed, e.g. 1000 10000 100000")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[10, 50], help="concurrent clients per level")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per concurrency level")
+    parser.add_argument("--mongo-uri", default=None, help="existing MongoDB to use instead of spawning mongod")
+    parser.add_argument("--db-name", default=BENCH_DB)
+    parser.add_argument("--seed", type=int, default=1234, help="random seed for data and traffic")
+    parser.add_argument("--output", default=None, help="write JSON results here (default: stdout)")
+    parser.add_argument("--compare", default=None, help="baseline JSON to check for regressions")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed relative regression (0.2 = 20%%)")
+    parser.add_argument("--keep-data", action="store_true", help="do not drop the benchmark database")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    if args.mongo_uri:
+        report = asyncio.run(benchmark(args))
+    elif shutil.which("mongod"):
+        with spawned_mongod() as uri:
+            args.mongo_uri = uri
+            report = asyncio.run(benchmark(args))
+    else:
+        parser.error("mongod not found on PATH; pass --mongo-uri")
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(json.load(f), report, args.threshold)
+        for line in regressions:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -21,38 +21,43 @@ class _AdminStudentsPageState extends State<AdminStudentsPage> {
   }
 
   Future<void> fetchStudents() async {
-    final url = 'http://localhost:5000/admin/students';
-
     try {
-      final response = await http.get(Uri.parse(url));
+      // The list is paginated: keep requesting pages until there is no next cursor
+      List<dynamic> jsonResponse = [];
+      String? cursor;
+      do {
+        final query = {"limit": "500", if (cursor != null) "after": cursor};
+        final response = await http.get(
+          Uri.parse('http://localhost:5000/admin/students').replace(queryParameters: query),
+        );
+        if (response.statusCode != 200) {
+          throw Exception("Failed to load student data");
+        }
+        jsonResponse.addAll(json.decode(response.body));
+        cursor = response.headers["x-next-cursor"];
+      } while (cursor != null && cursor.isNotEmpty);
 
-      if (response.statusCode == 200) {
-        List<dynamic> jsonResponse = json.decode(response.body);
-
-        setState(() {
-          students = jsonResponse.map((student) {
-            String course = student["course"] ?? "No Course";
-
-            if (!courses.contains(course)) {
-              course = "No Course";
-            }
-
-            return {
-              "student_id": student["student_id"] ?? "N/A",
-              "name": student["name"] ?? "Unknown",
-              "email": student["email"] ?? "No Email",
-              "phone": student["phone"] ?? "No Phone",
-              "course": course,
-              "result_score": student["result_score"] ?? 0,
-              "edited_score": student["result_score"],
-              "promotion_year": null,
-            };
-          }).toList();
-          isLoading = false;
-        });
-      } else {
-        throw Exception("Failed to load student data");
-      }
+      setState(() {
+        students = jsonResponse.map((student) {
+          String course = student["course"] ?? "No Course";
+
+          if (!courses.contains(course)) {
+            course = "No Course";
+          }
+
+          return {
+            "student_id": student["student_id"] ?? "N/A",
+            "name": student["name"] ?? "Unknown",
+            "email": student["email"] ?? "No Email",
+            "phone": student["phone"] ?? "No Phone",
+            "course": course,
+            "result_score": student["result_score"] ?? 0,
+            "edited_score": student["result_score"],
+            "promotion_year": null,
+          };
+        }).toList();
+        isLoading = false;
+      });
     } catch (e) {
       setState(() {
         isLoading = false;
@@ -0,0 +1,159 @@
+import logging
+from typing import Any, Dict, List, Tuple
+
+from fastapi import HTTPException
+from pydantic import BaseModel, EmailStr, ValidationError
+from pymongo.errors import BulkWriteError
+
+from lib.common.fee_summaries import record_admissions
+from lib.common.outbox import admission_email
+from lib.common.passwords import password_service
+from lib.common.student_search import SEARCH_FIELD, search_fields
+
+DUPLICATE_KEY_ERROR = 11000
+
+
+# 🎓 Student Models
+class StudentAdmission(BaseModel):
+    name: str
+    email: EmailStr
+    total_fees: float
+    password: str  # New field for student password
+
+
+def new_student_entry(student: StudentAdmission, student_id: str, hashed_password: str) -> Dict[str, Any]:
+    entry = {
+        "student_id": student_id,
+        "name": student.name,
+        "email": student.email,
+        "total_fees": student.total_fees,
+        "paid_fees": 0,
+        "remaining_fees": student.total_fees,
+        "password": hashed_password
+    }
+    entry[SEARCH_FIELD] = search_fields(entry)
+    return entry
+
+
+def _validation_detail(error: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(part) for part in e['loc'])}: {e['msg']}" for e in error.errors()
+    )
+
+
+async def admit_batch(
+    students_collection, fee_summaries, outbox, id_allocator, batch: List[Tuple[int, Any]]
+) -> List[Dict[str, Any]]:
+    """Admit one batch of uploaded rows and return a result per row.
+
+    Duplicate emails are found with a single ``$in`` query, passwords are
+    hashed in parallel, IDs are taken from the allocator in one call and the
+    batch is written with one unordered ``insert_many`` so a bad row never
+    blocks the rest. Rows the busy password pool turned away are reported
+    as ``retry`` and can be uploaded again.
+    """
+    results: Dict[int, Dict[str, Any]] = {}
+    candidates: List[Tuple[int, StudentAdmission]] = []
+    seen_emails = set()
+
+    for row_number, row in batch:
+        if not isinstance(row, dict):
+            results[row_number] = {"row": row_number, "status": "invalid", "detail": "Row must be an object"}
+            continue
+        try:
+            student = StudentAdmission(**row)
+        except ValidationError as e:
+            results[row_number] = {
+                "row": row_number,
+                "email": row.get("email"),
+                "status": "invalid",
+                "detail": _validation_detail(e),
+            }
+            continue
+        if student.email in seen_emails:
+            results[row_number] = {
+                "row": row_number,
+                "email": student.email,
+                "status": "duplicate",
+                "detail": "Email appears more than once in this upload",
+            }
+            continue
+        seen_emails.add(student.email)
+        candidates.append((row_number, student))
+
+    if seen_emails:
+        existing = {
+            doc["email"]
+            async for doc in students_collection.find({"email": {"$in": list(seen_emails)}}, {"_id": 0, "email": 1})
+        }
+        fresh = []
+        for row_number, student in candidates:
+            if student.email in existing:
+                results[row_number] = {
+                    "row": row_number,
+                    "email": student.email,
+                    "status": "duplicate",
+                    "detail": "Student with this email already exists",
+                }
+            else:
+                fresh.append((row_number, student))
+        candidates = fresh
+
+    if candidates:
+        hashed_passwords = await password_service.hash_many(
+            [student.password for _, student in candidates], return_exceptions=True
+        )
+        hashed = []
+        for (row_number, student), password in zip(candidates, hashed_passwords):
+            if isinstance(password, BaseException):
+                # Usually a 503 from the busy password pool: only this row is skipped
+                detail = password.detail if isinstance(password, HTTPException) else "Could not hash password"
+                logging.warning(f"⚠️ Bulk admission row {row_number} not admitted: {detail}")
+                results[row_number] = {"row": row_number, "email": student.email, "status": "retry", "detail": detail}
+            else:
+                hashed.append((row_number, student, password))
+        candidates = [(row_number, student) for row_number, student, _ in hashed]
+
+    if candidates:
+        student_ids = await id_allocator.allocate(len(candidates))
+        entries = [
+            new_student_entry(student, student_id, password)
+            for (_, student, password), student_id in zip(hashed, student_ids)
+        ]
+
+        write_errors: Dict[int, Dict[str, Any]] = {}
+        try:
+            await students_collection.insert_many(entries, ordered=False)
+        except BulkWriteError as e:
+            write_errors = {error["index"]: error for error in e.details.get("writeErrors", [])}
+
+        admitted = [entry for index, entry in enumerate(entries) if index not in write_errors]
+        await record_admissions(fee_summaries, admitted)
+        await outbox.enqueue([admission_email(entry) for entry in admitted])
+
+        for index, ((row_number, student), entry) in enumerate(zip(candidates, entries)):
+            error = write_errors.get(index)
+            if error is None:
+                results[row_number] = {
+                    "row": row_number,
+                    "email": student.email,
+                    "status": "admitted",
+                    "student_id": entry["student_id"],
+                }
+            elif error.get("code") == DUPLICATE_KEY_ERROR:
+                results[row_number] = {
+                    "row": row_number,
+                    "email": student.email,
+                    "status": "duplicate",
+                    "detail": "Student with this email or ID already exists",
+                }
+            else:
+                logging.error(f"❌ Bulk admission failed for row {row_number}: {error.get('errmsg')}")
+                results[row_number] = {
+                    "row": row_number,
+                    "email": student.email,
+                    "status": "failed",
+                    "detail": error.get("errmsg", "Write failed"),
+                }
+
+    return [results[row_number] for row_number, _ in batch]
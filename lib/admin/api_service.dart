@@ -137,14 +137,21 @@ Future<void> updateStudentDetails(String studentId, String name, String phone) a
 }
 
 Future<void> fetchStudents() async {
-  final response = await http.get(Uri.parse("http://localhost:5000/admin/students"));
-
-  if (response.statusCode == 200) {
-    final List<dynamic> students = jsonDecode(response.body);
-    print(students);
-  } else {
-    throw Exception("Failed to load student data");
-  }
+  // The list is paginated: follow X-Next-Cursor until the last page
+  final List<dynamic> students = [];
+  String? cursor;
+  do {
+    final query = {"limit": "500", if (cursor != null) "after": cursor};
+    final response = await http.get(
+      Uri.parse("http://localhost:5000/admin/students").replace(queryParameters: query),
+    );
+    if (response.statusCode != 200) {
+      throw Exception("Failed to load student data");
+    }
+    students.addAll(jsonDecode(response.body));
+    cursor = response.headers["x-next-cursor"];
+  } while (cursor != null && cursor.isNotEmpty);
+  print(students);
 }
 
 // Function to promote student and save in database
@@ -1,50 +1,90 @@
-import smtplib
 from bson import ObjectId
-from fastapi.responses import JSONResponse
-from fastapi import Request, FastAPI, HTTPException
-from pydantic import BaseModel, EmailStr
-from motor.motor_asyncio import AsyncIOMotorClient
-from passlib.context import CryptContext
-from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi import Depends, Header, Request, HTTPException, Query
+from pydantic import BaseModel
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
 import logging
-import random
-import string
-from typing import Optional
-from fastapi import APIRouter
-from datetime import datetime
-
-# Initialize FastAPI
-app = FastAPI()
-
-admin_router = APIRouter()
-
-app.include_router(admin_router, prefix="/admin")
-
-# Enable CORS for frontend communication
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],  
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+import os
+from typing import Any, Dict, List, Optional
+from lib.admin.admissions import StudentAdmission, admit_batch, new_student_entry
+from lib.admin.semester import promote_batch, result_batch
+from lib.common.app import Service, create_app
+from lib.common.auth import ADMIN, require_admin, require_admin_signup, token_response
+from lib.common.cache import TTLCache
+from lib.common.database import mongo
+from lib.common.fee_summaries import (
+    ALL_MONTHS,
+    FEE_SUMMARIES_COLLECTION,
+    REBUILD_JOB,
+    STUDENT_FIELDS,
+    rebuild_handler,
+    record_admissions,
+    record_payment,
+    record_regroup,
 )
+from lib.common.ids import COUNTERS_COLLECTION, BlockIdAllocator
+from lib.common.ingest import UploadError, iter_batches
+from lib.common.jobs import JOBS_COLLECTION, JobQueue, serialize_job
+from lib.common.leaves import LEAVES_COLLECTION, decide_leaves, parse_leave_id, pending_page
+from lib.common.metrics import metrics
+from lib.common.notifications import NOTIFICATIONS_COLLECTION, create_notifications, new_notification
+from lib.common.outbox import admission_email, email_outbox, receipt_email, result_email
+from lib.common.pagination import (
+    MAX_PAGE_SIZE,
+    NDJSON_MEDIA_TYPE,
+    NEXT_CURSOR_HEADER,
+    fetch_page,
+    keyset_filter,
+    ndjson_stream,
+)
+from lib.common.passwords import password_service
+from lib.common.payments import (
+    APPLIED_FIELD,
+    IDEMPOTENCY_HEADER,
+    LEDGER_COLLECTION,
+    PaymentLedgerSweeper,
+    apply_payment,
+    get_payment,
+)
+from lib.common.student_search import FEE_STATUSES, SEARCH_FIELD, SEARCHABLE, course_update, search_students
+
+# Admin service: routes and hooks, served alone (app below) or via lib.server
+# Every route needs an admin access token except signup/login on `public`
+service = Service("admin", expose_headers=[NEXT_CURSOR_HEADER], dependencies=[Depends(require_admin)])
+router = service.router
+public = service.public
+lifespan = service.lifespan
 
 # Configure Logging
 logging.basicConfig(level=logging.INFO)
 
-# MongoDB Connection
-try:
-    client = AsyncIOMotorClient("mongodb://localhost:27017")
-    db = client.studentERP
-    admins_collection = db.admins  
-    students_collection = db.students  # Collection for admin-side student records
-    notifications_collection = db["notifications"]
-    logging.info("✅ MongoDB connected successfully!")
-except Exception as e:
-    logging.error(f"❌ MongoDB connection failed: {e}")
+# MongoDB collections (bound to the shared client once the app lifespan connects it)
+admins_collection = mongo.collection("admins")
+students_collection = mongo.collection("students")  # Collection for admin-side student records
+notifications_collection = mongo.collection(NOTIFICATIONS_COLLECTION)
+payments_ledger = mongo.collection(LEDGER_COLLECTION)  # Append-only record of every fee payment
+# Student IDs (STU + 7 digits) come from blocks reserved on an atomic counter
+student_id_allocator = BlockIdAllocator(mongo.collection(COUNTERS_COLLECTION), "student_id", prefix="STU", width=7)
+fee_summaries = mongo.collection(FEE_SUMMARIES_COLLECTION)  # Fee totals per course / academic year / month
+job_queue = JobQueue(mongo.collection(JOBS_COLLECTION))
+leave_requests = mongo.collection(LEAVES_COLLECTION)  # One document per leave request, with a status
+
+# Background jobs (fee summary rebuilds) start after the schema bootstrap
+job_queue.register(REBUILD_JOB, rebuild_handler(students_collection, payments_ledger, fee_summaries))
+lifespan.on_startup(job_queue.start)
+lifespan.on_shutdown(job_queue.shutdown)
+
+# Search results, cached briefly per worker and dropped on every student write
+search_cache = TTLCache(
+    maxsize=int(os.getenv("ERP_SEARCH_CACHE_SIZE", "1000")),
+    ttl=float(os.getenv("ERP_SEARCH_CACHE_TTL", "5")),
+)
+metrics.gauges("erp_search_cache", search_cache.stats)
 
-# Password Hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Password Hashing (bcrypt runs on a bounded worker pool, never on the event loop)
+lifespan.on_shutdown(password_service.shutdown)
+metrics.gauges("erp_password_pool", password_service.stats)
 
 # 🏫 Admin Models
 class AdminSignup(BaseModel):
@@ -57,23 +97,18 @@ class AdminLogin(BaseModel):
     password: str
 
 # 🎓 Student Models
-class StudentAdmission(BaseModel):
-    name: str
-    email: EmailStr
-    total_fees: float
-    password: str  # New field for student password
-
 class FeePayment(BaseModel):
     student_id: str
     amount_paid: float
+    idempotency_key: Optional[str] = None  # Reuse on retries so a payment is only counted once
 
-# ✅ Function: Generate Student ID
-def generate_student_id():
-    return f"STU{''.join(random.choices(string.ascii_uppercase + string.digits, k=6))}"
+class LeaveDecisions(BaseModel):
+    decisions: List[Dict[str, Any]]  # [{"id": ..., "status": "Approved" | "Rejected", "note": ...}]
+    decided_by: Optional[str] = None
 
 # ✅ ADMIN: Signup API
-@app.post("/admin_signup")
-async def admin_signup(admin: AdminSignup):
+@public.post("/admin_signup")
+async def admin_signup(admin: AdminSignup, claims: Optional[dict] = Depends(require_admin_signup)):
     if admin.password != admin.confirm_password:
         raise HTTPException(status_code=400, detail="Passwords do not match")
     
@@ -81,15 +116,16 @@ async def admin_signup(admin: AdminSignup):
     if existing_admin:
         raise HTTPException(status_code=400, detail="Admin already exists")
     
-    hashed_password = pwd_context.hash(admin.password)
+    hashed_password = await password_service.hash(admin.password)
     new_admin = {"employee_id": admin.employee_id, "password": hashed_password}
     await admins_collection.insert_one(new_admin)
     
-    logging.info(f"✅ Admin Signed Up: {admin.employee_id}")
+    created_by = f" by {claims['sub']}" if claims else ""
+    logging.info(f"✅ Admin Signed Up: {admin.employee_id}{created_by}")
     return {"status": "success", "message": "Admin signup successful"}
 
 # ✅ ADMIN: Login API
-@app.post("/admin_login")
+@public.post("/admin_login")
 async def admin_login(admin: AdminLogin):
     existing_admin = await admins_collection.find_one({"employee_id": admin.employee_id})
 
@@ -97,46 +133,66 @@ async def admin_login(admin: AdminLogin):
         raise HTTPException(status_code=400, detail="Admin not found")
 
     stored_password = existing_admin.get("password")  
-    if not stored_password or not pwd_context.verify(admin.password, stored_password):
+    if not stored_password or not await password_service.verify(admin.password, stored_password):
         raise HTTPException(status_code=400, detail="Invalid password")
 
     logging.info(f"✅ Admin Logged In: {admin.employee_id}")
-    return {"status": "success", "message": "Admin login successful"}
+    # bcrypt only runs here; later requests present the signed token instead
+    return {"status": "success", "message": "Admin login successful", **token_response(admin.employee_id, ADMIN)}
 
 # ✅ STUDENT: Admit a Student
-@app.post("/admin/admit-student")
+@router.post("/admin/admit-student")
 async def admit_student(student: StudentAdmission):
     existing_student = await students_collection.find_one({"email": student.email})
     if existing_student:
         raise HTTPException(status_code=400, detail="Student with this email already exists")
 
-    student_id = generate_student_id()
-    hashed_password = pwd_context.hash(student.password)
-
-    student_entry = {
-        "student_id": student_id,
-        "name": student.name,
-        "email": student.email,
-        "total_fees": student.total_fees,
-        "paid_fees": 0,
-        "remaining_fees": student.total_fees,
-        "password": hashed_password
-    }
+    student_id = await student_id_allocator.next_id()
+    hashed_password = await password_service.hash(student.password)
+
+    student_entry = new_student_entry(student, student_id, hashed_password)
+
+    try:
+        await students_collection.insert_one(student_entry)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Student with this email already exists")
+    await record_admissions(fee_summaries, [student_entry])
+    search_cache.clear()
+    await email_outbox.enqueue([admission_email(student_entry)])
 
-    await students_collection.insert_one(student_entry)
-    
     logging.info(f"✅ Student Admitted: {student.name} | ID: {student_id}")
     return {
         "message": "Student admitted successfully",
         "student_id": student_id
     }
 
+# ✅ STUDENT: Bulk Admission (CSV, NDJSON or JSON array; parsed as a stream)
+@router.post("/admin/admit-students/bulk")
+async def admit_students_bulk(request: Request):
+    results = []
+    try:
+        async for batch in iter_batches(request):
+            results.extend(await admit_batch(students_collection, fee_summaries, email_outbox, student_id_allocator, batch))
+    except UploadError as e:
+        # Rows before the error are already written; report them and where parsing stopped
+        results.append(e.result())
+    search_cache.clear()
+
+    admitted = sum(1 for result in results if result["status"] == "admitted")
+    logging.info(f"✅ Bulk Admission: {admitted}/{len(results)} students admitted")
+    return {
+        "total": len(results),
+        "admitted": admitted,
+        "failed": len(results) - admitted,
+        "results": results
+    }
+
 # ✅ STUDENT: Get Admitted Student Details (For Student Login Verification)
-@app.get("/get_admitted_student/{email}")
+@router.get("/get_admitted_student/{email}")
 async def get_admitted_student(email: str):
     student = await students_collection.find_one(
         {"email": email},
-        {"_id": 0, "password": 0}  # Exclude MongoDB ID & password
+        {"_id": 0, "password": 0, SEARCH_FIELD: 0, APPLIED_FIELD: 0}  # Exclude MongoDB ID, password & internal fields
     )
     if not student:
         raise HTTPException(status_code=404, detail="Student not found")
@@ -144,7 +200,7 @@ async def get_admitted_student(email: str):
     return student
 
 # ✅ STUDENT: Get Fees Details
-@app.get("/student/get-fees/{student_id}")
+@router.get("/student/get-fees/{student_id}")
 async def get_fees(student_id: str):
     student = await students_collection.find_one(
         {"student_id": student_id},
@@ -159,101 +215,308 @@ async def get_fees(student_id: str):
         "remaining_fees": student["remaining_fees"]
     }
 
-# ✅ STUDENT: Pay Fees
-@app.post("/student/pay-fees")
-async def pay_fees(payment: FeePayment):
-    print(f"🔍 Received Payment Request for Student ID: {payment.student_id}")
-
-    student = await students_collection.find_one({"student_id": payment.student_id})
-    if not student:
-        print("❌ Student not found in database")
-        raise HTTPException(status_code=404, detail="Student not found")
+# Read back after a payment: fee summary grouping plus the receipt's addressee
+PAYMENT_FIELDS = {**STUDENT_FIELDS, "email": 1, "name": 1}
 
-    new_paid_fees = student["paid_fees"] + payment.amount_paid
-    remaining_fees = max(student["total_fees"] - new_paid_fees, 0)
+async def payment_applied(result: dict):
+    student = result["document"]
+    await record_payment(fee_summaries, student, result["amount"])
+    search_cache.clear()
+    if student.get("email"):
+        await email_outbox.enqueue([receipt_email(student["email"], result, student.get("name"))])
 
-    await students_collection.update_one(
+# Payments whose request died before the ledger entry was written are recorded in the background
+payment_sweeper = PaymentLedgerSweeper(
+    students_collection, payments_ledger, "admin", ("student_id",), PAYMENT_FIELDS, payment_applied
+)
+lifespan.on_startup(payment_sweeper.start)
+lifespan.on_shutdown(payment_sweeper.shutdown)
+
+# ✅ STUDENT: Pay Fees (single atomic update, recorded in the payment ledger)
+@router.post("/student/pay-fees")
+async def pay_fees(
+    payment: FeePayment,
+    idempotency_key: Optional[str] = Header(None, alias=IDEMPOTENCY_HEADER),
+):
+    logging.info(f"🔍 Received Payment Request for Student ID: {payment.student_id}")
+
+    result = await apply_payment(
+        students_collection,
+        payments_ledger,
         {"student_id": payment.student_id},
-        {"$set": {"paid_fees": new_paid_fees, "remaining_fees": remaining_fees}}
+        payment.amount_paid,
+        {"student_id": payment.student_id, "source": "admin"},
+        idempotency_key or payment.idempotency_key,
+        projection=PAYMENT_FIELDS,
     )
+    if result is None:
+        logging.info("❌ Student not found in database")
+        raise HTTPException(status_code=404, detail="Student not found")
+    if not result["replayed"]:
+        await payment_applied(result)
+
+    logging.info(f"✅ Fees Paid: {payment.amount_paid} | New Remaining: {result['remaining_fees']}")
 
-    print(f"✅ Fees Paid: {payment.amount_paid} | New Remaining: {remaining_fees}")
-    
     return {
         "message": "Payment successful",
-        "paid_fees": new_paid_fees,
-        "remaining_fees": remaining_fees
+        "payment_id": result["payment_id"],
+        "paid_fees": result["paid_fees"],
+        "remaining_fees": result["remaining_fees"]
     }
-    
-@app.get("/admin/students")
-async def get_students():
+
+# ✅ STUDENT: Payment Receipt (read from the ledger, not the student document)
+@router.get("/student/payment-receipt/{payment_id}")
+async def payment_receipt(payment_id: str):
+    payment = await get_payment(payments_ledger, payment_id)
+    if not payment:
+        raise HTTPException(status_code=404, detail="Payment not found")
+    return payment
+
+# ✅ ADMIN: List Students (keyset-paginated on student_id, or streamed as NDJSON)
+@router.get("/admin/students")
+async def get_students(
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = None,
+    stream: bool = False,
+):
+    projection = {"_id": 0, "password": 0, SEARCH_FIELD: 0, APPLIED_FIELD: 0}
     try:
-        students = await students_collection.find({}, {"_id": 0, "password": 0}).to_list(length=None)
-        if not students:
+        if stream:
+            cursor = (
+                students_collection.find(keyset_filter({}, "student_id", after), projection)
+                .sort("student_id", 1)
+                .batch_size(MAX_PAGE_SIZE)
+            )
+            return StreamingResponse(ndjson_stream(cursor), media_type=NDJSON_MEDIA_TYPE)
+
+        students, next_cursor = await fetch_page(
+            students_collection, {}, projection, "student_id", limit, after
+        )
+        if not students and after is None:
             raise HTTPException(status_code=404, detail="No students found")
-        return students
+
+        headers = {NEXT_CURSOR_HEADER: next_cursor} if next_cursor else None
+        return JSONResponse(content=students, headers=headers)
+    except HTTPException:
+        raise
     except Exception as e:
         logging.error(f"❌ Error fetching students: {str(e)}")
         raise HTTPException(status_code=500, detail="Internal Server Error")
 
+# ✅ ADMIN: Student Search (indexed prefix/text match + filters, for typeahead)
+@router.get("/admin/students/search")
+async def search_students_route(
+    q: str = "",
+    field: Optional[str] = None,  # name | email | student_id | course; default matches any
+    text: bool = False,  # Whole-word relevance search on the text index
+    academic_year: Optional[str] = None,
+    course: Optional[str] = None,
+    fee_status: Optional[str] = None,  # paid | due | partial | unpaid
+    limit: int = Query(20, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = None,
+):
+    if field is not None and field not in SEARCHABLE:
+        raise HTTPException(status_code=400, detail=f"field must be one of {', '.join(SEARCHABLE)}")
+    if fee_status is not None and fee_status not in FEE_STATUSES:
+        raise HTTPException(status_code=400, detail=f"fee_status must be one of {', '.join(FEE_STATUSES)}")
+
+    students, next_cursor = await search_students(
+        students_collection,
+        search_cache,
+        limit,
+        after,
+        q=q,
+        field=field,
+        text=text,
+        academic_year=academic_year,
+        course=course,
+        fee_status=fee_status,
+    )
+    headers = {NEXT_CURSOR_HEADER: next_cursor} if next_cursor else None
+    return JSONResponse(content=students, headers=headers)
+
+# ✅ ADMIN: Password Pool Stats (queue depth, rejections, queue wait time)
+@router.get("/admin/password-pool")
+async def password_pool_stats():
+    return password_service.stats()
+
+# ✅ ADMIN: Email Outbox (messages per status plus this worker's sender counters)
+@router.get("/admin/email-outbox")
+async def email_outbox_stats():
+    return {"queue": await email_outbox.counts(), "sender": email_outbox.stats()}
+
+# ✅ ADMIN: Fee Summary (reads O(groups) documents instead of every student)
+@router.get("/admin/fee-summary")
+async def get_fee_summary(
+    course: Optional[str] = None,
+    academic_year: Optional[str] = None,
+    month: str = ALL_MONTHS,
+):
+    query = {"month": month}
+    if month == ALL_MONTHS:
+        query["students"] = {"$gt": 0}  # Skip groups every student has moved out of
+    if course:
+        query["course"] = course
+    if academic_year:
+        query["academic_year"] = academic_year
+
+    groups = await fee_summaries.find(query, {"_id": 0, "rebuild_id": 0}).sort(
+        [("course", 1), ("academic_year", 1)]
+    ).to_list(length=None)
+
+    fields = ("students", "total_fees", "collected", "outstanding", "defaulters", "payments")
+    totals = {field: sum(group.get(field, 0) for group in groups) for field in fields}
+    return {"month": month, "totals": totals, "groups": groups}
+
+# ✅ ADMIN: Rebuild Fee Summaries from Scratch (background job)
+@router.post("/admin/fee-summary/rebuild", status_code=202)
+async def rebuild_fee_summary():
+    job = await job_queue.submit(REBUILD_JOB, {})
+    return serialize_job(job)
+
+# ✅ ADMIN: Background Job Status
+@router.get("/admin/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = await job_queue.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return serialize_job(job)
+
+# ✅ ADMIN: Pending Leave Requests (oldest first, keyset-paginated on _id)
+@router.get("/admin/leave-requests")
+async def get_pending_leave_requests(
+    course: Optional[str] = None,
+    date_from: Optional[str] = None,  # YYYY-MM-DD, bounds the leave start date
+    date_to: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = None,
+):
+    after_id = None
+    if after is not None:
+        after_id = parse_leave_id(after)
+        if after_id is None:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    leaves, next_cursor = await pending_page(
+        leave_requests, limit, after_id, course=course, date_from=date_from, date_to=date_to
+    )
+    headers = {NEXT_CURSOR_HEADER: next_cursor} if next_cursor else None
+    return JSONResponse(content=leaves, headers=headers)
+
+# ✅ ADMIN: Approve/Reject Leave Requests in bulk (one bulk_write, one notification insert)
+@router.post("/admin/leave-requests/decide")
+async def decide_leave_requests(data: LeaveDecisions, claims: Optional[dict] = Depends(require_admin)):
+    if not data.decisions:
+        raise HTTPException(status_code=400, detail="No decisions given")
+    if len(data.decisions) > MAX_PAGE_SIZE:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_PAGE_SIZE} decisions per request")
+
+    # The token is authoritative; the body field only applies while auth is not enforced
+    decided_by = claims["sub"] if claims else data.decided_by
+    results = await decide_leaves(leave_requests, notifications_collection, data.decisions, decided_by)
+    return {
+        "decided": sum(1 for result in results if result["result"] == "decided"),
+        "results": results,
+    }
 
 # ✅ TEST ROUTE
-@app.get("/test")
+@public.get("/test")
 async def test_route():
     return {"status": "success", "message": "API is working!"}
 
-@app.put("/admin/update_course/{student_id}")
+@router.put("/admin/update_course/{student_id}")
 async def update_course(student_id: str, data: dict):
     new_course = data.get("course")
     if not new_course:
         raise HTTPException(status_code=400, detail="Course name is required")
 
-    result = await students_collection.update_one(
+    before = await students_collection.find_one_and_update(
         {"student_id": student_id},  # Use student_id instead of _id
-        {"$set": {"course": new_course}}
+        {"$set": course_update(new_course)},
+        projection=STUDENT_FIELDS,
+        return_document=ReturnDocument.BEFORE,
     )
 
-    if result.matched_count == 0:
+    if before is None:
         raise HTTPException(status_code=404, detail="Student not found")
 
+    await record_regroup(fee_summaries, [(before, {**before, "course": new_course})])
+    search_cache.clear()
     return {"message": "Course updated successfully"}  
 
-@app.post("/admin/promote_student/{student_id}")
+@router.post("/admin/promote_student/{student_id}")
 async def promote_student(student_id: str, data: dict):
     new_year = data.get("new_year")
 
-    result = await db.students.update_one(
-        {"student_id": student_id},  # This may be causing the error
-        {"$set": {"academic_year": new_year}}
+    before = await students_collection.find_one_and_update(
+        {"student_id": student_id},
+        {"$set": {"academic_year": new_year}},
+        projection=STUDENT_FIELDS,
+        return_document=ReturnDocument.BEFORE,
     )
 
-    if result.matched_count == 0:
+    if before is None:
         raise HTTPException(status_code=400, detail="Student not found")
 
+    await record_regroup(fee_summaries, [(before, {**before, "academic_year": new_year})])
+    search_cache.clear()
     return {"message": "Student promoted successfully"}
 
+# ✅ ADMIN: Bulk Promotion (JSON array, NDJSON or CSV of {student_id, new_year})
+@router.post("/admin/promote-students/bulk")
+async def promote_students_bulk(request: Request):
+    results = []
+    try:
+        async for batch in iter_batches(request):
+            results.extend(await promote_batch(students_collection, fee_summaries, batch))
+    except UploadError as e:
+        results.append(e.result())
+    search_cache.clear()
+
+    updated = sum(1 for result in results if result["status"] == "updated")
+    logging.info(f"✅ Bulk Promotion: {updated}/{len(results)} students promoted")
+    return {"total": len(results), "updated": updated, "failed": len(results) - updated, "results": results}
+
+# ✅ ADMIN: Bulk Result Upload (JSON array, NDJSON or CSV of {student_id, result_score})
+@router.post("/admin/update-results/bulk")
+async def update_results_bulk(request: Request):
+    results = []
+    try:
+        async for batch in iter_batches(request):
+            results.extend(await result_batch(students_collection, notifications_collection, email_outbox, batch))
+    except UploadError as e:
+        results.append(e.result())
+    search_cache.clear()
 
-@app.put("/admin/update_result/{student_id}")
+    updated = sum(1 for result in results if result["status"] == "updated")
+    logging.info(f"✅ Bulk Results: {updated}/{len(results)} results updated")
+    return {"total": len(results), "updated": updated, "failed": len(results) - updated, "results": results}
+
+@router.put("/admin/update_result/{student_id}")
 async def update_result(student_id: str, data: dict):
     new_score = data.get("result_score")
     if new_score is None:
         raise HTTPException(status_code=400, detail="Result score is required")
 
-    result = await students_collection.update_one(
+    student = await students_collection.find_one_and_update(
         {"student_id": student_id},
-        {"$set": {"result_score": new_score}}
+        {"$set": {"result_score": new_score}},
+        projection={"_id": 0, "email": 1, "name": 1},
     )
 
-    if result.matched_count == 0:
+    if student is None:
         raise HTTPException(status_code=404, detail="Student not found")
+    search_cache.clear()
 
-    # Add notification
-    notification = {
-        "student_id": student_id,
-        "message": f"Your result has been updated to {new_score}.",
-        "timestamp": datetime.utcnow(),
-        "read": False
-    }
-    await notifications_collection.insert_one(notification)
+    # Add notification (also pushed to the student's open portal) and queue the email
+    await create_notifications(
+        notifications_collection,
+        [new_notification(student_id, f"Your result has been updated to {new_score}.")]
+    )
+    if student.get("email"):
+        await email_outbox.enqueue([result_email(student["email"], new_score, student.get("name"))])
 
     return {"message": "Result score updated successfully"}
+
+# Standalone admin API: uvicorn lib.admin.main:app --port 5000
+app = create_app(service, title="Student ERP Admin")
@@ -0,0 +1,140 @@
+import logging
+from typing import Any, Callable, Dict, List, Tuple
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from lib.common.fee_summaries import STUDENT_FIELDS, record_regroup
+from lib.common.notifications import create_notifications, new_notification
+from lib.common.outbox import result_email
+
+# Pre-update snapshot: enough to move fee summaries between groups and email the student
+BEFORE_FIELDS = {**STUDENT_FIELDS, "_id": 0, "student_id": 1, "email": 1, "name": 1}
+
+
+def _year(value: Any) -> Any:
+    if not isinstance(value, str) or not value.strip():
+        raise ValueError("new_year is required")
+    return value.strip()
+
+
+def _score(value: Any) -> Any:
+    if value is None or (isinstance(value, str) and not value.strip()):
+        raise ValueError("result_score is required")
+    if isinstance(value, str):
+        # CSV cells arrive as text; keep grades like "A+" as they are
+        try:
+            number = float(value)
+        except ValueError:
+            return value.strip()
+        return int(number) if number.is_integer() else number
+    return value
+
+
+async def _update_batch(
+    students_collection,
+    batch: List[Tuple[int, Any]],
+    field: str,
+    target: str,
+    parse: Callable[[Any], Any],
+) -> Tuple[Dict[int, Dict[str, Any]], List[Tuple[int, Dict[str, Any], Any]]]:
+    """Set ``target`` from each row's ``field`` with one unordered bulk_write.
+
+    Returns per-row results plus ``(row_number, before, value)`` for the rows
+    that were written, so callers can follow up (summaries, notifications).
+    """
+    results: Dict[int, Dict[str, Any]] = {}
+    candidates: Dict[str, Tuple[int, Any]] = {}
+
+    for row_number, row in batch:
+        if not isinstance(row, dict):
+            results[row_number] = {"row": row_number, "status": "invalid", "detail": "Row must be an object"}
+            continue
+        student_id = str(row.get("student_id") or "").strip()
+        try:
+            if not student_id:
+                raise ValueError("student_id is required")
+            value = parse(row.get(field))
+        except ValueError as e:
+            results[row_number] = {"row": row_number, "student_id": student_id or None, "status": "invalid", "detail": str(e)}
+            continue
+        if student_id in candidates:
+            results[row_number] = {
+                "row": row_number,
+                "student_id": student_id,
+                "status": "duplicate",
+                "detail": "Student appears more than once in this batch",
+            }
+            continue
+        candidates[student_id] = (row_number, value)
+
+    existing: Dict[str, Dict[str, Any]] = {}
+    if candidates:
+        async for doc in students_collection.find({"student_id": {"$in": list(candidates)}}, BEFORE_FIELDS):
+            existing[doc["student_id"]] = doc
+
+    writes: List[Tuple[int, Dict[str, Any], Any]] = []
+    for student_id, (row_number, value) in candidates.items():
+        if student_id not in existing:
+            results[row_number] = {"row": row_number, "student_id": student_id, "status": "not_found", "detail": "Student not found"}
+        else:
+            writes.append((row_number, existing[student_id], value))
+
+    write_errors: Dict[int, Dict[str, Any]] = {}
+    if writes:
+        operations = [
+            UpdateOne({"student_id": before["student_id"]}, {"$set": {target: value}})
+            for _, before, value in writes
+        ]
+        try:
+            await students_collection.bulk_write(operations, ordered=False)
+        except BulkWriteError as e:
+            write_errors = {error["index"]: error for error in e.details.get("writeErrors", [])}
+
+    applied = []
+    for index, (row_number, before, value) in enumerate(writes):
+        error = write_errors.get(index)
+        if error is None:
+            results[row_number] = {"row": row_number, "student_id": before["student_id"], "status": "updated"}
+            applied.append((row_number, before, value))
+        else:
+            logging.error(f"❌ Bulk update of {target} failed for row {row_number}: {error.get('errmsg')}")
+            results[row_number] = {
+                "row": row_number,
+                "student_id": before["student_id"],
+                "status": "failed",
+                "detail": "Could not update student",
+            }
+    return results, applied
+
+
+def _ordered(results: Dict[int, Dict[str, Any]], batch: List[Tuple[int, Any]]) -> List[Dict[str, Any]]:
+    return [results[row_number] for row_number, _ in batch]
+
+
+async def promote_batch(students_collection, fee_summaries, batch: List[Tuple[int, Any]]) -> List[Dict[str, Any]]:
+    """Promote one batch of ``{student_id, new_year}`` rows and move their fee summaries."""
+    results, applied = await _update_batch(students_collection, batch, "new_year", "academic_year", _year)
+    await record_regroup(fee_summaries, [(before, {**before, "academic_year": year}) for _, before, year in applied])
+    return _ordered(results, batch)
+
+
+async def result_batch(
+    students_collection, notifications_collection, outbox, batch: List[Tuple[int, Any]]
+) -> List[Dict[str, Any]]:
+    """Store one batch of ``{student_id, result_score}`` rows and notify every updated student at once."""
+    results, applied = await _update_batch(students_collection, batch, "result_score", "result_score", _score)
+    if applied:
+        await create_notifications(
+            notifications_collection,
+            [
+                new_notification(before["student_id"], f"Your result has been updated to {score}.")
+                for _, before, score in applied
+            ],
+        )
+        await outbox.enqueue([
+            result_email(before["email"], score, before.get("name"))
+            for _, before, score in applied
+            if before.get("email")
+        ])
+    return _ordered(results, batch)
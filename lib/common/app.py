@@ -0,0 +1,105 @@
+import logging
+from typing import Iterable, Sequence
+
+from fastapi import APIRouter, Depends, FastAPI, HTTPException
+from fastapi.middleware.cors import CORSMiddleware
+
+from lib.common.auth import auth_router, require_student_id, token_service
+from lib.common.database import mongo
+from lib.common.lifespan import ServiceLifespan
+from lib.common.metrics import MetricsMiddleware, metrics, metrics_router
+from lib.common.notifications import NOTIFICATIONS_COLLECTION, notification_hub, notifications_router
+from lib.common.outbox import email_outbox
+from lib.common.schema import bootstrap_schema
+
+
+class Service:
+    """A service's routes plus the startup/shutdown hooks they depend on.
+
+    ``dependencies`` (typically an auth check) apply to every route on
+    ``router``; routes on ``public`` such as login are served without them.
+    """
+
+    def __init__(self, name: str, expose_headers: Iterable[str] = (), dependencies: Sequence = ()):
+        self.name = name
+        self.public = APIRouter()
+        self.router = APIRouter(dependencies=list(dependencies))
+        self.lifespan = ServiceLifespan()
+        self.expose_headers = list(expose_headers)
+
+
+def health_router() -> APIRouter:
+    router = APIRouter()
+
+    # ✅ Readiness: only report healthy when MongoDB answers
+    @router.get("/health")
+    async def health():
+        try:
+            await mongo.ping()
+        except Exception as e:
+            logging.error(f"❌ Health check failed: {e}")
+            raise HTTPException(status_code=503, detail="Database unavailable")
+        return {"status": "ok"}
+
+    return router
+
+
+def create_app(*services: Service, title: str = "Student ERP") -> FastAPI:
+    """Build one ASGI app serving ``services`` over a shared Mongo client.
+
+    Shared routes (/health, /metrics, notifications) are mounted once, so a
+    single process can serve the admin and student APIs together.
+    """
+    lifespan = ServiceLifespan()
+
+    # Registered first so the client is closed last
+    lifespan.on_startup(mongo.connect)
+    lifespan.on_shutdown(mongo.close)
+
+    # Create/verify indexes and apply pending migrations before serving traffic
+    @lifespan.on_startup
+    async def bootstrap_database():
+        await bootstrap_schema(mongo.database)
+
+    # Queued email is sent in the background, never inside a request
+    lifespan.on_startup(email_outbox.start)
+    lifespan.on_shutdown(email_outbox.shutdown)
+    metrics.gauges("erp_email_outbox", email_outbox.stats)
+
+    lifespan.on_shutdown(notification_hub.shutdown)
+    for service in services:
+        lifespan.include(service.lifespan)
+
+    app = FastAPI(title=title, lifespan=lifespan)
+
+    expose_headers = []
+    for service in services:
+        expose_headers += [header for header in service.expose_headers if header not in expose_headers]
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+        expose_headers=expose_headers,
+    )
+
+    # Per-route latency and status counts, exported with Mongo timings at /metrics
+    app.add_middleware(MetricsMiddleware)
+    app.include_router(metrics_router())
+    app.include_router(health_router())
+
+    # Access tokens are checked in memory; /auth/logout revokes the caller's token
+    app.include_router(auth_router())
+    metrics.gauges("erp_auth", token_service.stats)
+
+    # Notifications: paginated fetch, mark-as-read and SSE push
+    app.include_router(
+        notifications_router(mongo.collection(NOTIFICATIONS_COLLECTION)),
+        dependencies=[Depends(require_student_id)],
+    )
+
+    for service in services:
+        app.include_router(service.public)
+        app.include_router(service.router)
+    return app
@@ -0,0 +1,160 @@
+import logging
+import re
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from pymongo import UpdateOne
+
+ATTENDANCE_COLLECTION = "attendance"  # One bucket per student per month
+ROLLUPS_COLLECTION = "attendance_rollups"  # Precomputed per-student percentages
+
+PRESENT = "Present"
+ABSENT = "Absent"
+PARTIAL = "Partial"
+# Subject used for day-level marks migrated from the old embedded daily_attendance
+DAILY_SUBJECT = "daily"
+
+_SUBJECT_PATTERN = re.compile(r"^[^.$]+$")
+
+
+def parse_date(value: str) -> str:
+    return datetime.strptime(value, "%Y-%m-%d").strftime("%Y-%m-%d")
+
+
+def valid_subject(subject: Optional[str]) -> bool:
+    # Subjects become field names inside the bucket, so "." and "$" are not allowed
+    return bool(subject) and bool(_SUBJECT_PATTERN.match(subject))
+
+
+def normalize_status(status: Any) -> Optional[str]:
+    if isinstance(status, bool):
+        return PRESENT if status else ABSENT
+    if isinstance(status, str) and status.strip().lower() in ("present", "p"):
+        return PRESENT
+    if isinstance(status, str) and status.strip().lower() in ("absent", "a"):
+        return ABSENT
+    return None
+
+
+def mark_operation(email: str, date: str, subject: str, status: str) -> UpdateOne:
+    # Re-marking the same date and subject overwrites the earlier mark
+    return UpdateOne(
+        {"email": email, "month": date[:7]},
+        {"$set": {f"days.{date}.{subject}": status}},
+        upsert=True,
+    )
+
+
+def subject_totals_pipeline(match: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Per student and subject: number of marked sessions and sessions present."""
+    return [
+        {"$match": match},
+        {"$project": {"email": 1, "days": {"$objectToArray": {"$ifNull": ["$days", {}]}}}},
+        {"$unwind": "$days"},
+        {"$project": {"email": 1, "marks": {"$objectToArray": "$days.v"}}},
+        {"$unwind": "$marks"},
+        {
+            "$group": {
+                "_id": {"email": "$email", "subject": "$marks.k"},
+                "total": {"$sum": 1},
+                "present": {"$sum": {"$cond": [{"$eq": ["$marks.v", PRESENT]}, 1, 0]}},
+            }
+        },
+    ]
+
+
+def rollup_pipeline(match: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Fold the subject totals into one rollup document per student and $merge it."""
+    return subject_totals_pipeline(match) + [
+        {
+            "$group": {
+                "_id": "$_id.email",
+                "subjects": {"$push": {"k": "$_id.subject", "v": {"total": "$total", "present": "$present"}}},
+                "total": {"$sum": "$total"},
+                "present": {"$sum": "$present"},
+            }
+        },
+        {
+            "$project": {
+                "_id": 0,
+                "email": "$_id",
+                "subjects": {"$arrayToObject": "$subjects"},
+                "total": 1,
+                "present": 1,
+                "updated_at": "$$NOW",
+            }
+        },
+        {"$merge": {"into": ROLLUPS_COLLECTION, "on": "email", "whenMatched": "merge", "whenNotMatched": "insert"}},
+    ]
+
+
+async def refresh_rollups(attendance_collection, emails: List[str]):
+    if emails:
+        await attendance_collection.aggregate(rollup_pipeline({"email": {"$in": emails}})).to_list(length=None)
+
+
+def _percentage(present: int, total: int) -> float:
+    return round(present / total * 100, 2) if total else 0.0
+
+
+def summarize(rollup: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    rollup = rollup or {}
+    subject_attendance = dict(rollup.get("legacy_subject_attendance", {}))
+    for subject, counts in rollup.get("subjects", {}).items():
+        if subject != DAILY_SUBJECT:
+            subject_attendance[subject] = _percentage(counts["present"], counts["total"])
+    return {
+        "subject_attendance": subject_attendance,
+        "overall_percentage": _percentage(rollup.get("present", 0), rollup.get("total", 0)),
+    }
+
+
+def daily_statuses(bucket: Optional[Dict[str, Any]]) -> Dict[str, str]:
+    statuses = {}
+    for date, marks in sorted((bucket or {}).get("days", {}).items()):
+        values = list(marks.values())
+        present = values.count(PRESENT)
+        if present == len(values):
+            statuses[date] = PRESENT
+        elif present == 0:
+            statuses[date] = ABSENT
+        else:
+            statuses[date] = PARTIAL
+    return statuses
+
+
+async def migrate_embedded_attendance(db):
+    """Move daily_attendance/subject_attendance out of student documents into buckets."""
+    students = db.students
+    query = {"$or": [{"daily_attendance": {"$exists": True}}, {"subject_attendance": {"$exists": True}}]}
+    projection = {"email": 1, "daily_attendance": 1, "subject_attendance": 1}
+
+    moved = 0
+    async for student in students.find(query, projection).batch_size(200):
+        email = student.get("email")
+        if not email:
+            continue
+
+        operations = []
+        for date, status in (student.get("daily_attendance") or {}).items():
+            try:
+                operations.append(mark_operation(email, parse_date(date), DAILY_SUBJECT, normalize_status(status) or ABSENT))
+            except ValueError:
+                logging.warning(f"⚠️ Skipping attendance entry with invalid date {date!r} for {email}")
+        if operations:
+            await db[ATTENDANCE_COLLECTION].bulk_write(operations, ordered=False)
+
+        legacy = {
+            subject: float(value)
+            for subject, value in (student.get("subject_attendance") or {}).items()
+            if isinstance(value, (int, float))
+        }
+        await db[ROLLUPS_COLLECTION].update_one(
+            {"email": email}, {"$set": {"legacy_subject_attendance": legacy}}, upsert=True
+        )
+        await refresh_rollups(db[ATTENDANCE_COLLECTION], [email])
+        await students.update_one({"_id": student["_id"]}, {"$unset": {"daily_attendance": "", "subject_attendance": ""}})
+        moved += 1
+
+    if moved:
+        logging.info(f"✅ Moved embedded attendance for {moved} students into buckets")
@@ -0,0 +1,171 @@
+import base64
+import binascii
+import hashlib
+import hmac
+import json
+import logging
+import os
+import secrets
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from fastapi import APIRouter, Depends, Header, HTTPException
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+
+ADMIN = "admin"
+STUDENT = "student"
+
+# Off until every client sends tokens; without it, a missing or bad token is only logged
+ENFORCE_ENV = "ERP_AUTH_ENFORCE"
+# Lets the first admin sign up while enforced, before any admin token exists
+BOOTSTRAP_ENV = "ERP_ADMIN_BOOTSTRAP_SECRET"
+BOOTSTRAP_HEADER = "X-Admin-Bootstrap"
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+class TokenService:
+    """Issues and checks HMAC-signed access tokens without touching the database.
+
+    A token is ``<base64url claims>.<base64url HMAC-SHA256>``. Set
+    ERP_TOKEN_SECRET to the same value on every worker, or tokens only verify
+    on the process that issued them. Revoked token ids are kept in memory
+    until they would have expired anyway, so the denylist stays small but is
+    also per process.
+    """
+
+    def __init__(self, secret: Optional[str] = None, ttl: Optional[int] = None, enforce: Optional[bool] = None):
+        secret = secret or os.getenv("ERP_TOKEN_SECRET")
+        if not secret:
+            logging.warning("⚠️ ERP_TOKEN_SECRET is not set; tokens will not survive a restart or work across workers")
+            secret = secrets.token_urlsafe(32)
+        self._key = secret.encode("utf-8")
+        self.ttl = ttl or int(os.getenv("ERP_TOKEN_TTL", str(12 * 3600)))
+        self.enforce = enforce if enforce is not None else os.getenv(ENFORCE_ENV, "0") == "1"
+        self._denylist: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def _sign(self, payload: str) -> str:
+        return _b64encode(hmac.new(self._key, payload.encode("ascii"), hashlib.sha256).digest())
+
+    def issue(self, subject: str, role: str, **extra: Any) -> Tuple[str, int]:
+        """Return ``(token, expires_at)`` for ``subject`` acting as ``role``."""
+        now = int(time.time())
+        claims = {"sub": subject, "role": role, "iat": now, "exp": now + self.ttl, "jti": secrets.token_urlsafe(12), **extra}
+        payload = _b64encode(json.dumps(claims, separators=(",", ":")).encode("utf-8"))
+        return f"{payload}.{self._sign(payload)}", claims["exp"]
+
+    def verify(self, token: str) -> Dict[str, Any]:
+        try:
+            payload, signature = token.split(".")
+        except ValueError:
+            raise HTTPException(status_code=401, detail="Malformed token")
+        # Issued tokens are pure ASCII; anything else would make _sign and compare_digest raise instead of failing
+        if not (payload.isascii() and signature.isascii()) or not hmac.compare_digest(signature, self._sign(payload)):
+            raise HTTPException(status_code=401, detail="Invalid token")
+
+        try:
+            claims = json.loads(_b64decode(payload))
+        except (binascii.Error, ValueError):  # ValueError covers bad UTF-8 and bad JSON
+            raise HTTPException(status_code=401, detail="Malformed token")
+        if not isinstance(claims, dict):
+            raise HTTPException(status_code=401, detail="Malformed token")
+        if claims.get("exp", 0) < time.time():
+            raise HTTPException(status_code=401, detail="Token expired")
+        if claims.get("jti") in self._denylist:
+            raise HTTPException(status_code=401, detail="Token revoked")
+        return claims
+
+    def revoke(self, claims: Dict[str, Any]):
+        now = time.time()
+        with self._lock:
+            # Entries are only needed until the token would have expired anyway
+            for jti in [jti for jti, expires in self._denylist.items() if expires < now]:
+                del self._denylist[jti]
+            self._denylist[claims["jti"]] = claims["exp"]
+
+    def stats(self) -> dict:
+        return {"enforced": int(self.enforce), "ttl_seconds": self.ttl, "denylist_size": len(self._denylist)}
+
+
+token_service = TokenService()
+_bearer = HTTPBearer(auto_error=False)
+
+
+def token_response(subject: str, role: str, **extra: Any) -> Dict[str, Any]:
+    token, expires_at = token_service.issue(subject, role, **extra)
+    return {"access_token": token, "token_type": "bearer", "expires_at": expires_at}
+
+
+def _claims(credentials: Optional[HTTPAuthorizationCredentials], roles: Tuple[str, ...]) -> Optional[Dict[str, Any]]:
+    try:
+        if credentials is None:
+            raise HTTPException(status_code=401, detail="Not authenticated", headers={"WWW-Authenticate": "Bearer"})
+        claims = token_service.verify(credentials.credentials)
+        if claims.get("role") not in roles:
+            raise HTTPException(status_code=403, detail="Not allowed for this account")
+        return claims
+    except HTTPException as e:
+        if token_service.enforce:
+            raise
+        logging.debug(f"Auth not enforced, letting request through: {e.detail}")
+        return None
+
+
+def require_admin(credentials: Optional[HTTPAuthorizationCredentials] = Depends(_bearer)) -> Optional[Dict[str, Any]]:
+    return _claims(credentials, (ADMIN,))
+
+
+def require_student(credentials: Optional[HTTPAuthorizationCredentials] = Depends(_bearer)) -> Optional[Dict[str, Any]]:
+    """Students, or admins acting on a student's behalf."""
+    return _claims(credentials, (STUDENT, ADMIN))
+
+
+def require_admin_signup(
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(_bearer),
+    bootstrap: Optional[str] = Header(None, alias=BOOTSTRAP_HEADER),
+) -> Optional[Dict[str, Any]]:
+    """New admins are created by an existing admin, or with the bootstrap secret."""
+    secret = os.getenv(BOOTSTRAP_ENV)
+    if token_service.enforce and secret and bootstrap is not None:
+        if hmac.compare_digest(bootstrap.encode("utf-8"), secret.encode("utf-8")):
+            return None
+        raise HTTPException(status_code=403, detail="Invalid bootstrap secret")
+    return _claims(credentials, (ADMIN,))
+
+
+def ensure_self(claims: Optional[Dict[str, Any]], email: Optional[str] = None, student_id: Optional[str] = None):
+    """Stop a student token from reading or changing another student's data."""
+    if not claims or claims.get("role") != STUDENT:
+        return
+    if (email is not None and claims.get("sub") != email) or (
+        student_id is not None and claims.get("student_id") != student_id
+    ):
+        raise HTTPException(status_code=403, detail="Not allowed for this account")
+
+
+def require_student_id(student_id: str, claims: Optional[Dict[str, Any]] = Depends(require_student)) -> Optional[Dict[str, Any]]:
+    """For routes keyed by a ``{student_id}`` path parameter."""
+    ensure_self(claims, student_id=student_id)
+    return claims
+
+
+def auth_router() -> APIRouter:
+    router = APIRouter()
+
+    # ✅ Logout: the token stops working on this worker immediately
+    @router.post("/auth/logout")
+    async def logout(credentials: Optional[HTTPAuthorizationCredentials] = Depends(_bearer)):
+        if credentials is None:
+            raise HTTPException(status_code=401, detail="Not authenticated", headers={"WWW-Authenticate": "Bearer"})
+        token_service.revoke(token_service.verify(credentials.credentials))
+        return {"message": "Logged out"}
+
+    return router
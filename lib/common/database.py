@@ -0,0 +1,101 @@
+import asyncio
+import logging
+import os
+from typing import Any, Callable
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReadPreference
+
+from lib.common.metrics import mongo_command_timer
+
+READ_PREFERENCES = {
+    "primary": ReadPreference.PRIMARY,
+    "primaryPreferred": ReadPreference.PRIMARY_PREFERRED,
+    "secondary": ReadPreference.SECONDARY,
+    "secondaryPreferred": ReadPreference.SECONDARY_PREFERRED,
+    "nearest": ReadPreference.NEAREST,
+}
+
+
+def client_options() -> dict:
+    """Motor client settings from the environment (pool sizes are per worker process)."""
+    read_preference = os.getenv("ERP_MONGO_READ_PREFERENCE", "primary")
+    if read_preference not in READ_PREFERENCES:
+        raise ValueError(f"Unknown ERP_MONGO_READ_PREFERENCE {read_preference!r}")
+    return {
+        "maxPoolSize": int(os.getenv("ERP_MONGO_MAX_POOL", "100")),
+        "minPoolSize": int(os.getenv("ERP_MONGO_MIN_POOL", "10")),
+        "maxIdleTimeMS": int(os.getenv("ERP_MONGO_MAX_IDLE_MS", "300000")),
+        "serverSelectionTimeoutMS": int(os.getenv("ERP_MONGO_SERVER_SELECTION_MS", "5000")),
+        "connectTimeoutMS": int(os.getenv("ERP_MONGO_CONNECT_TIMEOUT_MS", "5000")),
+        "socketTimeoutMS": int(os.getenv("ERP_MONGO_SOCKET_TIMEOUT_MS", "30000")),
+        "waitQueueTimeoutMS": int(os.getenv("ERP_MONGO_WAIT_QUEUE_MS", "10000")),
+        "read_preference": READ_PREFERENCES[read_preference],
+        "event_listeners": [mongo_command_timer],
+    }
+
+
+class LazyHandle:
+    """Stands in for a collection (or anything built from the database) until the client exists.
+
+    Route modules create these at import time; the real object is built on
+    first use after ``Mongo.connect`` and rebuilt if the client is replaced.
+    """
+
+    def __init__(self, mongo: "Mongo", factory: Callable[[Any], Any]):
+        self._mongo = mongo
+        self._factory = factory
+        self._target = None
+        self._generation = None
+
+    def _resolve(self):
+        if self._generation != self._mongo.generation:
+            self._target = self._factory(self._mongo.database)
+            self._generation = self._mongo.generation
+        return self._target
+
+    def __getattr__(self, name):
+        return getattr(self._resolve(), name)
+
+
+class Mongo:
+    """Owns the process's Motor client; connected and closed by the app lifespan."""
+
+    def __init__(self):
+        self.client = None
+        self._database = None
+        self.generation = 0
+
+    @property
+    def database(self):
+        if self._database is None:
+            raise RuntimeError("MongoDB client is not connected; is the app lifespan running?")
+        return self._database
+
+    async def connect(self):
+        options = client_options()
+        self.client = AsyncIOMotorClient(os.getenv("MONGODB_URI", "mongodb://localhost:27017"), **options)
+        self._database = self.client[os.getenv("ERP_DB_NAME", "studentERP")]
+        self.generation += 1
+        logging.info(
+            f"✅ MongoDB client ready (pool {options['minPoolSize']}-{options['maxPoolSize']}, "
+            f"read preference {options['read_preference'].name})"
+        )
+
+    async def close(self):
+        if self.client is not None:
+            self.client.close()
+            self.client = None
+            self._database = None
+
+    async def ping(self, timeout: float = 2.0):
+        await asyncio.wait_for(self.database.command("ping"), timeout)
+
+    def collection(self, name: str) -> LazyHandle:
+        return LazyHandle(self, lambda database: database[name])
+
+    def lazy(self, factory: Callable[[Any], Any]) -> LazyHandle:
+        return LazyHandle(self, factory)
+
+
+mongo = Mongo()
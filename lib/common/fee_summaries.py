@@ -0,0 +1,172 @@
+import logging
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from pymongo import UpdateOne
+
+FEE_SUMMARIES_COLLECTION = "fee_summaries"
+REBUILD_JOB = "fee_summary_rebuild"
+
+NO_COURSE = "No Course"
+NO_YEAR = "Unassigned"
+# Running totals per group live under this month key; real months only track collections
+ALL_MONTHS = "all"
+
+STUDENT_FIELDS = {"course": 1, "academic_year": 1, "total_fees": 1, "paid_fees": 1, "remaining_fees": 1}
+
+
+def group_of(student: Dict[str, Any]) -> Tuple[str, str]:
+    return student.get("course") or NO_COURSE, student.get("academic_year") or NO_YEAR
+
+
+def contribution(student: Dict[str, Any], sign: int = 1) -> Dict[str, float]:
+    remaining = student.get("remaining_fees", 0) or 0
+    return {
+        "students": sign,
+        "total_fees": sign * (student.get("total_fees", 0) or 0),
+        "collected": sign * (student.get("paid_fees", 0) or 0),
+        "outstanding": sign * remaining,
+        "defaulters": sign * (1 if remaining > 0 else 0),
+    }
+
+
+def _update(course: str, academic_year: str, month: str, inc: Dict[str, float]) -> UpdateOne:
+    return UpdateOne(
+        {"course": course, "academic_year": academic_year, "month": month},
+        {"$inc": inc, "$set": {"updated_at": datetime.utcnow()}},
+        upsert=True,
+    )
+
+
+async def _apply(summaries, operations: List[UpdateOne]):
+    # Summaries are derived data: a failed update must not fail the payment or
+    # admission that triggered it, and the rebuild job repairs any drift.
+    if not operations:
+        return
+    try:
+        await summaries.bulk_write(operations, ordered=False)
+    except Exception as e:
+        logging.error(f"❌ Fee summary update failed (run a rebuild to repair): {e}")
+
+
+def _merge(operations: Dict[Tuple[str, str], Dict[str, float]]) -> List[UpdateOne]:
+    return [_update(course, year, ALL_MONTHS, inc) for (course, year), inc in operations.items()]
+
+
+async def record_admissions(summaries, students: Iterable[Dict[str, Any]]):
+    """Add newly admitted students to their groups, one upsert per group."""
+    totals: Dict[Tuple[str, str], Dict[str, float]] = defaultdict(lambda: defaultdict(float))
+    for student in students:
+        for field, value in contribution(student).items():
+            totals[group_of(student)][field] += value
+    await _apply(summaries, _merge(totals))
+
+
+async def record_payment(summaries, student_after: Dict[str, Any], amount: float, paid_at: Optional[datetime] = None):
+    """Apply one payment, given the student document as it is after the payment."""
+    course, year = group_of(student_after)
+    total = student_after.get("total_fees", 0) or 0
+    remaining_after = student_after.get("remaining_fees", 0) or 0
+    remaining_before = max(total - ((student_after.get("paid_fees", 0) or 0) - amount), 0)
+    month = (paid_at or datetime.utcnow()).strftime("%Y-%m")
+
+    await _apply(summaries, [
+        _update(course, year, ALL_MONTHS, {
+            "collected": amount,
+            "outstanding": remaining_after - remaining_before,
+            "defaulters": (1 if remaining_after > 0 else 0) - (1 if remaining_before > 0 else 0),
+        }),
+        _update(course, year, month, {"collected": amount, "payments": 1}),
+    ])
+
+
+def regroup_operations(changes: Iterable[Tuple[Dict[str, Any], Dict[str, Any]]]) -> List[UpdateOne]:
+    """Move students between groups after a course/year change: [(before, after), ...]."""
+    totals: Dict[Tuple[str, str], Dict[str, float]] = defaultdict(lambda: defaultdict(float))
+    for before, after in changes:
+        if group_of(before) == group_of(after):
+            continue
+        for field, value in contribution(before, -1).items():
+            totals[group_of(before)][field] += value
+        for field, value in contribution(after).items():
+            totals[group_of(after)][field] += value
+    return _merge(totals)
+
+
+async def record_regroup(summaries, changes: Iterable[Tuple[Dict[str, Any], Dict[str, Any]]]):
+    await _apply(summaries, regroup_operations(changes))
+
+
+def _group_keys() -> Dict[str, Any]:
+    return {
+        "course": {"$ifNull": ["$course", NO_COURSE]},
+        "academic_year": {"$ifNull": ["$academic_year", NO_YEAR]},
+    }
+
+
+def rebuild_handler(students_collection, ledger, summaries):
+    """Job handler recomputing every summary from students and the payment ledger."""
+
+    async def handler(job, progress):
+        started = datetime.utcnow()
+        await progress(0, 2)
+
+        remaining = {"$ifNull": ["$remaining_fees", 0]}
+        await students_collection.aggregate([
+            {"$match": {"student_id": {"$exists": True}}},
+            {"$group": {
+                "_id": _group_keys(),
+                "students": {"$sum": 1},
+                "total_fees": {"$sum": {"$ifNull": ["$total_fees", 0]}},
+                "collected": {"$sum": {"$ifNull": ["$paid_fees", 0]}},
+                "outstanding": {"$sum": remaining},
+                "defaulters": {"$sum": {"$cond": [{"$gt": [remaining, 0]}, 1, 0]}},
+            }},
+            {"$project": {
+                "_id": 0,
+                "course": "$_id.course",
+                "academic_year": "$_id.academic_year",
+                "month": ALL_MONTHS,
+                "students": 1, "total_fees": 1, "collected": 1, "outstanding": 1, "defaulters": 1,
+                "rebuild_id": job["_id"],
+                "updated_at": "$$NOW",
+            }},
+            {"$merge": {"into": FEE_SUMMARIES_COLLECTION, "on": ["course", "academic_year", "month"], "whenMatched": "replace"}},
+        ]).to_list(length=None)
+        await progress(1, 2)
+
+        # Monthly collections are attributed to each student's current group. Student-portal
+        # payments (source "student") go to the per-year fees collection, not to
+        # students.paid_fees, so they are deliberately left out here as on the write path.
+        await ledger.aggregate([
+            {"$match": {"source": "admin", "status": "applied"}},
+            {"$lookup": {"from": students_collection.name, "localField": "student_id", "foreignField": "student_id", "as": "student"}},
+            {"$unwind": "$student"},
+            {"$group": {
+                "_id": {
+                    "course": {"$ifNull": ["$student.course", NO_COURSE]},
+                    "academic_year": {"$ifNull": ["$student.academic_year", NO_YEAR]},
+                    "month": {"$dateToString": {"format": "%Y-%m", "date": "$created_at"}},
+                },
+                "collected": {"$sum": "$amount"},
+                "payments": {"$sum": 1},
+            }},
+            {"$project": {
+                "_id": 0,
+                "course": "$_id.course",
+                "academic_year": "$_id.academic_year",
+                "month": "$_id.month",
+                "collected": 1, "payments": 1,
+                "rebuild_id": job["_id"],
+                "updated_at": "$$NOW",
+            }},
+            {"$merge": {"into": FEE_SUMMARIES_COLLECTION, "on": ["course", "academic_year", "month"], "whenMatched": "replace"}},
+        ]).to_list(length=None)
+
+        # Groups that no longer have any students or payments were not rewritten above
+        stale = await summaries.delete_many({"rebuild_id": {"$ne": job["_id"]}, "updated_at": {"$lt": started}})
+        await progress(2, 2)
+        return {"removed_groups": stale.deleted_count}
+
+    return handler
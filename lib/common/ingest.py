@@ -0,0 +1,273 @@
+import codecs
+import csv
+import json
+import os
+from collections import deque
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException, Request
+
+# Rows are processed (validated, written) in batches of this size to bound memory
+BULK_BATCH_SIZE = int(os.getenv("ERP_BULK_BATCH_SIZE", "500"))
+
+# A single CSV record or JSON element larger than this is rejected
+MAX_RECORD_BYTES = 64 * 1024
+
+CSV_TYPES = {"text/csv", "application/csv"}
+NDJSON_TYPES = {"application/x-ndjson", "application/ndjson"}
+
+
+class UploadError(HTTPException):
+    """The upload could not be parsed past ``line`` (CSV, NDJSON) or character ``offset`` (JSON).
+
+    ``iter_batches`` fills in ``row``, the first row that was not read, so the
+    bulk endpoints can report what was applied before parsing stopped.
+    """
+
+    def __init__(self, detail: str, line: Optional[int] = None, offset: Optional[int] = None):
+        super().__init__(status_code=400, detail=detail)
+        self.line = line
+        self.offset = offset
+        self.row: Optional[int] = None
+
+    def result(self) -> Dict[str, Any]:
+        result: Dict[str, Any] = {"row": self.row, "status": "malformed", "detail": self.detail}
+        if self.line is not None:
+            result["line"] = self.line
+        if self.offset is not None:
+            result["offset"] = self.offset
+        return result
+
+
+async def _decoded_chunks(request: Request) -> AsyncIterator[str]:
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    async for chunk in request.stream():
+        text = decoder.decode(chunk)
+        if text:
+            yield text
+    tail = decoder.decode(b"", final=True)
+    if tail:
+        yield tail
+
+
+async def _line_groups(request: Request) -> AsyncIterator[List[str]]:
+    """The complete lines of each decoded chunk, without their newlines."""
+    pending = ""
+    line_number = 0
+    async for text in _decoded_chunks(request):
+        pending += text
+        *complete, pending = pending.split("\n")
+        if complete:
+            line_number += len(complete)
+            yield complete
+        if len(pending) > MAX_RECORD_BYTES:
+            raise UploadError("Upload contains an oversized record", line=line_number + 1)
+    if pending:
+        yield [pending]
+
+
+async def _lines(request: Request) -> AsyncIterator[str]:
+    async for group in _line_groups(request):
+        for line in group:
+            yield line
+
+
+class _LineFeed:
+    """Lines handed to csv.reader, which pulls them itself; notes when it ran out mid-record."""
+
+    def __init__(self):
+        self.lines: Deque[str] = deque()
+        self.taken: List[str] = []
+        self.ran_dry = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> str:
+        if not self.lines:
+            self.ran_dry = True
+            raise StopIteration
+        line = self.lines.popleft()
+        self.taken.append(line)
+        return line
+
+
+async def _iter_csv(request: Request) -> AsyncIterator[Dict[str, Any]]:
+    """Rows of a CSV upload, with quoting exactly as csv.reader understands it.
+
+    The reader only returns a row early when it runs out of lines inside a
+    quoted field; those lines are put back and parsed again once the next
+    chunk has arrived.
+    """
+    feed = _LineFeed()
+    reader = csv.reader(feed)
+    header = None
+    line_number = 0  # Lines consumed by complete records
+    in_quotes = False
+
+    async for group in _line_groups(request):
+        feed.lines.extend(f"{line}\n" for line in group)
+        # Only a quote can end a quoted field, so there is no point parsing again without one
+        if in_quotes and not any('"' in line for line in group):
+            if sum(map(len, feed.lines)) > MAX_RECORD_BYTES:
+                raise UploadError("Upload contains an oversized record", line=line_number + 1)
+            continue
+
+        while feed.lines:
+            feed.taken, feed.ran_dry = [], False
+            try:
+                values = next(reader)
+            except StopIteration:
+                break
+            except csv.Error as e:
+                raise UploadError(f"Malformed CSV: {e}", line=line_number + 1)
+            in_quotes = feed.ran_dry
+            if in_quotes:
+                feed.lines.extendleft(reversed(feed.taken))
+                if sum(map(len, feed.lines)) > MAX_RECORD_BYTES:
+                    raise UploadError("Upload contains an oversized record", line=line_number + 1)
+                break
+            line_number += len(feed.taken)
+
+            if not any(value.strip() for value in values):
+                continue
+            if header is None:
+                header = [value.strip() for value in values]
+                continue
+            yield {key: value.strip() for key, value in zip(header, values)}
+
+    if feed.lines:
+        raise UploadError("CSV upload ends inside a quoted field", line=line_number + 1)
+
+
+async def _iter_ndjson(request: Request) -> AsyncIterator[Any]:
+    async for line in _lines(request):
+        if line.strip():
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                yield None
+
+
+# Parser states for _iter_json_array
+_OPEN, _FIRST, _VALUE, _SEPARATOR, _CLOSED = range(5)
+_SCALAR_END = frozenset(",]") | frozenset(" \t\r\n")
+
+
+def _malformed(offset: int) -> UploadError:
+    return UploadError("Malformed JSON array", offset=offset)
+
+
+async def _iter_json_array(request: Request) -> AsyncIterator[Any]:
+    """Yield the elements of a top-level JSON array without buffering the whole body.
+
+    Elements must be separated by exactly one comma. Strings, objects and
+    arrays are decoded as soon as they are complete; a bare number or
+    literal only once the character after it has arrived, so the result
+    never depends on where the body is split into chunks.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ""
+    consumed = 0  # Characters already dropped from the front of buffer
+    state = _OPEN
+
+    async for text in _decoded_chunks(request):
+        buffer += text
+        position = 0
+        while True:
+            while position < len(buffer) and buffer[position].isspace():
+                position += 1
+            if position >= len(buffer):
+                break
+            char = buffer[position]
+
+            if state == _OPEN:
+                if char != "[":
+                    raise UploadError("Expected a JSON array", offset=consumed + position)
+                state, position = _FIRST, position + 1
+            elif state == _CLOSED:
+                raise _malformed(consumed + position)
+            elif state == _SEPARATOR:
+                if char == ",":
+                    state = _VALUE
+                elif char == "]":
+                    state = _CLOSED
+                else:
+                    raise _malformed(consumed + position)
+                position += 1
+            elif char == "]" and state == _FIRST:
+                state, position = _CLOSED, position + 1
+            elif char in ",]":
+                # A value was expected: "[,1]", "[1,,2]" or "[1,]"
+                raise _malformed(consumed + position)
+            else:
+                if char in '{["':
+                    try:
+                        element, end = decoder.raw_decode(buffer, position)
+                    except json.JSONDecodeError:
+                        # Not complete yet; wait for the next chunk
+                        break
+                else:
+                    end = position
+                    while end < len(buffer) and buffer[end] not in _SCALAR_END:
+                        end += 1
+                    if end == len(buffer):
+                        # The number or literal may continue in the next chunk
+                        break
+                    try:
+                        element, decoded_end = decoder.raw_decode(buffer[:end], position)
+                    except json.JSONDecodeError:
+                        raise _malformed(consumed + position)
+                    if decoded_end != end:
+                        raise _malformed(consumed + position)
+                if end - position > MAX_RECORD_BYTES:
+                    raise UploadError("Upload contains an oversized or malformed record", offset=consumed + position)
+                state, position = _SEPARATOR, end
+                yield element
+
+        buffer = buffer[position:]
+        consumed += position
+        if len(buffer) > MAX_RECORD_BYTES:
+            raise UploadError("Upload contains an oversized or malformed record", offset=consumed)
+
+    if state != _CLOSED or buffer.strip():
+        raise _malformed(consumed)
+
+
+async def iter_upload_rows(request: Request) -> AsyncIterator[Any]:
+    """Stream rows from a CSV, NDJSON or JSON-array request body."""
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    if content_type in CSV_TYPES:
+        rows = _iter_csv(request)
+    elif content_type in NDJSON_TYPES:
+        rows = _iter_ndjson(request)
+    else:
+        rows = _iter_json_array(request)
+    async for row in rows:
+        yield row
+
+
+async def iter_batches(
+    request: Request, batch_size: int = BULK_BATCH_SIZE
+) -> AsyncIterator[List[Tuple[int, Any]]]:
+    """Group streamed upload rows into numbered batches: [(row_number, row), ...].
+
+    If the body turns out to be malformed, the rows read before that point
+    are still yielded, then the UploadError is raised with its ``row`` set.
+    """
+    batch: List[Tuple[int, Any]] = []
+    row_number = 0
+    try:
+        async for row in iter_upload_rows(request):
+            row_number += 1
+            batch.append((row_number, row))
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+    except UploadError as error:
+        error.row = row_number + 1
+        if batch:
+            yield batch
+        raise
+    if batch:
+        yield batch
@@ -0,0 +1,131 @@
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, Optional
+from uuid import uuid4
+
+from pymongo import ReturnDocument
+
+JOBS_COLLECTION = "jobs"
+
+JOB_WORKERS = int(os.getenv("ERP_JOB_WORKERS", "2"))
+# Jobs enqueued by other processes (or orphaned by a crash) are picked up within this interval
+POLL_SECONDS = 5
+# A running job whose lease expires (worker died) becomes claimable again
+LEASE_SECONDS = 300
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+Progress = Callable[[int, int], Awaitable[None]]
+Handler = Callable[[Dict[str, Any], Progress], Awaitable[Dict[str, Any]]]
+
+
+def serialize_job(job: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "job_id": job["_id"],
+        "type": job["type"],
+        "status": job["status"],
+        "params": job.get("params", {}),
+        "progress": job.get("progress", {"done": 0, "total": 0}),
+        "result": job.get("result"),
+        "error": job.get("error"),
+        "created_at": job.get("created_at"),
+        "updated_at": job.get("updated_at"),
+    }
+
+
+class JobQueue:
+    """Background jobs run by in-process workers, with job state kept in MongoDB.
+
+    Workers claim jobs atomically, so any worker process can run a job that
+    another one enqueued. Handlers report progress, which also renews the
+    job's lease.
+    """
+
+    def __init__(self, collection, workers: int = JOB_WORKERS):
+        self.collection = collection
+        self.workers = workers
+        self.handlers: Dict[str, Handler] = {}
+        self._wakeup = asyncio.Event()
+        self._tasks = []
+
+    def register(self, job_type: str, handler: Handler):
+        self.handlers[job_type] = handler
+
+    async def submit(self, job_type: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        now = datetime.utcnow()
+        job = {
+            "_id": uuid4().hex,
+            "type": job_type,
+            "params": params,
+            "status": QUEUED,
+            "progress": {"done": 0, "total": 0},
+            "created_at": now,
+            "updated_at": now,
+        }
+        await self.collection.insert_one(job)
+        self._wakeup.set()
+        return job
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return await self.collection.find_one({"_id": job_id})
+
+    async def _claim(self) -> Optional[Dict[str, Any]]:
+        now = datetime.utcnow()
+        return await self.collection.find_one_and_update(
+            {
+                "type": {"$in": list(self.handlers)},
+                "$or": [{"status": QUEUED}, {"status": RUNNING, "lease_until": {"$lt": now}}],
+            },
+            {"$set": {"status": RUNNING, "lease_until": now + timedelta(seconds=LEASE_SECONDS), "updated_at": now}},
+            sort=[("created_at", 1)],
+            return_document=ReturnDocument.AFTER,
+        )
+
+    async def _run(self, job: Dict[str, Any]):
+        async def progress(done: int, total: int):
+            now = datetime.utcnow()
+            await self.collection.update_one(
+                {"_id": job["_id"]},
+                {"$set": {
+                    "progress": {"done": done, "total": total},
+                    "lease_until": now + timedelta(seconds=LEASE_SECONDS),
+                    "updated_at": now,
+                }},
+            )
+
+        try:
+            result = await self.handlers[job["type"]](job, progress)
+            update = {"status": DONE, "result": result}
+        except Exception as e:
+            logging.error(f"❌ Job {job['_id']} ({job['type']}) failed: {e}")
+            update = {"status": FAILED, "error": str(e)}
+        update["updated_at"] = datetime.utcnow()
+        await self.collection.update_one({"_id": job["_id"]}, {"$set": update, "$unset": {"lease_until": ""}})
+
+    async def _worker(self):
+        while True:
+            try:
+                job = await self._claim()
+            except Exception as e:
+                logging.error(f"❌ Could not claim job: {e}")
+                job = None
+
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self._run(job)
+
+    async def start(self):
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def shutdown(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
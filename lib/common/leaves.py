@@ -0,0 +1,207 @@
+import logging
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import UpdateOne
+
+from lib.common.notifications import create_notifications, new_notification
+from lib.common.pagination import clamp_limit
+
+LEAVES_COLLECTION = "leave_requests"
+
+PENDING = "Pending"
+APPROVED = "Approved"
+REJECTED = "Rejected"
+DECISIONS = (APPROVED, REJECTED)
+
+# What the queue needs from the student record, copied onto each request
+LEAVE_STUDENT_FIELDS = {"_id": 0, "email": 1, "student_id": 1, "name": 1, "course": 1, "academic_year": 1}
+
+
+def serialize_leave(leave: dict) -> dict:
+    leave = dict(leave)
+    leave["id"] = str(leave.pop("_id"))
+    leave.pop("decision_id", None)
+    leave.pop("legacy_key", None)
+    for field in ("applied_at", "decided_at"):
+        if isinstance(leave.get(field), datetime):
+            leave[field] = leave[field].isoformat()
+    return leave
+
+
+def parse_leave_id(value: Any) -> Optional[ObjectId]:
+    try:
+        return ObjectId(value)
+    except (InvalidId, TypeError):
+        return None
+
+
+def leave_dates(from_date: Any, to_date: Any, today: Optional[datetime] = None) -> Tuple[str, str]:
+    """Normalized YYYY-MM-DD bounds; a missing start is today, a missing end the start.
+
+    Raises ValueError for anything but an ISO date or an end before the start.
+    The queue filters and sorts on these strings, so they must stay in one format.
+    """
+    try:
+        start = datetime.strptime(from_date, "%Y-%m-%d").date() if from_date else (today or datetime.utcnow()).date()
+        end = datetime.strptime(to_date, "%Y-%m-%d").date() if to_date else start
+    except TypeError:
+        raise ValueError("Dates must be strings")
+    if end < start:
+        raise ValueError("to_date is before from_date")
+    return start.isoformat(), end.isoformat()
+
+
+def new_leave_request(
+    student: dict,
+    reason: str,
+    from_date: Optional[str] = None,
+    to_date: Optional[str] = None,
+    applied_at: Optional[datetime] = None,
+) -> dict:
+    applied_at = applied_at or datetime.utcnow()
+    from_date = from_date or applied_at.strftime("%Y-%m-%d")
+    return {
+        "email": student.get("email"),
+        "student_id": student.get("student_id"),
+        "name": student.get("name"),
+        "course": student.get("course"),
+        "academic_year": student.get("academic_year"),
+        "reason": reason,
+        "from_date": from_date,
+        "to_date": to_date or from_date,
+        "status": PENDING,
+        "applied_at": applied_at,
+    }
+
+
+def queue_filter(
+    course: Optional[str] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    after: Optional[ObjectId] = None,
+) -> Dict[str, Any]:
+    """Pending requests, optionally for one course and a window of leave start dates."""
+    query: Dict[str, Any] = {"status": PENDING}
+    if course:
+        query["course"] = course
+    if date_from or date_to:
+        query["from_date"] = {}
+        if date_from:
+            query["from_date"]["$gte"] = date_from
+        if date_to:
+            query["from_date"]["$lte"] = date_to
+    if after is not None:
+        query["_id"] = {"$gt": after}
+    return query
+
+
+async def pending_page(collection, limit: int, after: Optional[ObjectId] = None, **filters) -> Tuple[List[dict], Optional[str]]:
+    """Oldest-first page of the pending queue and the cursor for the next page."""
+    limit = clamp_limit(limit)
+    cursor = collection.find(queue_filter(after=after, **filters)).sort("_id", 1).limit(limit + 1)
+    docs = await cursor.to_list(length=limit + 1)
+
+    next_cursor = None
+    if len(docs) > limit:
+        docs = docs[:limit]
+        next_cursor = str(docs[-1]["_id"])
+    return [serialize_leave(doc) for doc in docs], next_cursor
+
+
+async def decide_leaves(collection, notifications, decisions: List[dict], decided_by: Optional[str] = None) -> List[dict]:
+    """Apply approve/reject decisions in one bulk write and notify students in one insert.
+
+    Each decision is ``{"id", "status", "note"?}``. Only requests that are
+    still pending change, so a repeated or concurrent decision is reported
+    as ``already_decided`` instead of overwriting the first one.
+    """
+    results: List[Optional[dict]] = [None] * len(decisions)
+    wanted: Dict[ObjectId, int] = {}
+    for position, decision in enumerate(decisions):
+        leave_id = parse_leave_id(decision.get("id"))
+        status = decision.get("status")
+        if leave_id is None or status not in DECISIONS:
+            results[position] = {"id": decision.get("id"), "result": "invalid"}
+        elif leave_id in wanted:
+            results[position] = {"id": decision.get("id"), "result": "duplicate"}
+        else:
+            wanted[leave_id] = position
+
+    decision_id = ObjectId()
+    decided_at = datetime.utcnow()
+    operations = []
+    for leave_id, position in wanted.items():
+        decision = decisions[position]
+        update = {
+            "status": decision["status"],
+            "decided_at": decided_at,
+            "decided_by": decided_by,
+            "decision_id": decision_id,
+        }
+        if decision.get("note"):
+            update["note"] = decision["note"]
+        operations.append(UpdateOne({"_id": leave_id, "status": PENDING}, {"$set": update}))
+
+    decided = {}
+    if operations:
+        await collection.bulk_write(operations, ordered=False)
+        # The decision stamp tells exactly which requests this call changed
+        async for leave in collection.find({"decision_id": decision_id}):
+            decided[leave["_id"]] = leave
+
+    existing = set()
+    missing = [leave_id for leave_id in wanted if leave_id not in decided]
+    if missing:
+        async for leave in collection.find({"_id": {"$in": missing}}, {"_id": 1}):
+            existing.add(leave["_id"])
+
+    for leave_id, position in wanted.items():
+        if leave_id in decided:
+            result = "decided"
+        elif leave_id in existing:
+            result = "already_decided"
+        else:
+            result = "not_found"
+        results[position] = {"id": str(leave_id), "result": result}
+
+    messages = []
+    for leave in decided.values():
+        if not leave.get("student_id"):
+            continue
+        message = f"Your leave request from {leave.get('from_date')} has been {leave['status'].lower()}."
+        if leave.get("note"):
+            message += f" Note: {leave['note']}"
+        messages.append(new_notification(leave["student_id"], message))
+    if messages:
+        await create_notifications(notifications, messages)
+
+    return results
+
+
+async def migrate_embedded_leave_requests(db):
+    """Move ``leave_requests`` arrays out of student documents into their own collection."""
+    students = db.students
+    moved = 0
+    async for student in students.find({"leave_requests": {"$exists": True}}).batch_size(200):
+        operations = []
+        for position, legacy in enumerate(student.get("leave_requests") or []):
+            if not isinstance(legacy, dict):
+                continue
+            applied_at = legacy.get("applied_at")
+            if not isinstance(applied_at, datetime) and isinstance(student["_id"], ObjectId):
+                applied_at = student["_id"].generation_time.replace(tzinfo=None)
+            leave = new_leave_request(student, legacy.get("reason", ""), applied_at=applied_at)
+            leave["status"] = legacy.get("status") or PENDING
+            # Re-running after a partial migration must not duplicate requests
+            leave["legacy_key"] = f"{student['_id']}:{position}"
+            operations.append(UpdateOne({"legacy_key": leave["legacy_key"]}, {"$setOnInsert": leave}, upsert=True))
+        if operations:
+            await db[LEAVES_COLLECTION].bulk_write(operations, ordered=False)
+        await students.update_one({"_id": student["_id"]}, {"$unset": {"leave_requests": ""}})
+        moved += 1
+
+    if moved:
+        logging.info(f"✅ Moved embedded leave requests for {moved} students into {LEAVES_COLLECTION}")
@@ -0,0 +1,43 @@
+import logging
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, List
+
+Hook = Callable[[], Awaitable[None]]
+
+
+class ServiceLifespan:
+    """FastAPI lifespan that runs registered startup/shutdown hooks in order.
+
+    Startup hooks run in registration order; shutdown hooks run in reverse so
+    resources are released in the opposite order to how they were acquired.
+    """
+
+    def __init__(self):
+        self._startup: List[Hook] = []
+        self._shutdown: List[Hook] = []
+
+    def on_startup(self, hook: Hook) -> Hook:
+        self._startup.append(hook)
+        return hook
+
+    def on_shutdown(self, hook: Hook) -> Hook:
+        self._shutdown.append(hook)
+        return hook
+
+    def include(self, other: "ServiceLifespan"):
+        """Run another lifespan's hooks as part of this one."""
+        self._startup.extend(other._startup)
+        self._shutdown.extend(other._shutdown)
+
+    @asynccontextmanager
+    async def __call__(self, app):
+        for hook in self._startup:
+            await hook()
+        try:
+            yield
+        finally:
+            for hook in reversed(self._shutdown):
+                try:
+                    await hook()
+                except Exception as e:
+                    logging.error(f"❌ Shutdown hook {hook.__name__} failed: {e}")
@@ -0,0 +1,210 @@
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from typing import Callable, Dict, Tuple
+
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from pymongo import monitoring
+from starlette.routing import Match
+
+PROMETHEUS_MEDIA_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+SLOW_QUERY_MS = float(os.getenv("ERP_SLOW_QUERY_MS", "100"))
+
+# Seconds; spans sub-millisecond Mongo lookups up to multi-second bcrypt/bulk work
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Long-lived streams would only skew the latency histograms
+UNTIMED_MEDIA_TYPES = (b"text/event-stream",)
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, seconds: float):
+        self.counts[bisect_left(BUCKETS, seconds)] += 1
+        self.total += seconds
+        self.count += 1
+
+
+def _labels(**labels) -> str:
+    def escape(value) -> str:
+        return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+    return ",".join(f'{key}="{escape(value)}"' for key, value in labels.items())
+
+
+class Metrics:
+    """Per-process request/Mongo timings rendered in Prometheus text format.
+
+    Each uvicorn worker keeps its own counters; scrape every worker (or sum
+    in Prometheus) for service-wide numbers.
+    """
+
+    def __init__(self):
+        # Command events arrive on pymongo's threads, requests on the event loop
+        self._lock = threading.Lock()
+        self.requests: Dict[Tuple[str, str], Histogram] = defaultdict(Histogram)
+        self.responses: Dict[Tuple[str, str, int], int] = defaultdict(int)
+        self.commands: Dict[Tuple[str, str], Histogram] = defaultdict(Histogram)
+        self.command_failures: Dict[Tuple[str, str], int] = defaultdict(int)
+        self.slow_commands: Dict[Tuple[str, str], int] = defaultdict(int)
+        self._gauges: Dict[str, Callable[[], dict]] = {}
+
+    def observe_request(self, method: str, route: str, status: int, seconds: float):
+        with self._lock:
+            self.requests[(method, route)].observe(seconds)
+            self.responses[(method, route, status)] += 1
+
+    def observe_command(self, collection: str, command: str, seconds: float, failed: bool = False):
+        with self._lock:
+            self.commands[(collection, command)].observe(seconds)
+            if failed:
+                self.command_failures[(collection, command)] += 1
+            if seconds * 1000 >= SLOW_QUERY_MS:
+                self.slow_commands[(collection, command)] += 1
+
+    def gauges(self, prefix: str, source: Callable[[], dict]):
+        """Export every numeric value of ``source()`` as ``<prefix>_<key>`` at scrape time."""
+        self._gauges[prefix] = source
+
+    def _histogram_lines(self, name: str, histograms: dict, label_names: tuple) -> list:
+        lines = [f"# TYPE {name} histogram"]
+        for key, histogram in sorted(histograms.items()):
+            labels = dict(zip(label_names, key))
+            cumulative = 0
+            for bound, count in zip(BUCKETS + ("+Inf",), histogram.counts):
+                cumulative += count
+                lines.append(f"{name}_bucket{{{_labels(**labels, le=bound)}}} {cumulative}")
+            lines.append(f"{name}_sum{{{_labels(**labels)}}} {histogram.total:.6f}")
+            lines.append(f"{name}_count{{{_labels(**labels)}}} {histogram.count}")
+        return lines
+
+    def _counter_lines(self, name: str, counters: dict, label_names: tuple) -> list:
+        lines = [f"# TYPE {name} counter"]
+        for key, value in sorted(counters.items()):
+            lines.append(f"{name}{{{_labels(**dict(zip(label_names, key)))}}} {value}")
+        return lines
+
+    def render(self) -> str:
+        with self._lock:
+            lines = [
+                *self._histogram_lines("erp_http_request_duration_seconds", self.requests, ("method", "route")),
+                *self._counter_lines("erp_http_responses_total", self.responses, ("method", "route", "status")),
+                *self._histogram_lines("erp_mongo_command_duration_seconds", self.commands, ("collection", "command")),
+                *self._counter_lines("erp_mongo_command_failures_total", self.command_failures, ("collection", "command")),
+                *self._counter_lines("erp_mongo_slow_commands_total", self.slow_commands, ("collection", "command")),
+            ]
+
+        for prefix, source in self._gauges.items():
+            try:
+                values = source()
+            except Exception as e:
+                logging.error(f"❌ Metrics source {prefix} failed: {e}")
+                continue
+            for key, value in values.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    lines.append(f"# TYPE {prefix}_{key} gauge")
+                    lines.append(f"{prefix}_{key} {value}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+
+class MongoCommandTimer(monitoring.CommandListener):
+    """Times every Mongo command per collection; pass it to the client's ``event_listeners``."""
+
+    def __init__(self, registry: Metrics):
+        self.registry = registry
+        self._pending: Dict[Tuple, Tuple[str, str]] = {}
+
+    @staticmethod
+    def _key(event) -> Tuple:
+        return (event.connection_id, event.request_id, event.operation_id)
+
+    @staticmethod
+    def _collection(event) -> str:
+        command = event.command
+        # getMore carries the cursor id under its own name and the collection separately
+        target = command.get("collection") if event.command_name == "getMore" else command.get(event.command_name)
+        if not isinstance(target, str):
+            target = command.get("collection")
+        return target if isinstance(target, str) else "-"
+
+    def started(self, event):
+        collection = self._collection(event)
+        self._pending[self._key(event)] = (collection, event.command_name)
+
+    def _finish(self, event, failed: bool):
+        collection, command = self._pending.pop(self._key(event), ("-", event.command_name))
+        seconds = event.duration_micros / 1_000_000
+        self.registry.observe_command(collection, command, seconds, failed)
+        if seconds * 1000 >= SLOW_QUERY_MS:
+            logging.warning(f"🐢 Slow Mongo command {command} on {collection}: {seconds * 1000:.1f} ms")
+
+    def succeeded(self, event):
+        self._finish(event, failed=False)
+
+    def failed(self, event):
+        self._finish(event, failed=True)
+
+
+mongo_command_timer = MongoCommandTimer(metrics)
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording latency and status per route template."""
+
+    def __init__(self, app, registry: Metrics = metrics):
+        self.app = app
+        self.registry = registry
+
+    def _route(self, scope) -> str:
+        route = scope.get("route")
+        if route is None:
+            for candidate in scope["app"].router.routes:
+                if candidate.matches(scope)[0] == Match.FULL:
+                    route = candidate
+                    break
+        # Unmatched paths share one label so scanners cannot blow up cardinality
+        return getattr(route, "path", "<unmatched>")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        state = {"status": 500, "timed": True}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                state["status"] = message["status"]
+                content_type = dict(message.get("headers", [])).get(b"content-type", b"")
+                state["timed"] = not content_type.startswith(UNTIMED_MEDIA_TYPES)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            if state["timed"]:
+                self.registry.observe_request(
+                    scope["method"], self._route(scope), state["status"], time.perf_counter() - started
+                )
+
+
+def metrics_router(registry: Metrics = metrics) -> APIRouter:
+    router = APIRouter()
+
+    @router.get("/metrics", response_class=PlainTextResponse)
+    async def get_metrics():
+        return PlainTextResponse(registry.render(), media_type=PROMETHEUS_MEDIA_TYPE)
+
+    return router
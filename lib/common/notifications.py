@@ -0,0 +1,237 @@
+import asyncio
+import json
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Set
+
+from bson import ObjectId
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+
+NOTIFICATIONS_COLLECTION = "notifications"
+
+# How often each worker checks MongoDB for notifications written by other workers
+POLL_SECONDS = float(os.getenv("ERP_NOTIFY_POLL_SECONDS", "2"))
+# ObjectIds from different processes are only ordered to the second; re-read this much
+# before the newest notification seen so ones inserted slightly out of order are not missed
+SKEW_SECONDS = 2
+POLL_PAGE_SIZE = 1000
+KEEPALIVE_SECONDS = 15
+SUBSCRIBER_QUEUE_SIZE = 100
+
+
+def serialize_notification(doc: Dict[str, Any]) -> Dict[str, Any]:
+    timestamp = doc.get("timestamp")
+    return {
+        "id": str(doc["_id"]),
+        "student_id": doc.get("student_id"),
+        "message": doc.get("message", ""),
+        "timestamp": timestamp.isoformat() if isinstance(timestamp, datetime) else timestamp,
+        "read": doc.get("read", False),
+    }
+
+
+def new_notification(student_id: str, message: str) -> Dict[str, Any]:
+    now = datetime.utcnow()
+    return {
+        "student_id": student_id,
+        "message": message,
+        # MongoDB stores milliseconds; truncate so pushed and fetched timestamps match
+        "timestamp": now.replace(microsecond=now.microsecond // 1000 * 1000),
+        "read": False
+    }
+
+
+class NotificationHub:
+    """In-process fan-out of new notifications to connected students.
+
+    Notifications created in this worker are pushed immediately. A single
+    poller per worker (running only while someone is connected) picks up
+    notifications written by other workers for the students connected
+    here, resuming after the newest one it has seen, so the database sees
+    one small query per poll interval no matter how many portals are
+    listening or how many notifications other students receive.
+    """
+
+    def __init__(self):
+        self.collection = None
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = {}
+        self._delivered: Set[ObjectId] = set()
+        self._last_seen: Optional[ObjectId] = None
+        self._poller: Optional[asyncio.Task] = None
+
+    def bind(self, collection):
+        self.collection = collection
+
+    @property
+    def connections(self) -> int:
+        return sum(len(queues) for queues in self._subscribers.values())
+
+    def subscribe(self, student_id: str) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self._subscribers.setdefault(student_id, set()).add(queue)
+        if self.collection is not None and (self._poller is None or self._poller.done()):
+            self._poller = asyncio.create_task(self._poll())
+        return queue
+
+    def unsubscribe(self, student_id: str, queue: asyncio.Queue):
+        queues = self._subscribers.get(student_id)
+        if queues is not None:
+            queues.discard(queue)
+            if not queues:
+                del self._subscribers[student_id]
+
+    def publish(self, doc: Dict[str, Any]):
+        if not self._subscribers or doc["_id"] in self._delivered:
+            return
+        self._delivered.add(doc["_id"])
+        if self._last_seen is None or doc["_id"] > self._last_seen:
+            self._last_seen = doc["_id"]
+        payload = serialize_notification(doc)
+        for queue in self._subscribers.get(doc.get("student_id"), ()):
+            try:
+                queue.put_nowait(payload)
+            except asyncio.QueueFull:
+                # Slow client; it can catch up through the paginated endpoint
+                pass
+
+    async def _poll_once(self):
+        last_seen = self._last_seen or ObjectId.from_datetime(datetime.utcnow())
+        since = ObjectId.from_datetime(last_seen.generation_time - timedelta(seconds=SKEW_SECONDS))
+        # Anything older than the re-read margin can never be fetched again
+        self._delivered = {key for key in self._delivered if key > since}
+        if self._last_seen is None:
+            self._last_seen = last_seen
+
+        query = {"student_id": {"$in": list(self._subscribers)}}
+        after = since
+        while True:
+            docs = await (
+                self.collection.find({**query, "_id": {"$gt": after}})
+                .sort("_id", 1)
+                .limit(POLL_PAGE_SIZE)
+                .to_list(length=POLL_PAGE_SIZE)
+            )
+            for doc in docs:
+                self.publish(doc)
+            if len(docs) < POLL_PAGE_SIZE:
+                break
+            after = docs[-1]["_id"]
+
+    async def _poll(self):
+        while self._subscribers:
+            await asyncio.sleep(POLL_SECONDS)
+            if not self._subscribers:
+                break
+            try:
+                await self._poll_once()
+            except Exception as e:
+                logging.error(f"❌ Notification poll failed: {e}")
+        # Start from "now" again when the next student connects
+        self._last_seen = None
+        self._delivered.clear()
+
+    async def shutdown(self):
+        if self._poller is not None:
+            self._poller.cancel()
+            self._poller = None
+
+
+notification_hub = NotificationHub()
+
+
+async def create_notifications(collection, docs: List[Dict[str, Any]]):
+    """Insert notifications with a single insert_many and push them to connected students."""
+    if not docs:
+        return
+    await collection.insert_many(docs)
+    for doc in docs:
+        notification_hub.publish(doc)
+
+
+def _page_filter(student_id: str, before: Optional[str], unread_only: bool) -> Dict[str, Any]:
+    query: Dict[str, Any] = {"student_id": student_id}
+    if unread_only:
+        query["read"] = False
+    if before:
+        try:
+            timestamp, _, last_id = before.partition("|")
+            timestamp = datetime.fromisoformat(timestamp)
+            last_id = ObjectId(last_id)
+        except Exception:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        query["$or"] = [
+            {"timestamp": {"$lt": timestamp}},
+            {"timestamp": timestamp, "_id": {"$lt": last_id}},
+        ]
+    return query
+
+
+def notifications_router(collection) -> APIRouter:
+    notification_hub.bind(collection)
+    router = APIRouter()
+
+    # ✅ Paginated notifications, newest first (cursor = "<timestamp>|<id>")
+    @router.get("/notifications/{student_id}")
+    async def get_notifications(
+        student_id: str,
+        limit: int = Query(20, ge=1, le=100),
+        before: Optional[str] = None,
+        unread_only: bool = False,
+    ):
+        cursor = (
+            collection.find(_page_filter(student_id, before, unread_only))
+            .sort([("timestamp", -1), ("_id", -1)])
+            .limit(limit + 1)
+        )
+        docs = await cursor.to_list(length=limit + 1)
+
+        next_before = None
+        if len(docs) > limit:
+            docs = docs[:limit]
+            next_before = f"{docs[-1]['timestamp'].isoformat()}|{docs[-1]['_id']}"
+        return {
+            "notifications": [serialize_notification(doc) for doc in docs],
+            "next_before": next_before,
+        }
+
+    # ✅ Bulk mark-as-read: {"ids": [...]} or {"all": true}
+    @router.post("/notifications/{student_id}/read")
+    async def mark_notifications_read(student_id: str, data: dict):
+        query: Dict[str, Any] = {"student_id": student_id, "read": False}
+        if not data.get("all"):
+            ids = data.get("ids") or []
+            if not ids or not all(ObjectId.is_valid(i) for i in ids):
+                raise HTTPException(status_code=400, detail="Provide notification ids or all=true")
+            query["_id"] = {"$in": [ObjectId(i) for i in ids]}
+
+        result = await collection.update_many(query, {"$set": {"read": True}})
+        return {"message": "Notifications marked as read", "updated": result.modified_count}
+
+    # ✅ Server-Sent Events stream of new notifications
+    @router.get("/notifications/{student_id}/stream")
+    async def stream_notifications(student_id: str, request: Request):
+        queue = notification_hub.subscribe(student_id)
+
+        async def events():
+            try:
+                yield b"retry: 5000\n\n"
+                while not await request.is_disconnected():
+                    try:
+                        payload = await asyncio.wait_for(queue.get(), timeout=KEEPALIVE_SECONDS)
+                    except asyncio.TimeoutError:
+                        yield b": keepalive\n\n"
+                        continue
+                    data = json.dumps(payload)
+                    yield f"id: {payload['id']}\nevent: notification\ndata: {data}\n\n".encode("utf-8")
+            finally:
+                notification_hub.unsubscribe(student_id, queue)
+
+        return StreamingResponse(
+            events(),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+
+    return router
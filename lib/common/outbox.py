@@ -0,0 +1,380 @@
+import asyncio
+import logging
+import os
+import random
+import smtplib
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from email.message import EmailMessage
+from typing import Any, Dict, List, Optional, Tuple
+
+from bson import ObjectId
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError
+
+from lib.common.database import mongo
+
+OUTBOX_COLLECTION = "email_outbox"
+# One counter document per minute, shared by every process that sends mail
+RATE_COLLECTION = "email_rate"
+
+PENDING, SENDING, SENT, FAILED = "pending", "sending", "sent", "failed"
+DUPLICATE_KEY_ERROR = 11000
+
+BATCH_SIZE = int(os.getenv("ERP_OUTBOX_BATCH", "50"))
+RATE_PER_MINUTE = int(os.getenv("ERP_SMTP_RATE_PER_MINUTE", "120"))
+MAX_ATTEMPTS = int(os.getenv("ERP_OUTBOX_MAX_ATTEMPTS", "6"))
+BACKOFF_SECONDS = 30  # Doubled after every failed attempt...
+BACKOFF_MAX_SECONDS = 3600  # ...up to an hour
+# Mail enqueued by other processes is picked up within this interval
+POLL_SECONDS = 5
+# A batch whose sender died becomes claimable again after this long
+LEASE_SECONDS = 300
+# Servers drop idle sessions anyway; close ours first and reconnect on the next batch
+IDLE_SECONDS = 60
+
+# (error, permanent) for a message that was not delivered, None once it was
+SendResult = Optional[Tuple[str, bool]]
+
+
+def new_email(to: str, subject: str, body: str, kind: str, dedupe_key: Optional[str] = None) -> Dict[str, Any]:
+    now = datetime.utcnow()
+    email = {
+        "to": to,
+        "subject": subject,
+        "body": body,
+        "kind": kind,
+        "status": PENDING,
+        "attempts": 0,
+        "next_attempt_at": now,
+        "created_at": now,
+    }
+    if dedupe_key:
+        # Unique, so a retried request cannot queue the same mail twice
+        email["dedupe_key"] = dedupe_key
+    return email
+
+
+# ✅ Messages sent by the ERP
+def admission_email(student: Dict[str, Any]) -> Dict[str, Any]:
+    return new_email(
+        student["email"],
+        "Welcome! Your admission is confirmed",
+        f"Dear {student.get('name', 'Student')},\n\n"
+        f"You have been admitted. Your student ID is {student['student_id']}.\n"
+        f"Total fees: {student.get('total_fees', 0)}\n",
+        "admission",
+        dedupe_key=f"admission:{student['student_id']}",
+    )
+
+
+def receipt_email(to: str, payment: Dict[str, Any], name: Optional[str] = None) -> Dict[str, Any]:
+    return new_email(
+        to,
+        f"Fee receipt {payment['payment_id']}",
+        f"Dear {name or 'Student'},\n\n"
+        f"We received your payment of {payment['amount']}.\n"
+        f"Paid so far: {payment['paid_fees']}\n"
+        f"Remaining: {payment['remaining_fees']}\n"
+        f"Receipt number: {payment['payment_id']}\n",
+        "fee_receipt",
+        dedupe_key=f"receipt:{payment['payment_id']}",
+    )
+
+
+def result_email(to: str, score: Any, name: Optional[str] = None) -> Dict[str, Any]:
+    return new_email(
+        to,
+        "Your result has been published",
+        f"Dear {name or 'Student'},\n\nYour result has been updated to {score}.\n",
+        "result",
+    )
+
+
+class SMTPSender:
+    """Delivers messages over one reused SMTP connection.
+
+    Blocking smtplib calls, so it must only be used from a single worker
+    thread. Configured through ERP_SMTP_HOST, ERP_SMTP_PORT, ERP_SMTP_USER,
+    ERP_SMTP_PASSWORD, ERP_SMTP_STARTTLS and ERP_MAIL_FROM; for local testing
+    point it at a stand-in such as ``python -m aiosmtpd -n -l localhost:8025``.
+    """
+
+    def __init__(
+        self,
+        host: Optional[str] = None,
+        port: Optional[int] = None,
+        username: Optional[str] = None,
+        password: Optional[str] = None,
+        starttls: Optional[bool] = None,
+        sender: Optional[str] = None,
+        timeout: float = 30,
+    ):
+        self.host = host or os.getenv("ERP_SMTP_HOST")
+        self.port = port or int(os.getenv("ERP_SMTP_PORT", "25"))
+        self.username = username or os.getenv("ERP_SMTP_USER")
+        self.password = password or os.getenv("ERP_SMTP_PASSWORD")
+        self.starttls = starttls if starttls is not None else os.getenv("ERP_SMTP_STARTTLS", "0") == "1"
+        self.sender = sender or os.getenv("ERP_MAIL_FROM", "erp@localhost")
+        self.timeout = timeout
+        self._smtp: Optional[smtplib.SMTP] = None
+        self.connections = 0
+
+    def _connect(self) -> smtplib.SMTP:
+        smtp = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        if self.starttls:
+            smtp.starttls()
+        if self.username:
+            smtp.login(self.username, self.password or "")
+        self.connections += 1
+        return smtp
+
+    def _send_one(self, message: EmailMessage):
+        if self._smtp is None:
+            self._smtp = self._connect()
+        try:
+            self._smtp.send_message(message)
+        except smtplib.SMTPServerDisconnected:
+            # The server closed an idle connection; reconnect once
+            self._smtp = self._connect()
+            self._smtp.send_message(message)
+
+    def send(self, messages: List[EmailMessage]) -> List[SendResult]:
+        results: List[SendResult] = []
+        for position, message in enumerate(messages):
+            try:
+                self._send_one(message)
+                results.append(None)
+            except smtplib.SMTPRecipientsRefused as e:
+                # 5xx replies will not change on retry; 4xx are temporary
+                codes = [code for code, _ in e.recipients.values()]
+                results.append((f"Recipient refused: {e.recipients}", all(code >= 500 for code in codes)))
+            except smtplib.SMTPResponseException as e:
+                error = e.smtp_error.decode("utf-8", "replace") if isinstance(e.smtp_error, bytes) else str(e.smtp_error)
+                results.append((f"{e.smtp_code} {error}", e.smtp_code >= 500))
+            except (smtplib.SMTPException, OSError) as e:
+                # Connection trouble: leave the rest of the batch for the next attempt
+                self.close()
+                results.extend([(f"SMTP connection failed: {e}", False)] * (len(messages) - position))
+                break
+        return results
+
+    def close(self):
+        if self._smtp is None:
+            return
+        try:
+            self._smtp.quit()
+        except (smtplib.SMTPException, OSError):
+            pass
+        self._smtp = None
+
+
+class EmailOutbox:
+    """Email queued in MongoDB by request handlers and sent by a background task.
+
+    Handlers only pay for an insert. The sender claims due messages in
+    batches (stamping a batch id so several processes never send the same
+    message), delivers them over one SMTP connection on a dedicated thread,
+    retries temporary failures with exponential backoff and stays under
+    ``rate_per_minute`` messages across all processes.
+
+    The limit is a counter per wall-clock minute in ``rate_collection``.
+    Before claiming a batch, a sender reserves a share of the counter with
+    ``$inc``. It then returns whatever it did not attempt, so a sender with
+    little due mail does not starve the others.
+    """
+
+    def __init__(
+        self,
+        collection,
+        rate_collection,
+        sender: Optional[SMTPSender] = None,
+        batch_size: int = BATCH_SIZE,
+        rate_per_minute: int = RATE_PER_MINUTE,
+        max_attempts: int = MAX_ATTEMPTS,
+    ):
+        self.collection = collection
+        self.rate_collection = rate_collection
+        self.sender = sender or SMTPSender()
+        self.batch_size = batch_size
+        self.rate_per_minute = rate_per_minute
+        self.max_attempts = max_attempts
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._last_send = 0.0
+
+        self.enqueued = 0
+        self.sent = 0
+        self.retried = 0
+        self.failed = 0
+        self.rate_limited = 0
+
+    async def enqueue(self, emails: List[Dict[str, Any]]):
+        """Queue messages with one insert; never fails the request that triggered them."""
+        if not emails:
+            return
+        try:
+            result = await self.collection.insert_many(emails, ordered=False)
+            inserted = len(result.inserted_ids)
+        except BulkWriteError as e:
+            errors = e.details.get("writeErrors", [])
+            for error in errors:
+                if error.get("code") != DUPLICATE_KEY_ERROR:
+                    logging.error(f"❌ Could not queue email: {error.get('errmsg')}")
+            inserted = e.details.get("nInserted", 0)
+        except Exception as e:
+            logging.error(f"❌ Could not queue {len(emails)} emails: {e}")
+            return
+        self.enqueued += inserted
+        self._wakeup.set()
+
+    async def _reserve(self, wanted: int) -> Tuple[datetime, int]:
+        """Take up to ``wanted`` sends from this minute's shared allowance.
+
+        Returns the window and the number granted. The counter is
+        incremented by ``wanted`` even when less is granted; the caller
+        hands back the difference through ``_release``.
+        """
+        window = datetime.utcnow().replace(second=0, microsecond=0)
+        counter = await self.rate_collection.find_one_and_update(
+            {"_id": window},
+            {"$inc": {"reserved": wanted}, "$setOnInsert": {"expires_at": window + timedelta(minutes=2)}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        before = counter["reserved"] - wanted
+        return window, max(min(wanted, self.rate_per_minute - before), 0)
+
+    async def _release(self, window: datetime, unused: int):
+        if unused > 0:
+            await self.rate_collection.update_one({"_id": window}, {"$inc": {"reserved": -unused}})
+
+    async def _claim(self, limit: int) -> List[Dict[str, Any]]:
+        now = datetime.utcnow()
+        # next_attempt_at doubles as the lease, so one index finds both new and abandoned mail
+        due = {"status": {"$in": [PENDING, SENDING]}, "next_attempt_at": {"$lte": now}}
+        candidates = await self.collection.find(due, {"_id": 1}).sort("next_attempt_at", 1).limit(limit).to_list(length=limit)
+        if not candidates:
+            return []
+
+        batch_id = ObjectId()
+        await self.collection.update_many(
+            {**due, "_id": {"$in": [doc["_id"] for doc in candidates]}},
+            {"$set": {
+                "status": SENDING,
+                "batch_id": batch_id,
+                "next_attempt_at": now + timedelta(seconds=LEASE_SECONDS),
+            }},
+        )
+        return await self.collection.find({"batch_id": batch_id}).to_list(length=limit)
+
+    def _message(self, email: Dict[str, Any]) -> EmailMessage:
+        message = EmailMessage()
+        message["From"] = self.sender.sender
+        message["To"] = email["to"]
+        message["Subject"] = email["subject"]
+        message.set_content(email["body"])
+        return message
+
+    async def _deliver(self, batch: List[Dict[str, Any]]):
+        loop = asyncio.get_running_loop()
+        results = await loop.run_in_executor(self._executor, self.sender.send, [self._message(email) for email in batch])
+        self._last_send = time.monotonic()
+
+        now = datetime.utcnow()
+        operations = []
+        for email, result in zip(batch, results):
+            attempts = email.get("attempts", 0) + 1
+            if result is None:
+                self.sent += 1
+                update = {"status": SENT, "sent_at": now, "attempts": attempts}
+            elif result[1] or attempts >= self.max_attempts:
+                logging.error(f"❌ Giving up on email {email['_id']} to {email['to']}: {result[0]}")
+                self.failed += 1
+                update = {"status": FAILED, "last_error": result[0], "attempts": attempts}
+            else:
+                self.retried += 1
+                delay = min(BACKOFF_SECONDS * 2 ** (attempts - 1), BACKOFF_MAX_SECONDS) * random.uniform(0.5, 1)
+                update = {
+                    "status": PENDING,
+                    "last_error": result[0],
+                    "attempts": attempts,
+                    "next_attempt_at": now + timedelta(seconds=delay),
+                }
+            operations.append(UpdateOne({"_id": email["_id"], "batch_id": email["batch_id"]}, {"$set": update}))
+        await self.collection.bulk_write(operations, ordered=False)
+
+    async def _wait(self, timeout: float):
+        self._wakeup.clear()
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch: List[Dict[str, Any]] = []
+            try:
+                window, allowance = await self._reserve(self.batch_size)
+                try:
+                    if allowance > 0:
+                        batch = await self._claim(allowance)
+                finally:
+                    # Every claimed message counts as attempted, delivered or not
+                    await self._release(window, self.batch_size - len(batch))
+                if allowance <= 0:
+                    # Limit reached across all senders: wait for the next minute
+                    self.rate_limited += 1
+                    await asyncio.sleep(max((window + timedelta(minutes=1) - datetime.utcnow()).total_seconds(), 0.1))
+                    continue
+                if batch:
+                    await self._deliver(batch)
+                    continue
+            except Exception as e:
+                logging.error(f"❌ Email outbox batch failed: {e}")
+
+            if self._last_send and time.monotonic() - self._last_send > IDLE_SECONDS:
+                await loop.run_in_executor(self._executor, self.sender.close)
+                self._last_send = 0.0
+            await self._wait(POLL_SECONDS)
+
+    async def start(self):
+        if not self.sender.host:
+            logging.warning("⚠️ ERP_SMTP_HOST is not set; emails are queued but not sent")
+            return
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="smtp")
+        self._task = asyncio.create_task(self._run())
+        logging.info(f"📧 Email sender started: {self.sender.host}:{self.sender.port}, {self.rate_per_minute}/min")
+
+    async def shutdown(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        # Mail claimed by the cancelled batch is retried once its lease expires
+        await asyncio.get_running_loop().run_in_executor(self._executor, self.sender.close)
+        self._executor.shutdown(wait=False)
+        self._executor = None
+
+    async def counts(self) -> Dict[str, int]:
+        statuses = (PENDING, SENDING, SENT, FAILED)
+        totals = await asyncio.gather(*(self.collection.count_documents({"status": status}) for status in statuses))
+        return dict(zip(statuses, totals))
+
+    def stats(self) -> dict:
+        return {
+            "running": int(self._task is not None),
+            "enqueued": self.enqueued,
+            "sent": self.sent,
+            "retried": self.retried,
+            "failed": self.failed,
+            "smtp_connections": self.sender.connections,
+            "rate_limited": self.rate_limited,
+        }
+
+
+email_outbox = EmailOutbox(mongo.collection(OUTBOX_COLLECTION), mongo.collection(RATE_COLLECTION))
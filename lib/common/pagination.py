@@ -0,0 +1,57 @@
+import json
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+# Hard cap on page size so a single request can never pull the whole collection
+MAX_PAGE_SIZE = 500
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+
+def clamp_limit(limit: int) -> int:
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+
+def keyset_filter(base_filter: Dict[str, Any], key: str, after: Optional[str]) -> Dict[str, Any]:
+    """Combine ``base_filter`` with a ``key > after`` bound for keyset pagination.
+
+    The first page is bounded by ``key > ""`` so documents that lack the key
+    (e.g. bare signups without a ``student_id``) can never break the ordering.
+    """
+    bound = {key: {"$gt": after if after is not None else ""}}
+    if not base_filter:
+        return bound
+    return {"$and": [base_filter, bound]}
+
+
+async def fetch_page(
+    collection,
+    base_filter: Dict[str, Any],
+    projection: Dict[str, Any],
+    key: str,
+    limit: int,
+    after: Optional[str] = None,
+) -> Tuple[List[dict], Optional[str]]:
+    """Return one page sorted on ``key`` and the cursor for the next page.
+
+    One extra document is fetched to know whether another page exists, so the
+    last page never hands out a cursor that leads to an empty response.
+    """
+    limit = clamp_limit(limit)
+    cursor = (
+        collection.find(keyset_filter(base_filter, key, after), projection)
+        .sort(key, 1)
+        .limit(limit + 1)
+    )
+    docs = await cursor.to_list(length=limit + 1)
+
+    next_cursor = None
+    if len(docs) > limit:
+        docs = docs[:limit]
+        next_cursor = docs[-1].get(key)
+    return docs, next_cursor
+
+
+async def ndjson_stream(cursor) -> AsyncIterator[bytes]:
+    """Encode documents from a Motor cursor as NDJSON, one line per document."""
+    async for doc in cursor:
+        yield (json.dumps(doc, default=str) + "\n").encode("utf-8")
@@ -0,0 +1,129 @@
+import asyncio
+import logging
+import os
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, List, Optional
+
+from fastapi import HTTPException
+from passlib.context import CryptContext
+
+# Module-level so the worker functions stay picklable for the process pool
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+
+def _timed(fn, *args):
+    # time.monotonic is system-wide, so it is comparable across pool processes
+    return time.monotonic(), fn(*args)
+
+
+def _hash(password: str) -> str:
+    return pwd_context.hash(password)
+
+
+def _verify(password: str, hashed: str) -> bool:
+    return pwd_context.verify(password, hashed)
+
+
+class PasswordService:
+    """Runs bcrypt hashing/verification on a bounded worker pool.
+
+    At most ``max_queue`` operations may be queued or running at once; beyond
+    that callers get a 503 instead of waiting behind an ever-growing backlog.
+    Configured through ERP_PASSWORD_POOL (``thread`` or ``process``),
+    ERP_PASSWORD_WORKERS and ERP_PASSWORD_MAX_QUEUE.
+    """
+
+    def __init__(
+        self,
+        workers: Optional[int] = None,
+        max_queue: Optional[int] = None,
+        pool: Optional[str] = None,
+    ):
+        self.workers = workers or int(os.getenv("ERP_PASSWORD_WORKERS", os.cpu_count() or 2))
+        self.max_queue = max_queue or int(os.getenv("ERP_PASSWORD_MAX_QUEUE", self.workers * 16))
+        self.pool = pool or os.getenv("ERP_PASSWORD_POOL", "thread")
+        self._executor: Optional[Executor] = None
+        self._in_flight = 0
+
+        self.completed = 0
+        self.rejected = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self.run_seconds_total = 0.0
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.pool == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bcrypt")
+            logging.info(f"🔐 Password pool started: {self.workers} {self.pool} workers, queue cap {self.max_queue}")
+        return self._executor
+
+    async def _run(self, fn, *args):
+        if self._in_flight >= self.max_queue:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=503,
+                detail="Server is busy, please retry shortly",
+                headers={"Retry-After": "1"},
+            )
+
+        self._in_flight += 1
+        submitted = time.monotonic()
+        try:
+            loop = asyncio.get_running_loop()
+            started, result = await loop.run_in_executor(self._get_executor(), _timed, fn, *args)
+        finally:
+            self._in_flight -= 1
+
+        wait = max(started - submitted, 0.0)
+        self.completed += 1
+        self.run_seconds_total += max(time.monotonic() - started, 0.0)
+        self.wait_seconds_total += wait
+        self.wait_seconds_max = max(self.wait_seconds_max, wait)
+        return result
+
+    async def hash(self, password: str) -> str:
+        return await self._run(_hash, password)
+
+    async def verify(self, password: str, hashed: str) -> bool:
+        return await self._run(_verify, password, hashed)
+
+    async def hash_many(
+        self, passwords: List[str], concurrency: Optional[int] = None, return_exceptions: bool = False
+    ) -> List[Any]:
+        """Hash a batch in parallel while leaving pool capacity for interactive logins.
+
+        With ``return_exceptions`` a rejected or failed hash is returned in
+        place of its result instead of aborting the whole batch.
+        """
+        semaphore = asyncio.Semaphore(concurrency or max(1, self.workers // 2))
+
+        async def hash_one(password: str) -> str:
+            async with semaphore:
+                return await self.hash(password)
+
+        return await asyncio.gather(*(hash_one(password) for password in passwords), return_exceptions=return_exceptions)
+
+    def stats(self) -> dict:
+        return {
+            "pool": self.pool,
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "in_flight": self._in_flight,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "avg_queue_wait_ms": round(self.wait_seconds_total / self.completed * 1000, 3) if self.completed else 0.0,
+            "max_queue_wait_ms": round(self.wait_seconds_max * 1000, 3),
+            "avg_run_ms": round(self.run_seconds_total / self.completed * 1000, 3) if self.completed else 0.0,
+        }
+
+    async def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+password_service = PasswordService()
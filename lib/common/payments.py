@@ -0,0 +1,280 @@
+import asyncio
+import logging
+import math
+import os
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+from uuid import uuid4
+
+from bson import ObjectId
+from fastapi import HTTPException
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+LEDGER_COLLECTION = "fee_payments"
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+
+APPLIED = "applied"  # Status of every ledger entry; kept so readers can filter on it
+
+# Recent payments kept on each fee record (not returned to clients)
+APPLIED_FIELD = "applied_payments"
+RECENT_PAYMENTS = 50
+# A payment on a fee record still missing from the ledger after this long lost its request
+LEDGER_GRACE_SECONDS = int(os.getenv("ERP_PAYMENT_GRACE_SECONDS", "30"))
+SWEEP_SECONDS = 60
+# How far back the first sweep after a start looks for such payments
+SWEEP_LOOKBACK = timedelta(hours=24)
+
+
+def payment_update(amount: float, payment_id: str, idempotency_key: str, at: datetime) -> list:
+    """Update pipeline adding ``amount`` to paid_fees and re-deriving remaining_fees.
+
+    Runs server-side in a single atomic write, so concurrent payments can no
+    longer overwrite each other. remaining_fees is clamped at 0 as before.
+    The payment and the resulting totals are appended to a short list on the
+    record; that list is what makes a retry with the same idempotency key a
+    no-op and lets a lost ledger entry be written later.
+    """
+    applied = {
+        "payment_id": {"$literal": payment_id},
+        "idempotency_key": {"$literal": idempotency_key},
+        "amount": {"$literal": amount},
+        "paid_fees": "$paid_fees",
+        "remaining_fees": "$remaining_fees",
+        "at": {"$literal": at},
+    }
+    return [
+        {"$set": {"paid_fees": {"$add": [{"$ifNull": ["$paid_fees", 0]}, amount]}}},
+        {
+            "$set": {
+                "remaining_fees": {
+                    "$max": [{"$subtract": [{"$ifNull": ["$total_fees", 0]}, "$paid_fees"]}, 0]
+                }
+            }
+        },
+        {
+            "$set": {
+                APPLIED_FIELD: {
+                    "$slice": [
+                        {"$concatArrays": [{"$ifNull": [f"${APPLIED_FIELD}", []]}, [applied]]},
+                        -RECENT_PAYMENTS,
+                    ]
+                }
+            }
+        },
+    ]
+
+
+def _undo_update(amount: float, payment_id: str) -> list:
+    return [
+        {"$set": {"paid_fees": {"$subtract": ["$paid_fees", amount]}}},
+        {
+            "$set": {
+                "remaining_fees": {
+                    "$max": [{"$subtract": [{"$ifNull": ["$total_fees", 0]}, "$paid_fees"]}, 0]
+                },
+                APPLIED_FIELD: {
+                    "$filter": {
+                        "input": f"${APPLIED_FIELD}",
+                        "cond": {"$ne": ["$$this.payment_id", {"$literal": payment_id}]},
+                    }
+                },
+            }
+        },
+    ]
+
+
+def _serialize(entry: Dict[str, Any]) -> Dict[str, Any]:
+    entry = dict(entry)
+    entry["payment_id"] = str(entry.pop("_id"))
+    return entry
+
+
+def _same_payment(entry: Dict[str, Any], amount: float, details: Dict[str, Any]) -> bool:
+    return entry["amount"] == amount and all(entry.get(k) == v for k, v in details.items())
+
+
+async def _record(
+    collection,
+    ledger,
+    match: Dict[str, Any],
+    applied: Dict[str, Any],
+    details: Dict[str, Any],
+) -> Dict[str, Any]:
+    """Append a payment already applied to its fee record to the ledger.
+
+    The entry's _id is the payment id, so writing it twice (a retry racing
+    the original request, or the sweeper) finds the first copy and reports
+    ``replayed``. If the idempotency key already belongs to a different
+    payment (a reused key, or one older than the record's recent list), the
+    fee update is undone and the earlier payment is returned instead, or
+    422 when it does not match.
+    """
+    entry = {
+        "_id": ObjectId(applied["payment_id"]),
+        "idempotency_key": applied["idempotency_key"],
+        "amount": applied["amount"],
+        "status": APPLIED,
+        "paid_fees": applied["paid_fees"],
+        "remaining_fees": applied["remaining_fees"],
+        "created_at": applied["at"],
+        **details,
+    }
+    try:
+        await ledger.insert_one(entry)
+        return {**_serialize(entry), "replayed": False}
+    except DuplicateKeyError:
+        existing = await ledger.find_one({"idempotency_key": entry["idempotency_key"]})
+    if existing is None:
+        raise HTTPException(status_code=409, detail="Payment conflicts with an existing ledger entry")
+    if existing["_id"] != entry["_id"]:
+        logging.warning(f"⚠️ Idempotency key reused; undoing payment {entry['_id']}")
+        await collection.update_one(
+            {**match, f"{APPLIED_FIELD}.payment_id": applied["payment_id"]},
+            _undo_update(applied["amount"], applied["payment_id"]),
+        )
+        if not _same_payment(existing, entry["amount"], details):
+            raise HTTPException(status_code=422, detail="Idempotency key was already used for a different payment")
+    return {**_serialize(existing), "replayed": True}
+
+
+async def apply_payment(
+    collection,
+    ledger,
+    match: Dict[str, Any],
+    amount: float,
+    details: Dict[str, Any],
+    idempotency_key: Optional[str] = None,
+    projection: Optional[Dict[str, Any]] = None,
+) -> Optional[Dict[str, Any]]:
+    """Apply a payment atomically and append it to the ledger: two writes.
+
+    The fee update only matches a record that has not seen this idempotency
+    key, so a retried request finds the earlier payment on the record and
+    gets its result back instead of paying twice. If the request dies
+    between the two writes, the retry (or PaymentLedgerSweeper) writes the
+    missing ledger entry. Returns None when ``match`` selects no fee record.
+    Fields in ``projection`` are read back from the record and returned as
+    ``document`` unless the result is a replay.
+    """
+    if isinstance(amount, bool) or not isinstance(amount, (int, float)) or not math.isfinite(amount):
+        raise HTTPException(status_code=400, detail="Payment amount must be a number")
+    if amount <= 0:
+        raise HTTPException(status_code=400, detail="Payment amount must be greater than zero")
+
+    key = idempotency_key or uuid4().hex
+    applied = {"payment_id": str(ObjectId()), "idempotency_key": key, "amount": amount, "at": datetime.utcnow()}
+    fields = {"_id": 0, **(projection or {})}
+    document = await collection.find_one_and_update(
+        {**match, f"{APPLIED_FIELD}.idempotency_key": {"$ne": key}},
+        payment_update(amount, applied["payment_id"], key, applied["at"]),
+        projection={**fields, "paid_fees": 1, "remaining_fees": 1},
+        return_document=ReturnDocument.AFTER,
+    )
+    if document is None:
+        # Either the record is missing or an earlier attempt already applied this key
+        record = await collection.find_one(
+            {**match, f"{APPLIED_FIELD}.idempotency_key": key},
+            {**fields, APPLIED_FIELD: {"$elemMatch": {"idempotency_key": key}}},
+        )
+        if record is None:
+            return None
+        applied = record.pop(APPLIED_FIELD)[0]
+        if applied["amount"] != amount:
+            raise HTTPException(status_code=422, detail="Idempotency key was already used for a different payment")
+        document = record
+    else:
+        applied.update(paid_fees=document["paid_fees"], remaining_fees=document["remaining_fees"])
+
+    result = await _record(collection, ledger, match, applied, details)
+    if not result["replayed"]:
+        result["document"] = document
+    return result
+
+
+class PaymentLedgerSweeper:
+    """Writes the ledger entries of payments whose request died after the fee update.
+
+    Such a payment is on the fee record (in its recent-payments list) but
+    missing from receipts, payment history and fee summary rebuilds until
+    the client retries. Each sweep looks at payments made since the last
+    one, older than LEDGER_GRACE_SECONDS so requests still in flight finish
+    first. ``match_fields`` locate the fee record and, with ``source``, form
+    the ledger entry's details. ``on_applied`` receives every payment this
+    sweep recorded, with the record's ``projection`` fields as ``document``.
+    """
+
+    def __init__(
+        self,
+        collection,
+        ledger,
+        source: str,
+        match_fields: Tuple[str, ...],
+        projection: Optional[Dict[str, Any]] = None,
+        on_applied: Optional[Callable[[Dict[str, Any]], Awaitable[None]]] = None,
+    ):
+        self.collection = collection
+        self.ledger = ledger
+        self.source = source
+        self.match_fields = match_fields
+        self.projection = projection
+        self.on_applied = on_applied
+        self._checked_until: Optional[datetime] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def sweep(self) -> int:
+        cutoff = datetime.utcnow() - timedelta(seconds=LEDGER_GRACE_SECONDS)
+        since = self._checked_until or cutoff - SWEEP_LOOKBACK
+        window = {"$gte": since, "$lt": cutoff}
+        fields = {"_id": 0, APPLIED_FIELD: 1, **{field: 1 for field in self.match_fields}, **(self.projection or {})}
+        recorded = 0
+        async for record in self.collection.find({f"{APPLIED_FIELD}.at": window}, fields):
+            applied = [entry for entry in record.pop(APPLIED_FIELD, []) if since <= entry.get("at", cutoff) < cutoff]
+            if not applied:
+                continue
+            ids = [ObjectId(entry["payment_id"]) for entry in applied]
+            known = {str(entry["_id"]) async for entry in self.ledger.find({"_id": {"$in": ids}}, {"_id": 1})}
+            match = {field: record.get(field) for field in self.match_fields}
+            for entry in applied:
+                if entry["payment_id"] in known:
+                    continue
+                result = await _record(self.collection, self.ledger, match, entry, {**match, "source": self.source})
+                if result["replayed"]:
+                    continue
+                recorded += 1
+                if self.on_applied:
+                    await self.on_applied({**result, "document": record})
+        self._checked_until = cutoff
+        if recorded:
+            logging.info(f"✅ Recorded {recorded} {self.source} payments missing from the ledger")
+        return recorded
+
+    async def _run(self):
+        while True:
+            try:
+                await self.sweep()
+            except Exception as e:
+                logging.error(f"❌ Payment ledger sweep failed: {e}")
+            await asyncio.sleep(SWEEP_SECONDS)
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def shutdown(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+
+async def payment_history(ledger, match: Dict[str, Any], limit: int = 100) -> list:
+    cursor = ledger.find({**match, "status": APPLIED}).sort("created_at", 1).limit(limit)
+    return [_serialize(entry) async for entry in cursor]
+
+
+async def get_payment(ledger, payment_id: str) -> Optional[Dict[str, Any]]:
+    if not ObjectId.is_valid(payment_id):
+        return None
+    entry = await ledger.find_one({"_id": ObjectId(payment_id), "status": APPLIED})
+    return _serialize(entry) if entry else None
@@ -0,0 +1,191 @@
+import asyncio
+import base64
+import binascii
+import hashlib
+import io
+import logging
+import os
+import re
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, Optional, Tuple
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from fastapi import HTTPException
+from gridfs.errors import NoFile
+from motor.motor_asyncio import AsyncIOMotorGridFSBucket
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+PICTURES_BUCKET = "profile_pictures"
+PICTURE_FIELD = "picture"  # Reference stored on student_profiles instead of the image
+LEGACY_FIELD = "profile_picture"  # Old inline base64 image
+UNREADABLE_FIELD = "legacy_profile_picture"  # Inline images the migration could not decode, kept for inspection
+
+MAX_PICTURE_BYTES = int(os.getenv("ERP_MAX_PICTURE_BYTES", str(5 * 1024 * 1024)))
+THUMBNAIL_SIZE = (160, 160)
+THUMBNAIL_CONTENT_TYPE = "image/jpeg"
+ORIGINAL = "original"
+THUMBNAIL = "thumbnail"
+STREAM_CHUNK_BYTES = 255 * 1024  # GridFS default chunk size
+
+_RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def decode_inline_picture(value: str) -> bytes:
+    """Bytes of a base64 picture as the profile pages send it (data: URLs accepted too)."""
+    if value.startswith("data:") and "," in value:
+        value = value.split(",", 1)[1]
+    try:
+        return base64.b64decode(value, validate=True)
+    except (binascii.Error, ValueError):
+        raise HTTPException(status_code=400, detail="Profile picture must be base64-encoded image data")
+
+
+def _process_image(data: bytes) -> Tuple[str, bytes]:
+    """Validate an upload and render its thumbnail; runs off the event loop."""
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            content_type = Image.MIME.get(image.format)
+            image = ImageOps.exif_transpose(image)
+            thumbnail = ImageOps.fit(image.convert("RGB"), THUMBNAIL_SIZE, Image.LANCZOS)
+    except (UnidentifiedImageError, OSError, Image.DecompressionBombError):
+        raise HTTPException(status_code=400, detail="Profile picture is not a valid image")
+    if not content_type:
+        raise HTTPException(status_code=400, detail="Unsupported image format")
+
+    buffer = io.BytesIO()
+    thumbnail.save(buffer, "JPEG", quality=85, optimize=True)
+    return content_type, buffer.getvalue()
+
+
+def _etag(data: bytes) -> str:
+    return f'"{hashlib.sha256(data).hexdigest()[:32]}"'
+
+
+def is_stored(reference: Optional[Dict[str, Any]], data: bytes) -> bool:
+    """Whether ``data`` is already the stored original or thumbnail, e.g. a thumbnail the app echoes back."""
+    etag = _etag(data)
+    return any(((reference or {}).get(kind) or {}).get("etag") == etag for kind in (ORIGINAL, THUMBNAIL))
+
+
+async def store_picture(bucket: AsyncIOMotorGridFSBucket, email: str, data: bytes) -> Dict[str, Any]:
+    """Save the original and its thumbnail to GridFS and return the profile reference."""
+    if not data:
+        raise HTTPException(status_code=400, detail="Profile picture is empty")
+    if len(data) > MAX_PICTURE_BYTES:
+        raise HTTPException(status_code=413, detail=f"Profile picture exceeds {MAX_PICTURE_BYTES} bytes")
+
+    content_type, thumbnail = await asyncio.to_thread(_process_image, data)
+
+    reference = {"updated_at": datetime.utcnow().isoformat()}
+    for kind, body, body_type in ((ORIGINAL, data, content_type), (THUMBNAIL, thumbnail, THUMBNAIL_CONTENT_TYPE)):
+        etag = _etag(body)
+        file_id = await bucket.upload_from_stream(
+            f"{email}-{kind}",
+            body,
+            metadata={"email": email, "kind": kind, "content_type": body_type, "etag": etag},
+        )
+        # Stored as plain strings so profile documents stay JSON-serializable
+        reference[kind] = {"file_id": str(file_id), "content_type": body_type, "length": len(body), "etag": etag}
+    return reference
+
+
+async def delete_picture(bucket: AsyncIOMotorGridFSBucket, reference: Optional[Dict[str, Any]]):
+    """Best-effort removal of a replaced picture; a leftover file only wastes space."""
+    for kind in (ORIGINAL, THUMBNAIL):
+        file_id = ((reference or {}).get(kind) or {}).get("file_id")
+        if not file_id:
+            continue
+        try:
+            await bucket.delete(ObjectId(file_id))
+        except Exception as e:
+            logging.warning(f"⚠️ Could not delete old profile picture {file_id}: {e}")
+
+
+async def read_thumbnail(bucket: AsyncIOMotorGridFSBucket, reference: Optional[Dict[str, Any]]) -> str:
+    """Base64 thumbnail for clients that still expect an inline ``profile_picture``."""
+    file_id = ((reference or {}).get(THUMBNAIL) or {}).get("file_id")
+    if not file_id:
+        return ""
+    try:
+        stream = await bucket.open_download_stream(ObjectId(file_id))
+    except (NoFile, InvalidId):
+        # A missing file reads as "no picture" rather than failing the whole profile
+        logging.warning(f"⚠️ Profile thumbnail {file_id} is missing from GridFS")
+        return ""
+    return base64.b64encode(await stream.read()).decode("ascii")
+
+
+def parse_range(header: Optional[str], length: int) -> Optional[Tuple[int, int]]:
+    """Inclusive (start, end) for a single ``bytes=`` range, None for the whole file.
+
+    Raises 416 for ranges that cannot be satisfied; multi-range requests are
+    served as the whole file, which RFC 9110 allows.
+    """
+    if not header:
+        return None
+    match = _RANGE.match(header.strip())
+    if not match or (not match.group(1) and not match.group(2)):
+        return None
+
+    first, last = match.group(1), match.group(2)
+    if not first:
+        start, end = max(length - int(last), 0), length - 1
+    else:
+        start = int(first)
+        end = min(int(last), length - 1) if last else length - 1
+    if start >= length or start > end:
+        raise HTTPException(
+            status_code=416,
+            detail="Requested range not satisfiable",
+            headers={"Content-Range": f"bytes */{length}"},
+        )
+    return start, end
+
+
+async def open_picture(bucket: AsyncIOMotorGridFSBucket, reference: Optional[Dict[str, Any]], kind: str):
+    entry = (reference or {}).get(kind) or {}
+    try:
+        file_id = ObjectId(entry.get("file_id"))
+    except (InvalidId, TypeError):
+        raise HTTPException(status_code=404, detail="Profile picture not found")
+    try:
+        return entry, await bucket.open_download_stream(file_id)
+    except NoFile:
+        raise HTTPException(status_code=404, detail="Profile picture not found")
+
+
+async def stream_range(grid_out, start: int, end: int) -> AsyncIterator[bytes]:
+    grid_out.seek(start)
+    remaining = end - start + 1
+    while remaining > 0:
+        chunk = await grid_out.read(min(STREAM_CHUNK_BYTES, remaining))
+        if not chunk:
+            break
+        remaining -= len(chunk)
+        yield chunk
+
+
+async def migrate_inline_pictures(db):
+    """Move base64 ``profile_picture`` strings out of student_profiles into GridFS."""
+    profiles = db.student_profiles
+    bucket = AsyncIOMotorGridFSBucket(db, bucket_name=PICTURES_BUCKET)
+    moved = kept = 0
+    async for profile in profiles.find({LEGACY_FIELD: {"$exists": True}}, {"email": 1, LEGACY_FIELD: 1}):
+        update: Dict[str, Any] = {"$unset": {LEGACY_FIELD: ""}}
+        inline = profile.get(LEGACY_FIELD)
+        if inline:
+            try:
+                update["$set"] = {PICTURE_FIELD: await store_picture(bucket, profile.get("email", ""), decode_inline_picture(inline))}
+                moved += 1
+            except HTTPException as e:
+                # Set aside rather than deleted, so the original data can still be recovered by hand
+                logging.warning(
+                    f"⚠️ Keeping unreadable profile picture for {profile.get('email')} in {UNREADABLE_FIELD}: {e.detail}"
+                )
+                update["$set"] = {UNREADABLE_FIELD: inline}
+                kept += 1
+        await profiles.update_one({"_id": profile["_id"]}, update)
+
+    if moved or kept:
+        logging.info(f"✅ Moved {moved} profile pictures into GridFS ({kept} unreadable kept in {UNREADABLE_FIELD})")
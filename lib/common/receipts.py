@@ -0,0 +1,141 @@
+import asyncio
+import zipfile
+from collections import defaultdict
+from datetime import datetime
+from tempfile import SpooledTemporaryFile
+from typing import Any, Dict, List
+
+from lib.common.payments import APPLIED_FIELD
+
+RECEIPTS_BUCKET = "receipts"
+RECEIPT_JOB = "receipt_batch"
+
+# Receipts are rendered and zipped this many at a time
+CHUNK_SIZE = 200
+ZIP_SPOOL_BYTES = 16 * 1024 * 1024
+
+
+def _pdf_text(text: str) -> str:
+    text = text.encode("latin-1", "replace").decode("latin-1")
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def render_pdf(lines: List[str]) -> bytes:
+    """Render lines of text onto a single-page PDF using the built-in Helvetica font."""
+    content = "BT /F1 12 Tf 16 TL 72 780 Td\n"
+    content += "".join(f"({_pdf_text(line)}) '\n" for line in lines)
+    content += "ET"
+    stream = content.encode("latin-1")
+
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+        b"/Resources << /Font << /F1 4 0 R >> >> /Contents 5 0 R >>",
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+        b"<< /Length " + str(len(stream)).encode() + b" >>\nstream\n" + stream + b"\nendstream",
+    ]
+
+    pdf = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(pdf))
+        pdf += f"{number} 0 obj\n".encode() + body + b"\nendobj\n"
+    xref = len(pdf)
+    pdf += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    pdf += "".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode()
+    pdf += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    return bytes(pdf)
+
+
+def receipt_lines(fees: Dict[str, Any], payments: List[Dict[str, Any]]) -> List[str]:
+    lines = [
+        "studentERP - Fee Receipt",
+        "",
+        f"Email: {fees.get('email', '')}",
+        f"Academic Year: {fees.get('academic_year', '')}",
+        f"Total Fees: {fees.get('total_fees', 0)}",
+        f"Paid Fees: {fees.get('paid_fees', 0)}",
+        f"Remaining Fees: {fees.get('remaining_fees', 0)}",
+        f"Exam Fees: {fees.get('exam_fees', 0)} (paid {fees.get('paid_exam_fees', 0)})",
+        "",
+        "Payments:",
+    ]
+    for payment in payments or []:
+        created = payment.get("created_at")
+        created = created.strftime("%Y-%m-%d %H:%M") if isinstance(created, datetime) else str(created or "")
+        lines.append(f"  {created}  {payment.get('amount')}  (ref {payment.get('payment_id', payment.get('_id', ''))})")
+    if not payments:
+        lines.append("  No payments recorded")
+    lines += ["", f"Generated: {datetime.utcnow().strftime('%Y-%m-%d %H:%M')} UTC"]
+    return lines
+
+
+def render_receipt(fees: Dict[str, Any], payments: List[Dict[str, Any]]) -> bytes:
+    return render_pdf(receipt_lines(fees, payments))
+
+
+def receipt_filename(fees: Dict[str, Any]) -> str:
+    safe = "".join(c if c.isalnum() or c in "@._-" else "_" for c in f"{fees.get('email')}_{fees.get('academic_year')}")
+    return f"receipt_{safe}.pdf"
+
+
+def _write_chunk(archive: zipfile.ZipFile, chunk: List[Dict[str, Any]], payments: Dict[tuple, list]):
+    for fees in chunk:
+        key = (fees.get("email"), fees.get("academic_year"))
+        archive.writestr(receipt_filename(fees), render_receipt(fees, payments.get(key, [])))
+
+
+async def _flush(loop, archive, chunk, ledger) -> int:
+    payments = defaultdict(list)
+    cursor = ledger.find(
+        {"email": {"$in": [fees.get("email") for fees in chunk]}, "status": "applied"},
+        {"_id": 1, "email": 1, "academic_year": 1, "amount": 1, "created_at": 1},
+    ).sort("created_at", 1)
+    async for payment in cursor:
+        payment["payment_id"] = str(payment.pop("_id"))
+        payments[(payment.get("email"), payment.get("academic_year"))].append(payment)
+
+    # Rendering and compression are CPU work; keep them off the event loop
+    await loop.run_in_executor(None, _write_chunk, archive, chunk, payments)
+    return len(chunk)
+
+
+def receipt_batch_handler(fees_collection, students_collection, ledger, bucket):
+    """Build the job handler that zips receipts for an academic year and/or course."""
+
+    async def handler(job, progress):
+        params = job["params"]
+        query: Dict[str, Any] = {}
+        if params.get("academic_year"):
+            query["academic_year"] = params["academic_year"]
+        if params.get("course"):
+            emails = await students_collection.distinct("email", {"course": params["course"]})
+            query["email"] = {"$in": emails}
+
+        total = await fees_collection.count_documents(query)
+        await progress(0, total)
+
+        loop = asyncio.get_running_loop()
+        done = 0
+        with SpooledTemporaryFile(max_size=ZIP_SPOOL_BYTES) as spool:
+            with zipfile.ZipFile(spool, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+                chunk: List[Dict[str, Any]] = []
+                cursor = fees_collection.find(query, {"_id": 0, APPLIED_FIELD: 0}).sort([("email", 1), ("academic_year", 1)])
+                async for fees in cursor:
+                    chunk.append(fees)
+                    if len(chunk) >= CHUNK_SIZE:
+                        done += await _flush(loop, archive, chunk, ledger)
+                        await progress(done, total)
+                        chunk = []
+                if chunk:
+                    done += await _flush(loop, archive, chunk, ledger)
+                    await progress(done, total)
+
+            spool.seek(0)
+            filename = f"receipts_{job['_id']}.zip"
+            file_id = await bucket.upload_from_stream(filename, spool, metadata={"job_id": job["_id"]})
+
+        return {"file_id": str(file_id), "filename": filename, "receipts": done}
+
+    return handler
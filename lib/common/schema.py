@@ -0,0 +1,277 @@
+import logging
+import os
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from pymongo import ASCENDING, DESCENDING, TEXT, IndexModel
+from pymongo.errors import DuplicateKeyError
+
+from lib.common.attendance import ATTENDANCE_COLLECTION, ROLLUPS_COLLECTION, migrate_embedded_attendance
+from lib.common.fee_summaries import FEE_SUMMARIES_COLLECTION
+from lib.common.jobs import JOBS_COLLECTION
+from lib.common.leaves import LEAVES_COLLECTION, PENDING, migrate_embedded_leave_requests
+from lib.common.outbox import OUTBOX_COLLECTION, RATE_COLLECTION, SENDING, PENDING as EMAIL_PENDING
+from lib.common.payments import APPLIED_FIELD
+from lib.common.pictures import migrate_inline_pictures
+from lib.common.student_search import SEARCH_FIELD, backfill_search_fields
+from lib.common.timetables import TIMETABLES_COLLECTION
+
+SCHEMA_ID = "studentERP"
+MIGRATIONS_COLLECTION = "schema_migrations"
+
+# Set ERP_SCHEMA_STRICT=1 to refuse to start when a hot query plans as a COLLSCAN
+STRICT_ENV = "ERP_SCHEMA_STRICT"
+
+
+class SchemaError(RuntimeError):
+    pass
+
+
+# ✅ Indexes every service relies on, keyed by collection
+INDEXES: Dict[str, List[IndexModel]] = {
+    "students": [
+        IndexModel([("email", ASCENDING)], name="email_unique", unique=True),
+        # Bare signups have no student_id yet, so only admitted students are unique-checked
+        IndexModel(
+            [("student_id", ASCENDING)],
+            name="student_id_unique",
+            unique=True,
+            partialFilterExpression={"student_id": {"$exists": True}},
+        ),
+        # Admin search: normalized prefix fields plus a whole-word text index
+        IndexModel([(f"{SEARCH_FIELD}.terms", ASCENDING)], name="search_terms"),
+        IndexModel([(f"{SEARCH_FIELD}.name", ASCENDING)], name="search_name"),
+        IndexModel([(f"{SEARCH_FIELD}.email", ASCENDING)], name="search_email"),
+        IndexModel([(f"{SEARCH_FIELD}.student_id", ASCENDING)], name="search_student_id"),
+        IndexModel([(f"{SEARCH_FIELD}.course", ASCENDING)], name="search_course"),
+        # Recent payments, for the sweeper that writes lost ledger entries
+        IndexModel([(f"{APPLIED_FIELD}.at", ASCENDING)], name="applied_payments_at"),
+        IndexModel(
+            [("name", TEXT), ("email", TEXT), ("student_id", TEXT), ("course", TEXT)],
+            name="student_text",
+            weights={"name": 10, "student_id": 5, "email": 3, "course": 1},
+            default_language="none",  # Names should not be stemmed
+        ),
+    ],
+    "admins": [
+        IndexModel([("employee_id", ASCENDING)], name="employee_id_unique", unique=True),
+    ],
+    "fees": [
+        IndexModel(
+            [("email", ASCENDING), ("academic_year", ASCENDING)],
+            name="email_academic_year_unique",
+            unique=True,
+        ),
+        IndexModel([(f"{APPLIED_FIELD}.at", ASCENDING)], name="applied_payments_at"),
+    ],
+    "student_profiles": [
+        IndexModel([("email", ASCENDING)], name="email_unique", unique=True),
+    ],
+    "notifications": [
+        IndexModel(
+            [("student_id", ASCENDING), ("timestamp", DESCENDING)],
+            name="student_id_timestamp",
+        ),
+        # Cross-worker push: connected students' notifications after the last one seen
+        IndexModel([("student_id", ASCENDING), ("_id", ASCENDING)], name="student_id_id"),
+    ],
+    "fee_payments": [
+        IndexModel([("idempotency_key", ASCENDING)], name="idempotency_key_unique", unique=True),
+        IndexModel([("student_id", ASCENDING), ("created_at", ASCENDING)], name="student_id_created_at"),
+        IndexModel(
+            [("email", ASCENDING), ("academic_year", ASCENDING), ("created_at", ASCENDING)],
+            name="email_academic_year_created_at",
+        ),
+    ],
+    ATTENDANCE_COLLECTION: [
+        IndexModel([("email", ASCENDING), ("month", ASCENDING)], name="email_month_unique", unique=True),
+    ],
+    ROLLUPS_COLLECTION: [
+        IndexModel([("email", ASCENDING)], name="email_unique", unique=True),
+    ],
+    TIMETABLES_COLLECTION: [
+        IndexModel([("class_name", ASCENDING)], name="class_name_unique", unique=True),
+    ],
+    JOBS_COLLECTION: [
+        IndexModel([("status", ASCENDING), ("created_at", ASCENDING)], name="status_created_at"),
+    ],
+    FEE_SUMMARIES_COLLECTION: [
+        IndexModel(
+            [("course", ASCENDING), ("academic_year", ASCENDING), ("month", ASCENDING)],
+            name="course_academic_year_month_unique",
+            unique=True,
+        ),
+    ],
+    LEAVES_COLLECTION: [
+        IndexModel([("status", ASCENDING), ("_id", ASCENDING)], name="status_id"),
+        IndexModel([("status", ASCENDING), ("course", ASCENDING), ("_id", ASCENDING)], name="status_course_id"),
+        IndexModel([("email", ASCENDING), ("applied_at", DESCENDING)], name="email_applied_at"),
+        IndexModel([("decision_id", ASCENDING)], name="decision_id", sparse=True),
+        # Only requests moved out of the old embedded arrays carry a legacy_key
+        IndexModel(
+            [("legacy_key", ASCENDING)],
+            name="legacy_key_unique",
+            unique=True,
+            partialFilterExpression={"legacy_key": {"$exists": True}},
+        ),
+    ],
+    OUTBOX_COLLECTION: [
+        # Due mail for the sender; next_attempt_at is also the lease of a claimed batch
+        IndexModel([("status", ASCENDING), ("next_attempt_at", ASCENDING)], name="status_next_attempt_at"),
+        IndexModel([("batch_id", ASCENDING)], name="batch_id", sparse=True),
+        IndexModel(
+            [("dedupe_key", ASCENDING)],
+            name="dedupe_key_unique",
+            unique=True,
+            partialFilterExpression={"dedupe_key": {"$exists": True}},
+        ),
+        # Delivered mail is kept for a month, then removed
+        IndexModel([("sent_at", ASCENDING)], name="sent_at_ttl", expireAfterSeconds=30 * 24 * 3600),
+    ],
+    RATE_COLLECTION: [
+        # Per-minute send counters are only read during their own minute
+        IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+    ],
+}
+
+# ✅ Hot queries that must never plan as a collection scan: (collection, filter, sort)
+HOT_QUERIES: List[Tuple[str, Dict[str, Any], Optional[List[Tuple[str, int]]]]] = [
+    ("students", {"email": "explain@example.com"}, None),
+    ("students", {"student_id": "STU000000"}, None),
+    ("students", {f"{SEARCH_FIELD}.terms": {"$regex": "^explain"}}, [("student_id", ASCENDING)]),
+    ("admins", {"employee_id": "EMP000"}, None),
+    ("fees", {"email": "explain@example.com", "academic_year": "FE"}, None),
+    ("student_profiles", {"email": "explain@example.com"}, None),
+    ("notifications", {"student_id": "STU000000"}, [("timestamp", DESCENDING)]),
+    (ATTENDANCE_COLLECTION, {"email": "explain@example.com", "month": "2024-01"}, None),
+    (ROLLUPS_COLLECTION, {"email": "explain@example.com"}, None),
+    ("fee_payments", {"email": "explain@example.com", "academic_year": "FE", "status": "applied"}, [("created_at", ASCENDING)]),
+    (LEAVES_COLLECTION, {"status": PENDING}, [("_id", ASCENDING)]),
+    (LEAVES_COLLECTION, {"status": PENDING, "course": "CS"}, [("_id", ASCENDING)]),
+    (
+        OUTBOX_COLLECTION,
+        {"status": {"$in": [EMAIL_PENDING, SENDING]}, "next_attempt_at": {"$lte": datetime(2024, 1, 1)}},
+        [("next_attempt_at", ASCENDING)],
+    ),
+]
+
+
+async def _check_unique_duplicates(db):
+    """Refuse to build unique indexes over data that already violates them."""
+    problems = []
+    for collection_name, indexes in INDEXES.items():
+        for index in indexes:
+            spec = index.document
+            if not spec.get("unique"):
+                continue
+            keys = list(spec["key"].keys())
+            match = {key: {"$exists": True} for key in keys}
+            pipeline = [
+                {"$match": match},
+                {"$group": {"_id": {key: f"${key}" for key in keys}, "count": {"$sum": 1}}},
+                {"$match": {"count": {"$gt": 1}}},
+                {"$limit": 5},
+            ]
+            duplicates = await db[collection_name].aggregate(pipeline).to_list(length=5)
+            if duplicates:
+                sample = ", ".join(str(d["_id"]) for d in duplicates)
+                problems.append(f"{collection_name}.{spec['name']}: {sample}")
+
+    if problems:
+        raise SchemaError(
+            "Duplicate keys must be resolved before unique indexes can be built: "
+            + "; ".join(problems)
+        )
+
+
+async def _move_attendance_into_buckets(db):
+    # Rollups are written with $merge on email, which needs the unique index first
+    await ensure_indexes(db)
+    await migrate_embedded_attendance(db)
+
+
+async def _move_leave_requests_out_of_students(db):
+    # Re-runs rely on the legacy_key unique index to skip requests already moved
+    await ensure_indexes(db)
+    await migrate_embedded_leave_requests(db)
+
+
+# ✅ Versioned in-place upgrades: (version, description, coroutine taking db).
+# Steps must be idempotent because several workers can start at the same time.
+MIGRATIONS = [
+    (1, "Check existing data against the new unique keys", _check_unique_duplicates),
+    (2, "Move embedded attendance into monthly buckets", _move_attendance_into_buckets),
+    (3, "Move embedded leave requests into their own collection", _move_leave_requests_out_of_students),
+    (4, "Add normalized search fields to student records", backfill_search_fields),
+    (5, "Move inline profile pictures into GridFS", migrate_inline_pictures),
+]
+
+
+async def run_migrations(db):
+    record = await db[MIGRATIONS_COLLECTION].find_one({"_id": SCHEMA_ID}) or {}
+    current = record.get("version", 0)
+
+    for version, description, step in MIGRATIONS:
+        if version <= current:
+            continue
+        logging.info(f"⏫ Applying schema migration {version}: {description}")
+        await step(db)
+        try:
+            await db[MIGRATIONS_COLLECTION].update_one(
+                {"_id": SCHEMA_ID, "version": {"$not": {"$gte": version}}},
+                {
+                    "$set": {"version": version, "updated_at": datetime.utcnow()},
+                    "$push": {"history": {"version": version, "description": description, "applied_at": datetime.utcnow()}},
+                },
+                upsert=True,
+            )
+        except DuplicateKeyError:
+            # Another worker recorded this (or a later) version first
+            pass
+        current = version
+
+
+async def ensure_indexes(db):
+    for collection_name, indexes in INDEXES.items():
+        await db[collection_name].create_indexes(indexes)
+
+        existing = await db[collection_name].index_information()
+        missing = [index.document["name"] for index in indexes if index.document["name"] not in existing]
+        if missing:
+            raise SchemaError(f"Indexes missing on {collection_name}: {', '.join(missing)}")
+
+
+def _has_collscan(plan: Any) -> bool:
+    if isinstance(plan, dict):
+        if plan.get("stage") == "COLLSCAN":
+            return True
+        return any(_has_collscan(value) for value in plan.values())
+    if isinstance(plan, list):
+        return any(_has_collscan(value) for value in plan)
+    return False
+
+
+async def check_hot_query_plans(db, strict: Optional[bool] = None):
+    if strict is None:
+        strict = os.getenv(STRICT_ENV, "0") == "1"
+
+    collscans = []
+    for collection_name, query, sort in HOT_QUERIES:
+        cursor = db[collection_name].find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        explain = await cursor.explain()
+        if _has_collscan(explain.get("queryPlanner", {}).get("winningPlan")):
+            collscans.append(f"{collection_name} {query}")
+
+    for entry in collscans:
+        logging.error(f"🚨 Hot query plans as COLLSCAN: {entry}")
+    if collscans and strict:
+        raise SchemaError(f"{len(collscans)} hot queries plan as COLLSCAN")
+
+
+async def bootstrap_schema(db, strict: Optional[bool] = None):
+    await run_migrations(db)
+    await ensure_indexes(db)
+    await check_hot_query_plans(db, strict)
+    logging.info("✅ Schema bootstrap complete")
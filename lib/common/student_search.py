@@ -0,0 +1,152 @@
+import re
+import unicodedata
+from typing import Any, Dict, List, Optional, Tuple
+
+from pymongo import UpdateOne
+
+from lib.common.pagination import clamp_limit, keyset_filter
+from lib.common.payments import APPLIED_FIELD
+
+# Normalized copies of the searchable fields live under one subdocument
+SEARCH_FIELD = "search"
+SEARCHABLE = ("name", "email", "student_id", "course")
+
+# fee_status filter values -> conditions on the student's fee totals
+FEE_STATUSES: Dict[str, Dict[str, Any]] = {
+    "paid": {"remaining_fees": {"$lte": 0}},
+    "due": {"remaining_fees": {"$gt": 0}},
+    "partial": {"remaining_fees": {"$gt": 0}, "paid_fees": {"$gt": 0}},
+    "unpaid": {"remaining_fees": {"$gt": 0}, "paid_fees": {"$lte": 0}},
+}
+
+RESULT_PROJECTION = {"_id": 0, "password": 0, SEARCH_FIELD: 0, APPLIED_FIELD: 0}
+
+_WORD = re.compile(r"[^\W_]+")
+
+
+def normalize(value: Any) -> str:
+    """Lower-case, accent-free form used for both stored fields and queries."""
+    text = unicodedata.normalize("NFKD", str(value or ""))
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    return " ".join(text.lower().split())
+
+
+def search_fields(student: Dict[str, Any]) -> Dict[str, Any]:
+    """The ``search`` subdocument for a student record.
+
+    ``terms`` holds every word of the name and email plus the whole email and
+    student ID, so one multikey index answers "starts with" for any of them.
+    """
+    fields = {field: normalize(student.get(field)) for field in SEARCHABLE}
+    terms = set(_WORD.findall(fields["name"])) | set(_WORD.findall(fields["email"]))
+    terms.update(value for value in (fields["email"], fields["student_id"]) if value)
+    fields["terms"] = sorted(terms)
+    return fields
+
+
+def course_update(course: str) -> Dict[str, Any]:
+    """``$set`` fields for a course change; course prefixes are matched on their own field."""
+    return {"course": course, f"{SEARCH_FIELD}.course": normalize(course)}
+
+
+def _prefix(token: str) -> Dict[str, Any]:
+    return {"$regex": f"^{re.escape(token)}"}
+
+
+def search_filter(
+    q: str = "",
+    field: Optional[str] = None,
+    academic_year: Optional[str] = None,
+    course: Optional[str] = None,
+    fee_status: Optional[str] = None,
+    text: bool = False,
+) -> Dict[str, Any]:
+    """Build the query for one search; every clause can use an index.
+
+    By default each whitespace-separated token of ``q`` must be a prefix of
+    some name/email word, the student ID or the course. ``field`` restricts
+    the prefix match to one normalized field; ``text`` switches to the
+    MongoDB text index for whole-word matching.
+    """
+    clauses: List[Dict[str, Any]] = []
+    tokens = normalize(q).split()
+    if tokens and text:
+        clauses.append({"$text": {"$search": " ".join(tokens)}})
+    elif tokens and field:
+        clauses.append({f"{SEARCH_FIELD}.{field}": _prefix(" ".join(tokens))})
+    else:
+        for token in tokens:
+            clauses.append({
+                "$or": [
+                    {f"{SEARCH_FIELD}.terms": _prefix(token)},
+                    {f"{SEARCH_FIELD}.course": _prefix(token)},
+                ]
+            })
+
+    if academic_year:
+        clauses.append({"academic_year": academic_year})
+    if course:
+        clauses.append({"course": course})
+    if fee_status:
+        clauses.append(FEE_STATUSES[fee_status])
+
+    if not clauses:
+        return {}
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+
+async def search_students(
+    collection,
+    cache,
+    limit: int,
+    after: Optional[str] = None,
+    **criteria,
+) -> Tuple[List[dict], Optional[str]]:
+    """One page of matches and the next cursor, served from ``cache`` when fresh.
+
+    Prefix and field searches page on student_id like /admin/students; text
+    searches return the best ``limit`` matches by relevance in a single page.
+    """
+    limit = clamp_limit(limit)
+    key = (limit, after, tuple(sorted(criteria.items())))
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+
+    query = search_filter(**criteria)
+    if criteria.get("text") and normalize(criteria.get("q")):
+        projection = {**RESULT_PROJECTION, "score": {"$meta": "textScore"}}
+        cursor = collection.find(query, projection).sort([("score", {"$meta": "textScore"})]).limit(limit)
+        docs = await cursor.to_list(length=limit)
+        for doc in docs:
+            doc.pop("score", None)
+        page = (docs, None)
+    else:
+        cursor = (
+            collection.find(keyset_filter(query, "student_id", after), RESULT_PROJECTION)
+            .sort("student_id", 1)
+            .limit(limit + 1)
+        )
+        docs = await cursor.to_list(length=limit + 1)
+        next_cursor = None
+        if len(docs) > limit:
+            docs = docs[:limit]
+            next_cursor = docs[-1].get("student_id")
+        page = (docs, next_cursor)
+
+    cache.set(key, page)
+    return page
+
+
+async def backfill_search_fields(db, batch_size: int = 500):
+    """Add the ``search`` subdocument to students written before it existed."""
+    students = db.students
+    projection = {field: 1 for field in SEARCHABLE}
+    operations = []
+    async for student in students.find({SEARCH_FIELD: {"$exists": False}}, projection).batch_size(batch_size):
+        operations.append(UpdateOne({"_id": student["_id"]}, {"$set": {SEARCH_FIELD: search_fields(student)}}))
+        if len(operations) >= batch_size:
+            await students.bulk_write(operations, ordered=False)
+            operations = []
+    if operations:
+        await students.bulk_write(operations, ordered=False)
@@ -0,0 +1,80 @@
+import asyncio
+import hashlib
+import json
+import time
+from datetime import datetime
+from typing import Dict, List, Tuple
+
+from pymongo import ReplaceOne
+
+TIMETABLES_COLLECTION = "timetables"
+VERSION_ID = "timetables_version"  # Counter document bumped on every timetable change
+
+# How often a worker checks whether another worker changed the timetables
+VERSION_CHECK_SECONDS = 5
+
+_EMPTY_BODY = b"[]"
+
+
+def _entry(periods: List[dict]) -> Tuple[bytes, str]:
+    body = json.dumps(periods, separators=(",", ":"), sort_keys=True).encode("utf-8")
+    return body, f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+
+
+class TimetableSnapshot:
+    """Immutable in-memory copy of all timetables, rebuilt only when they change.
+
+    Each class maps to its pre-encoded JSON body and a strong ETag. Readers
+    always get the current snapshot without waiting; a rebuild swaps in a new
+    dict in one assignment once it is complete.
+    """
+
+    def __init__(self, timetables, counters):
+        self.timetables = timetables
+        self.counters = counters
+        self._version = None
+        self._entries: Dict[str, Tuple[bytes, str]] = {}
+        self._checked_at = 0.0
+        self._lock = asyncio.Lock()
+
+    async def _current_version(self) -> int:
+        counter = await self.counters.find_one({"_id": VERSION_ID})
+        return counter["seq"] if counter else 0
+
+    async def refresh(self, force: bool = False):
+        async with self._lock:
+            version = await self._current_version()
+            self._checked_at = time.monotonic()
+            if version == self._version and not force:
+                return
+            entries = {}
+            async for doc in self.timetables.find({}, {"_id": 0, "class_name": 1, "periods": 1}):
+                entries[doc["class_name"]] = _entry(doc.get("periods", []))
+            self._entries, self._version = entries, version
+
+    async def get(self, class_name: str) -> Tuple[bytes, str]:
+        if time.monotonic() - self._checked_at > VERSION_CHECK_SECONDS and not self._lock.locked():
+            await self.refresh()
+        return self._entries.get(class_name) or _entry([])
+
+    async def replace(self, timetables: Dict[str, List[dict]]):
+        """Upsert whole timetables for the given classes and publish a new version."""
+        now = datetime.utcnow()
+        operations = [
+            ReplaceOne(
+                {"class_name": class_name},
+                {"class_name": class_name, "periods": periods, "updated_at": now},
+                upsert=True,
+            )
+            for class_name, periods in timetables.items()
+        ]
+        if operations:
+            await self.timetables.bulk_write(operations, ordered=False)
+            await self.counters.update_one({"_id": VERSION_ID}, {"$inc": {"seq": 1}}, upsert=True)
+        await self.refresh()
+
+    async def seed(self, defaults: Dict[str, List[dict]]):
+        if await self.timetables.estimated_document_count() == 0:
+            await self.replace(defaults)
+        else:
+            await self.refresh()
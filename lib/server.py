@@ -0,0 +1,12 @@
+"""Admin and student APIs in one ASGI app.
+
+    uvicorn lib.server:app --host 0.0.0.0 --port 8000 --workers 4
+
+Each worker process opens its own Mongo pool (ERP_MONGO_MAX_POOL per worker),
+so size the pool with the worker count in mind.
+"""
+from lib.admin.main import service as admin_service
+from lib.common.app import create_app
+from lib.student.main import service as student_service
+
+app = create_app(admin_service, student_service)
@@ -1,27 +1,118 @@
-from fastapi import FastAPI, HTTPException, Request
-from motor.motor_asyncio import AsyncIOMotorClient
+from fastapi import Depends, File, Form, Header, HTTPException, Query, Request, UploadFile
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorGridFSBucket
 from pydantic import BaseModel, EmailStr
-from typing import Optional, List
+from typing import Any, Dict, Optional, List
 from datetime import datetime
+from urllib.parse import urlencode
+import asyncio
 import logging
-from fastapi.middleware.cors import CORSMiddleware
-
-app = FastAPI()
+import os
+from lib.common.app import Service, create_app
+from lib.common.auth import STUDENT, ensure_self, require_admin, require_student, token_response
+from lib.common.attendance import (
+    ATTENDANCE_COLLECTION,
+    ROLLUPS_COLLECTION,
+    daily_statuses,
+    mark_operation,
+    normalize_status,
+    parse_date,
+    refresh_rollups,
+    rollup_pipeline,
+    summarize,
+    valid_subject,
+)
+from lib.common.cache import TTLCache
+from lib.common.database import mongo
+from lib.common.ids import COUNTERS_COLLECTION
+from lib.common.ingest import BULK_BATCH_SIZE
+from lib.common.jobs import DONE, JOBS_COLLECTION, JobQueue, serialize_job
+from lib.common.leaves import LEAVE_STUDENT_FIELDS, LEAVES_COLLECTION, leave_dates, new_leave_request
+from lib.common.metrics import metrics
+from lib.common.outbox import email_outbox, receipt_email
+from lib.common.pagination import (
+    MAX_PAGE_SIZE,
+    NDJSON_MEDIA_TYPE,
+    NEXT_CURSOR_HEADER,
+    fetch_page,
+    keyset_filter,
+    ndjson_stream,
+)
+from lib.common.pictures import (
+    LEGACY_FIELD,
+    MAX_PICTURE_BYTES,
+    ORIGINAL,
+    PICTURE_FIELD,
+    PICTURES_BUCKET,
+    THUMBNAIL,
+    UNREADABLE_FIELD,
+    decode_inline_picture,
+    delete_picture,
+    is_stored,
+    open_picture,
+    parse_range,
+    read_thumbnail,
+    store_picture,
+    stream_range,
+)
+from lib.common.payments import (
+    APPLIED_FIELD,
+    IDEMPOTENCY_HEADER,
+    LEDGER_COLLECTION,
+    PaymentLedgerSweeper,
+    apply_payment,
+    payment_history,
+)
+from lib.common.receipts import RECEIPT_JOB, RECEIPTS_BUCKET, receipt_batch_handler, receipt_filename, render_receipt
+from lib.common.timetables import TIMETABLES_COLLECTION, TimetableSnapshot
+
+# ✅ Student service: routes and hooks, served alone (app below) or via lib.server
+# Routes need a student (or admin) access token; signup, login and timetables are public
+service = Service("student", expose_headers=[NEXT_CURSOR_HEADER, "ETag"], dependencies=[Depends(require_student)])
+public = service.public
+router = service.router
+lifespan = service.lifespan
+
+# ✅ MongoDB collections (bound to the shared client once the app lifespan connects it)
+students_collection = mongo.collection("students")
+student_profiles = mongo.collection("student_profiles")
+fees_collection = mongo.collection("fees")  # Collection for storing student fees
+payments_ledger = mongo.collection(LEDGER_COLLECTION)  # Append-only record of every fee payment
+attendance_collection = mongo.collection(ATTENDANCE_COLLECTION)  # One bucket per student per month
+attendance_rollups = mongo.collection(ROLLUPS_COLLECTION)  # Precomputed attendance percentages
+timetable_snapshot = TimetableSnapshot(mongo.collection(TIMETABLES_COLLECTION), mongo.collection(COUNTERS_COLLECTION))
+# Generated receipt ZIPs
+receipts_bucket = mongo.lazy(lambda database: AsyncIOMotorGridFSBucket(database, bucket_name=RECEIPTS_BUCKET))
+job_queue = JobQueue(mongo.collection(JOBS_COLLECTION))
+# Profile pictures and their thumbnails; profiles keep only a reference
+pictures_bucket = mongo.lazy(lambda database: AsyncIOMotorGridFSBucket(database, bucket_name=PICTURES_BUCKET))
+leave_requests = mongo.collection(LEAVES_COLLECTION)  # One document per leave request, with a status
+
+# ✅ Assembled profiles, cached per worker and invalidated on update
+profile_cache = TTLCache(
+    maxsize=int(os.getenv("ERP_PROFILE_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("ERP_PROFILE_CACHE_TTL", "60")),
+)
+metrics.gauges("erp_profile_cache", profile_cache.stats)
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],  # Allow all origins (Change this to specific origins for security)
-    allow_credentials=True,
-    allow_methods=["*"],  # Allow all methods (GET, POST, PUT, DELETE, etc.)
-    allow_headers=["*"],  # Allow all headers
+# Background jobs (receipt batches) start after the schema bootstrap
+job_queue.register(
+    RECEIPT_JOB,
+    receipt_batch_handler(fees_collection, students_collection, payments_ledger, receipts_bucket),
 )
+lifespan.on_startup(job_queue.start)
+lifespan.on_shutdown(job_queue.shutdown)
 
-# ✅ MongoDB Connection
-client = AsyncIOMotorClient("mongodb://localhost:27017")
-db = client.studentERP
-students_collection = db.students
-student_profiles = db.student_profiles
-fees_collection = db.fees  # Collection for storing student fees
+async def payment_applied(result: dict):
+    await email_outbox.enqueue([receipt_email(result["email"], result)])
+
+# Payments whose request died before the ledger entry was written are recorded in the background
+payment_sweeper = PaymentLedgerSweeper(
+    fees_collection, payments_ledger, "student", ("email", "academic_year"), on_applied=payment_applied
+)
+lifespan.on_startup(payment_sweeper.start)
+lifespan.on_shutdown(payment_sweeper.shutdown)
 
 # ✅ Pydantic Models
 class LoginRequest(BaseModel):
@@ -45,6 +136,22 @@ class StudentProfile(BaseModel):
     address: Optional[str] = ""
     profile_picture: Optional[str] = None
 
+class ClassAttendance(BaseModel):
+    date: str  # YYYY-MM-DD
+    subject: str
+    records: List[Dict[str, Any]]  # [{"email": ..., "status": "Present" | "Absent"}]
+
+class ReceiptBatchRequest(BaseModel):
+    academic_year: Optional[str] = None
+    course: Optional[str] = None
+
+class TimetablePeriod(BaseModel):
+    period: int
+    subject: str
+    start_time: str
+    end_time: str
+    teacher: str
+
 class StudentFees(BaseModel):
     email: str
     academic_year: str
@@ -66,7 +173,7 @@ def calculate_age(dob: Optional[str]) -> int:
     return 0
 
 # ✅ Student Signup API
-@app.post("/student/signup")
+@public.post("/student/signup")
 async def signup(request: Request):
     try:
         data = await request.json()
@@ -88,27 +195,38 @@ async def signup(request: Request):
         raise HTTPException(status_code=400, detail="Invalid request format")
 
 # ✅ Student Login API
-@app.post("/student/login")
+@public.post("/student/login")
 async def login(request: LoginRequest):
-    student = await students_collection.find_one({"email": request.email})
+    student = await students_collection.find_one({"email": request.email}, {"_id": 0, "name": 1, "student_id": 1})
     if not student:
         raise HTTPException(status_code=400, detail="Student not found")
     if student.get("name") != request.name:
         raise HTTPException(status_code=400, detail="Incorrect name")
-    return {"message": "Login successful"}
+    # Later requests present this token instead of logging in again
+    return {
+        "message": "Login successful",
+        **token_response(request.email, STUDENT, student_id=student.get("student_id")),
+    }
 
 # ✅ Get Student Profile API
-@app.get("/get_student_profile")
-async def get_student_profile(email: str):
-    student = await students_collection.find_one({"email": email})
-    profile = await student_profiles.find_one({"email": email})
+@router.get("/get_student_profile")
+async def get_student_profile(email: str, claims: Optional[dict] = Depends(require_student)):
+    ensure_self(claims, email=email)
+    cached = profile_cache.get(email)
+    if cached is not None:
+        return cached
+
+    student, profile = await asyncio.gather(
+        students_collection.find_one({"email": email}, {"_id": 0, "email": 1}),
+        student_profiles.find_one({"email": email}, {"_id": 0}),
+    )
 
     if not student:
         raise HTTPException(status_code=404, detail="Student not found")
 
     profile_data = profile or {}
 
-    return {
+    assembled = {
         "email": student.get("email", ""),
         "full_name": profile_data.get("full_name", ""),
         "branch": profile_data.get("branch", ""),
@@ -120,19 +238,39 @@ async def get_student_profile(email: str):
         "semester": profile_data.get("semester", ""),
         "gender": profile_data.get("gender", ""),
         "address": profile_data.get("address", ""),
-        "profile_picture": profile_data.get("profile_picture", ""),
+        # Inline thumbnail for the current app; full image via profile_picture_url
+        "profile_picture": await read_thumbnail(pictures_bucket, profile_data.get(PICTURE_FIELD)),
+        "profile_picture_url": picture_url(email, ORIGINAL) if profile_data.get(PICTURE_FIELD) else "",
+        "thumbnail_url": picture_url(email, THUMBNAIL) if profile_data.get(PICTURE_FIELD) else "",
     }
+    profile_cache.set(email, assembled)
+    return assembled
+
+# ✅ Profile Cache Stats (hit/miss counters for sizing the cache)
+@router.get("/profile_cache/stats", dependencies=[Depends(require_admin)])
+async def profile_cache_stats():
+    return profile_cache.stats()
 
 # ✅ Update Student Profile API
-@app.post("/update_student_profile")
-async def update_student_profile(request: Request):
+@router.post("/update_student_profile")
+async def update_student_profile(request: Request, claims: Optional[dict] = Depends(require_student)):
     try:
         data = await request.json()
         profile_data = StudentProfile(**data)
+        ensure_self(claims, email=profile_data.email)
 
         # Convert Pydantic model to dictionary and remove `None` values
         update_data = {k: v for k, v in profile_data.dict(exclude_unset=True).items() if v is not None}
 
+        # Older apps still send the picture inline, usually the thumbnail they were served;
+        # only a new image is stored, or the original would be replaced by its own thumbnail
+        inline_picture = update_data.pop(LEGACY_FIELD, None)
+        if inline_picture:
+            data = decode_inline_picture(inline_picture)
+            current = await student_profiles.find_one({"email": profile_data.email}, {"_id": 0, PICTURE_FIELD: 1})
+            if not is_stored((current or {}).get(PICTURE_FIELD), data):
+                await save_profile_picture(profile_data.email, data)
+
         # Check if profile exists
         existing_profile = await student_profiles.find_one({"email": profile_data.email})
 
@@ -141,27 +279,112 @@ async def update_student_profile(request: Request):
                 {"email": profile_data.email},
                 {"$set": update_data}
             )
+            profile_cache.invalidate(profile_data.email)
             return {"message": "Profile updated successfully"}
         else:
             await student_profiles.insert_one(update_data)
+            profile_cache.invalidate(profile_data.email)
             return {"message": "Profile created successfully"}
 
+    except HTTPException:
+        raise
     except Exception as e:
         logging.error(f"Error updating profile: {str(e)}")
         raise HTTPException(status_code=400, detail="Error updating profile")
 
+def picture_url(email: str, size: str) -> str:
+    return f"/profile_picture?{urlencode({'email': email, 'size': size})}"
+
+async def save_profile_picture(email: str, data: bytes) -> dict:
+    reference = await store_picture(pictures_bucket, email, data)
+    previous = await student_profiles.find_one_and_update(
+        {"email": email},
+        {"$set": {PICTURE_FIELD: reference}, "$unset": {LEGACY_FIELD: ""}},
+        projection={"_id": 0, PICTURE_FIELD: 1},
+        upsert=True,
+    )
+    await delete_picture(pictures_bucket, (previous or {}).get(PICTURE_FIELD))
+    profile_cache.invalidate(email)
+    return reference
+
+# ✅ Upload Profile Picture (multipart; original + thumbnail go to GridFS)
+@router.post("/upload_profile_picture")
+async def upload_profile_picture(
+    email: str = Form(...),
+    file: UploadFile = File(...),
+    claims: Optional[dict] = Depends(require_student),
+):
+    ensure_self(claims, email=email)
+    if not await students_collection.find_one({"email": email}, {"_id": 1}):
+        raise HTTPException(status_code=404, detail="Student not found")
+
+    data = await file.read(MAX_PICTURE_BYTES + 1)
+    reference = await save_profile_picture(email, data)
+    return {
+        "message": "Profile picture uploaded successfully",
+        "profile_picture_url": picture_url(email, ORIGINAL),
+        "thumbnail_url": picture_url(email, THUMBNAIL),
+        "etag": reference[ORIGINAL]["etag"],
+    }
+
+# ✅ Download Profile Picture (streamed from GridFS, with ETag and Range support)
+@router.get("/profile_picture")
+async def get_profile_picture(
+    email: str,
+    size: str = THUMBNAIL,
+    range_header: Optional[str] = Header(None, alias="Range"),
+    if_none_match: Optional[str] = Header(None, alias="If-None-Match"),
+    claims: Optional[dict] = Depends(require_student),
+):
+    ensure_self(claims, email=email)
+    if size not in (ORIGINAL, THUMBNAIL):
+        raise HTTPException(status_code=400, detail=f"size must be {ORIGINAL} or {THUMBNAIL}")
+
+    profile = await student_profiles.find_one({"email": email}, {"_id": 0, PICTURE_FIELD: 1})
+    if not profile or not profile.get(PICTURE_FIELD):
+        raise HTTPException(status_code=404, detail="Profile picture not found")
+
+    etag = (profile[PICTURE_FIELD].get(size) or {}).get("etag")
+    headers = {
+        "ETag": etag,
+        "Accept-Ranges": "bytes",
+        # The URL stays the same when the picture changes, so clients revalidate
+        "Cache-Control": "private, no-cache",
+    }
+    # Answered from the profile reference alone, without opening a GridFS stream
+    if etag and _etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+
+    entry, grid_out = await open_picture(pictures_bucket, profile[PICTURE_FIELD], size)
+
+    length = grid_out.length
+    byte_range = parse_range(range_header, length)
+    start, end = byte_range or (0, length - 1)
+    headers["Content-Length"] = str(end - start + 1)
+    if byte_range:
+        headers["Content-Range"] = f"bytes {start}-{end}/{length}"
+
+    return StreamingResponse(
+        stream_range(grid_out, start, end),
+        status_code=206 if byte_range else 200,
+        media_type=entry["content_type"],
+        headers=headers,
+    )
+
 
 # ✅ Get Student Name by Email API
-@app.get("/get_student_name_by_email")
-async def get_student_name_by_email(email: str):
+@router.get("/get_student_name_by_email")
+async def get_student_name_by_email(email: str, claims: Optional[dict] = Depends(require_student)):
+    ensure_self(claims, email=email)
     student = await student_profiles.find_one({"email": email})
     if student:
         return {"full_name": student["full_name"]}
     raise HTTPException(status_code=404, detail="Student not found")
 
 # ✅ Get Student Fees API
-@app.get("/get_student_fees")
-async def get_student_fees(email: str, academic_year: str):
+@router.get("/get_student_fees")
+async def get_student_fees(email: str, academic_year: str, claims: Optional[dict] = Depends(require_student)):
+    ensure_self(claims, email=email)
     student = await students_collection.find_one({"email": email})
 
     if not student:
@@ -177,7 +400,7 @@ async def get_student_fees(email: str, academic_year: str):
     }
 
 # ✅ Admin Updates Student Fees API
-@app.post("/update_student_fees")
+@router.post("/update_student_fees", dependencies=[Depends(require_admin)])
 async def update_student_fees(request: Request):
     body = await request.json()
     fees_data = StudentFees(**body)
@@ -193,83 +416,234 @@ async def update_student_fees(request: Request):
 
     return {"message": "Student fees updated successfully"}
 
-# ✅ Make Fee Payment API
-@app.post("/pay_fees")
-async def pay_fees(request: Request):
+# ✅ Make Fee Payment API (single atomic update, recorded in the payment ledger)
+@router.post("/pay_fees")
+async def pay_fees(
+    request: Request,
+    idempotency_key: Optional[str] = Header(None, alias=IDEMPOTENCY_HEADER),
+    claims: Optional[dict] = Depends(require_student),
+):
     body = await request.json()
     email, academic_year, amount = body.get("email"), body.get("academic_year"), body.get("amount")
+    ensure_self(claims, email=email)
 
-    fees = await fees_collection.find_one({"email": email, "academic_year": academic_year})
-    if not fees:
-        raise HTTPException(status_code=404, detail="Fees record not found")
-
-    updated_paid_fees = fees["paid_fees"] + amount
-    updated_remaining_fees = max(fees["total_fees"] - updated_paid_fees, 0)
-
-    await fees_collection.update_one(
+    # apply_payment rejects anything but a finite, positive number (JSON true included)
+    result = await apply_payment(
+        fees_collection,
+        payments_ledger,
         {"email": email, "academic_year": academic_year},
-        {"$set": {"paid_fees": updated_paid_fees, "remaining_fees": updated_remaining_fees}}
+        amount,
+        {"email": email, "academic_year": academic_year, "source": "student"},
+        idempotency_key or body.get("idempotency_key"),
     )
+    if result is None:
+        raise HTTPException(status_code=404, detail="Fees record not found")
+    # Not counted in the fee summaries: they mirror students.total/paid/remaining_fees
+    # (the admin ledger), which this per-year fees record does not feed
+    if not result["replayed"]:
+        await payment_applied(result)
 
-    return {"message": "Fee payment successful", "paid_fees": updated_paid_fees, "remaining_fees": updated_remaining_fees}
+    return {
+        "message": "Fee payment successful",
+        "payment_id": result["payment_id"],
+        "paid_fees": result["paid_fees"],
+        "remaining_fees": result["remaining_fees"],
+    }
 
 # ✅ Generate Receipt API
-@app.get("/generate_receipt")
-async def generate_receipt(email: str, academic_year: str):
-    fees = await fees_collection.find_one({"email": email, "academic_year": academic_year}, {"_id": 0})
+FEES_PROJECTION = {"_id": 0, APPLIED_FIELD: 0}
+
+@router.get("/generate_receipt")
+async def generate_receipt(email: str, academic_year: str, claims: Optional[dict] = Depends(require_student)):
+    ensure_self(claims, email=email)
+    fees = await fees_collection.find_one({"email": email, "academic_year": academic_year}, FEES_PROJECTION)
     if not fees:
         raise HTTPException(status_code=404, detail="Fees record not found")
-    return {"receipt": f"Receipt for {email} - {academic_year}", **fees}
+    payments = await payment_history(payments_ledger, {"email": email, "academic_year": academic_year})
+    return {"receipt": f"Receipt for {email} - {academic_year}", **fees, "payments": payments}
+
+# ✅ Printable Receipt (PDF rendered off the event loop)
+@router.get("/generate_receipt/pdf")
+async def generate_receipt_pdf(email: str, academic_year: str, claims: Optional[dict] = Depends(require_student)):
+    ensure_self(claims, email=email)
+    fees = await fees_collection.find_one({"email": email, "academic_year": academic_year}, FEES_PROJECTION)
+    if not fees:
+        raise HTTPException(status_code=404, detail="Fees record not found")
+    payments = await payment_history(payments_ledger, {"email": email, "academic_year": academic_year})
+
+    pdf = await asyncio.get_running_loop().run_in_executor(None, render_receipt, fees, payments)
+    return Response(
+        content=pdf,
+        media_type="application/pdf",
+        headers={"Content-Disposition": f'attachment; filename="{receipt_filename(fees)}"'},
+    )
 
-# ✅ Get All Student Profiles API
-@app.get("/all_student_profiles", response_model=List[dict])
-async def get_all_students():
+# ✅ Start a Batch Receipt Job (ZIP of receipts for an academic year and/or course)
+@router.post("/receipts/jobs", status_code=202, dependencies=[Depends(require_admin)])
+async def create_receipt_job(batch: ReceiptBatchRequest):
+    if not batch.academic_year and not batch.course:
+        raise HTTPException(status_code=400, detail="Provide an academic_year and/or course")
+    job = await job_queue.submit(RECEIPT_JOB, batch.dict(exclude_none=True))
+    return serialize_job(job)
+
+# ✅ Receipt Job Status / Progress
+@router.get("/receipts/jobs/{job_id}", dependencies=[Depends(require_admin)])
+async def get_receipt_job(job_id: str):
+    job = await job_queue.get(job_id)
+    # Only receipt batches live here; other job types (e.g. fee summary rebuilds) have no download
+    if not job or job["type"] != RECEIPT_JOB:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return serialize_job(job)
+
+# ✅ Download a Finished Receipt Batch (streamed from GridFS)
+@router.get("/receipts/jobs/{job_id}/download", dependencies=[Depends(require_admin)])
+async def download_receipt_job(job_id: str):
+    job = await job_queue.get(job_id)
+    if not job or job["type"] != RECEIPT_JOB:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job["status"] != DONE:
+        raise HTTPException(status_code=409, detail=f"Job is {job['status']}")
+
+    grid_out = await receipts_bucket.open_download_stream(ObjectId(job["result"]["file_id"]))
+
+    async def chunks():
+        while True:
+            chunk = await grid_out.readchunk()
+            if not chunk:
+                break
+            yield chunk
+
+    return StreamingResponse(
+        chunks(),
+        media_type="application/zip",
+        headers={
+            "Content-Length": str(grid_out.length),
+            "Content-Disposition": f'attachment; filename="{job["result"]["filename"]}"',
+        },
+    )
+
+# ✅ Get All Student Profiles API (keyset-paginated on email, or streamed as NDJSON)
+# Listings carry the picture reference only, never image data
+PROFILE_LIST_PROJECTION = {"_id": 0, LEGACY_FIELD: 0, UNREADABLE_FIELD: 0}
+
+@router.get("/all_student_profiles", response_model=List[dict], dependencies=[Depends(require_admin)])
+async def get_all_students(
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = None,
+    stream: bool = False,
+):
     try:
-        students_cursor = student_profiles.find({}, {"_id": 0})
-        students = [student async for student in students_cursor]
+        if stream:
+            cursor = (
+                student_profiles.find(keyset_filter({}, "email", after), PROFILE_LIST_PROJECTION)
+                .sort("email", 1)
+                .batch_size(MAX_PAGE_SIZE)
+            )
+            return StreamingResponse(ndjson_stream(cursor), media_type=NDJSON_MEDIA_TYPE)
 
-        if not students:
+        students, next_cursor = await fetch_page(
+            student_profiles, {}, PROFILE_LIST_PROJECTION, "email", limit, after
+        )
+        if not students and after is None:
             raise HTTPException(status_code=404, detail="No student profiles found")
 
-        return students
+        headers = {NEXT_CURSOR_HEADER: next_cursor} if next_cursor else None
+        return JSONResponse(content=students, headers=headers)
+    except HTTPException:
+        raise
     except Exception as e:
         logging.error(f"Error fetching students: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error fetching students: {str(e)}")
 
-# API: Get Student Attendance
-@app.get("/get_student_attendance")
-async def get_student_attendance(email: str):
+# API: Get Student Attendance (monthly bucket + precomputed percentages)
+@router.get("/get_student_attendance")
+async def get_student_attendance(email: str, month: Optional[str] = None, claims: Optional[dict] = Depends(require_student)):
+    ensure_self(claims, email=email)
     try:
-        # Use 'await' to resolve the Future object
-        student = await students_collection.find_one({"email": email})
+        month = month or datetime.utcnow().strftime("%Y-%m")
+        student, bucket, rollup = await asyncio.gather(
+            students_collection.find_one({"email": email}, {"_id": 0, "name": 1}),
+            attendance_collection.find_one({"email": email, "month": month}, {"_id": 0, "days": 1}),
+            attendance_rollups.find_one({"email": email}, {"_id": 0}),
+        )
 
         if not student:
             raise HTTPException(status_code=404, detail="Student not found")
 
+        if rollup is None:
+            # No rollup yet: compute it on the fly without persisting ($merge is the last stage)
+            computed = await attendance_collection.aggregate(rollup_pipeline({"email": email})[:-1]).to_list(length=1)
+            rollup = computed[0] if computed else None
+
         return {
             "name": student.get("name", ""),
-            "daily_attendance": student.get("daily_attendance", {}),
-            "subject_attendance": student.get("subject_attendance", {})
+            "month": month,
+            "daily_attendance": daily_statuses(bucket),
+            **summarize(rollup),
         }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+# API: Mark Attendance for a Whole Class (one bulk write + one rollup refresh)
+@router.post("/attendance/mark_class", dependencies=[Depends(require_admin)])
+async def mark_class_attendance(attendance: ClassAttendance):
+    try:
+        date = parse_date(attendance.date)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid date format, use YYYY-MM-DD")
+    if not valid_subject(attendance.subject):
+        raise HTTPException(status_code=400, detail="Invalid subject name")
+    if len(attendance.records) > BULK_BATCH_SIZE:
+        raise HTTPException(status_code=413, detail=f"At most {BULK_BATCH_SIZE} records per request")
+
+    emails = [record.get("email") for record in attendance.records if record.get("email")]
+    known = {
+        doc["email"]
+        async for doc in students_collection.find({"email": {"$in": emails}}, {"_id": 0, "email": 1})
+    }
+
+    operations, marked, failed = [], [], []
+    for index, record in enumerate(attendance.records):
+        email, status = record.get("email"), normalize_status(record.get("status"))
+        if email not in known:
+            failed.append({"index": index, "email": email, "detail": "Student not found"})
+        elif status is None:
+            failed.append({"index": index, "email": email, "detail": "Status must be Present or Absent"})
+        else:
+            operations.append(mark_operation(email, date, attendance.subject, status))
+            marked.append(email)
+
+    if operations:
+        await attendance_collection.bulk_write(operations, ordered=False)
+        await refresh_rollups(attendance_collection, marked)
+
+    return {"message": "Attendance marked", "marked": len(marked), "failed": failed}
+
 # API: Apply for Leave
-@app.post("/apply_leave")
-async def apply_leave(request: dict):
+@router.post("/apply_leave")
+async def apply_leave(request: dict, claims: Optional[dict] = Depends(require_student)):
     email = request.get("email")
     reason = request.get("reason")
+    ensure_self(claims, email=email)
 
     if not email or not reason:
         raise HTTPException(status_code=400, detail="Invalid request")
 
-    students_collection.update_one(
-        {"email": email},
-        {"$push": {"leave_requests": {"reason": reason, "status": "Pending"}}}
-    )
-    return {"message": "Leave request submitted successfully"}
+    try:
+        from_date, to_date = leave_dates(request.get("from_date"), request.get("to_date"))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid leave dates, use YYYY-MM-DD with from_date <= to_date")
+
+    student = await students_collection.find_one({"email": email}, LEAVE_STUDENT_FIELDS)
+    if not student:
+        raise HTTPException(status_code=404, detail="Student not found")
+
+    result = await leave_requests.insert_one(new_leave_request(student, reason, from_date, to_date))
+    return {"message": "Leave request submitted successfully", "id": str(result.inserted_id)}
 
-# Dummy Timetable Data
+# Default Timetable Data (seeds an empty timetables collection)
 timetable_data = {
     "Class 10": [
         {"period": 1, "subject": "DL", "start_time": "08:00 AM", "end_time": "08:45 AM", "teacher": "Mr. Sharma"},
@@ -283,6 +657,35 @@ timetable_data = {
     ]
 }
 
-@app.get("/get_timetable")
-async def get_timetable(class_name: str):
-    return timetable_data.get(class_name, [])
\ No newline at end of file
+# Timetables are served from an in-memory snapshot of the timetables collection
+@lifespan.on_startup
+async def load_timetables():
+    await timetable_snapshot.seed(timetable_data)
+
+TIMETABLE_CACHE_CONTROL = f"public, max-age={os.getenv('ERP_TIMETABLE_MAX_AGE', '60')}, must-revalidate"
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags
+
+@public.get("/get_timetable")
+async def get_timetable(class_name: str, if_none_match: Optional[str] = Header(None)):
+    body, etag = await timetable_snapshot.get(class_name)
+    headers = {"ETag": etag, "Cache-Control": TIMETABLE_CACHE_CONTROL}
+    if _etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+# Admin: Bulk Timetable Upload ({"Class 10": [periods...], ...})
+@router.put("/admin/timetables", dependencies=[Depends(require_admin)])
+async def upload_timetables(timetables: Dict[str, List[TimetablePeriod]]):
+    await timetable_snapshot.replace({
+        class_name: [period.dict() for period in periods]
+        for class_name, periods in timetables.items()
+    })
+    return {"message": "Timetables updated successfully", "classes": len(timetables)}
+
+# ✅ Standalone student API: uvicorn lib.student.main:app --port 8000
+app = create_app(service, title="Student ERP Student Portal")
@@ -18,6 +18,8 @@ class StudentProfilePage extends StatefulWidget {
 
 class _StudentProfilePageState extends State<StudentProfilePage> {
   File? _image;
+  // Only a newly picked image is uploaded; the one loaded from the server is its thumbnail
+  bool _imagePicked = false;
   final picker = ImagePicker();
 
   final TextEditingController fullNameController = TextEditingController();
@@ -83,17 +85,19 @@ class _StudentProfilePageState extends State<StudentProfilePage> {
     if (pickedFile != null) {
       setState(() {
         _image = File(pickedFile.path);
+        _imagePicked = true;
       });
     }
   }
 
-  Future<void> _saveProfile() async {
-    String? base64Image;
-    if (_image != null) {
-      List<int> imageBytes = await _image!.readAsBytes();
-      base64Image = base64Encode(imageBytes);
-    }
+  Future<http.Response> _uploadPicture() async {
+    final request = http.MultipartRequest("POST", Uri.parse("http://localhost:8000/upload_profile_picture"))
+      ..fields["email"] = emailController.text
+      ..files.add(await http.MultipartFile.fromPath("file", _image!.path));
+    return http.Response.fromStream(await request.send());
+  }
 
+  Future<void> _saveProfile() async {
     final profileData = {
       "email": emailController.text,
       "full_name": fullNameController.text,
@@ -103,7 +107,6 @@ class _StudentProfilePageState extends State<StudentProfilePage> {
       "phone": phoneController.text,
       "gender": selectedGender,
       "dob": selectedDOB != null ? DateFormat('yyyy-MM-dd').format(selectedDOB!) : "",
-      "profile_picture": base64Image,
     };
 
     try {
@@ -114,6 +117,17 @@ class _StudentProfilePageState extends State<StudentProfilePage> {
         body: jsonEncode(profileData),
       );
 
+      if (response.statusCode == 200 && _imagePicked && _image != null) {
+        final upload = await _uploadPicture();
+        if (upload.statusCode != 200) {
+          ScaffoldMessenger.of(context).showSnackBar(
+            SnackBar(content: Text("Error uploading picture: ${upload.body}")),
+          );
+          return;
+        }
+        _imagePicked = false;
+      }
+
       if (response.statusCode == 200) {
         ScaffoldMessenger.of(context).showSnackBar(
           SnackBar(content: Text("Profile updated successfully!")),
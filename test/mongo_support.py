@@ -0,0 +1,27 @@
+"""Base class for tests that need a real MongoDB.
+
+Each test gets a throwaway database on MONGODB_URI (default
+mongodb://localhost:27017), dropped afterwards. The tests are skipped when
+no server answers, so the pure unit tests still run anywhere.
+"""
+import os
+import unittest
+from uuid import uuid4
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.errors import PyMongoError
+
+
+class MongoTestCase(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.client = AsyncIOMotorClient(os.getenv("MONGODB_URI", "mongodb://localhost:27017"), serverSelectionTimeoutMS=1000)
+        try:
+            await self.client.admin.command("ping")
+        except PyMongoError:
+            self.client.close()
+            self.skipTest("MongoDB is not reachable at MONGODB_URI")
+        self.db = self.client[f"erp_test_{uuid4().hex[:12]}"]
+
+    async def asyncTearDown(self):
+        await self.client.drop_database(self.db.name)
+        self.client.close()
@@ -0,0 +1,145 @@
+"""Signed access tokens and the per-route access checks.
+
+Run with: python -m unittest discover test
+"""
+import json
+import os
+import unittest
+from unittest import mock
+
+from fastapi import HTTPException
+from fastapi.security import HTTPAuthorizationCredentials
+
+from lib.common import auth
+from lib.common.auth import ADMIN, STUDENT, TokenService, _b64decode, _b64encode, ensure_self
+
+
+def bearer(token: str) -> HTTPAuthorizationCredentials:
+    return HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+
+
+class TokenServiceTests(unittest.TestCase):
+    def setUp(self):
+        self.tokens = TokenService(secret="test-secret", ttl=60, enforce=True)
+
+    def assertRejected(self, token: str, detail: str):
+        with self.assertRaises(HTTPException) as raised:
+            self.tokens.verify(token)
+        self.assertEqual((raised.exception.status_code, raised.exception.detail), (401, detail))
+
+    def test_issued_token_verifies(self):
+        token, expires_at = self.tokens.issue("riya@erp.edu", STUDENT, student_id="STU0000001")
+
+        claims = self.tokens.verify(token)
+        self.assertEqual((claims["sub"], claims["role"], claims["student_id"]), ("riya@erp.edu", STUDENT, "STU0000001"))
+        self.assertEqual(claims["exp"], expires_at)
+
+    def test_token_from_another_secret_is_rejected(self):
+        token, _ = TokenService(secret="other-secret", enforce=True).issue("riya@erp.edu", STUDENT)
+        self.assertRejected(token, "Invalid token")
+
+    def test_tampered_claims_are_rejected(self):
+        token, _ = self.tokens.issue("riya@erp.edu", STUDENT)
+        payload, signature = token.split(".")
+        claims = json.loads(_b64decode(payload))
+        forged = _b64encode(json.dumps({**claims, "role": ADMIN}).encode("utf-8"))
+
+        self.assertRejected(f"{forged}.{signature}", "Invalid token")
+        self.assertRejected(f"{payload}.{signature[:-2]}", "Invalid token")
+
+    def test_expired_token_is_rejected(self):
+        token, expires_at = self.tokens.issue("riya@erp.edu", STUDENT)
+        with mock.patch("lib.common.auth.time.time", return_value=expires_at + 1):
+            self.assertRejected(token, "Token expired")
+
+    def test_revoked_token_is_rejected(self):
+        token, _ = self.tokens.issue("riya@erp.edu", STUDENT)
+        self.tokens.revoke(self.tokens.verify(token))
+
+        self.assertRejected(token, "Token revoked")
+        self.assertEqual(self.tokens.stats()["denylist_size"], 1)
+
+    def test_malformed_tokens_get_401(self):
+        token, _ = self.tokens.issue("riya@erp.edu", STUDENT)
+        payload, signature = token.split(".")
+        for bad in ("", "no-dot", "a.b.c", f"{payload}.sïgnature", f"päyload.{signature}", f"{token}é"):
+            with self.subTest(token=bad):
+                with self.assertRaises(HTTPException) as raised:
+                    self.tokens.verify(bad)
+                self.assertEqual(raised.exception.status_code, 401)
+
+    def test_signed_payload_that_is_not_a_claims_object_gets_401(self):
+        for body in (b"[1, 2]", b"\xff\xfe", b"not json"):
+            with self.subTest(body=body):
+                payload = _b64encode(body)
+                self.assertRejected(f"{payload}.{self.tokens._sign(payload)}", "Malformed token")
+
+
+class AccessCheckTests(unittest.TestCase):
+    def setUp(self):
+        self.tokens = TokenService(secret="test-secret", ttl=60, enforce=True)
+        patcher = mock.patch.object(auth, "token_service", self.tokens)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def token(self, subject: str, role: str, **extra) -> HTTPAuthorizationCredentials:
+        return bearer(self.tokens.issue(subject, role, **extra)[0])
+
+    def test_roles(self):
+        student = self.token("riya@erp.edu", STUDENT)
+        admin = self.token("admin@erp.edu", ADMIN)
+
+        self.assertEqual(auth.require_student(student)["sub"], "riya@erp.edu")
+        self.assertEqual(auth.require_student(admin)["sub"], "admin@erp.edu")
+        self.assertEqual(auth.require_admin(admin)["sub"], "admin@erp.edu")
+        with self.assertRaises(HTTPException) as raised:
+            auth.require_admin(student)
+        self.assertEqual(raised.exception.status_code, 403)
+        with self.assertRaises(HTTPException) as raised:
+            auth.require_student(None)
+        self.assertEqual(raised.exception.status_code, 401)
+
+    def test_requests_pass_through_when_not_enforced(self):
+        self.tokens.enforce = False
+
+        self.assertIsNone(auth.require_admin(None))
+        self.assertIsNone(auth.require_admin(bearer("garbage")))
+        self.assertIsNone(auth.require_admin(self.token("riya@erp.edu", STUDENT)))
+
+    def test_admin_signup_needs_an_admin_or_the_bootstrap_secret(self):
+        admin = self.token("admin@erp.edu", ADMIN)
+        student = self.token("riya@erp.edu", STUDENT)
+
+        self.assertEqual(auth.require_admin_signup(admin, None)["sub"], "admin@erp.edu")
+        for credentials in (None, student):
+            with self.subTest(credentials=credentials):
+                with self.assertRaises(HTTPException):
+                    auth.require_admin_signup(credentials, None)
+
+        with mock.patch.dict("os.environ", {auth.BOOTSTRAP_ENV: "first-admin"}):
+            self.assertIsNone(auth.require_admin_signup(None, "first-admin"))
+            with self.assertRaises(HTTPException) as raised:
+                auth.require_admin_signup(None, "guess")
+            self.assertEqual(raised.exception.status_code, 403)
+        # Without a configured secret the header is ignored
+        with mock.patch.dict("os.environ"), self.assertRaises(HTTPException) as raised:
+            os.environ.pop(auth.BOOTSTRAP_ENV, None)
+            auth.require_admin_signup(None, "first-admin")
+        self.assertEqual(raised.exception.status_code, 401)
+
+    def test_ensure_self(self):
+        student = {"sub": "riya@erp.edu", "role": STUDENT, "student_id": "STU0000001"}
+
+        ensure_self(student, email="riya@erp.edu")
+        ensure_self(student, student_id="STU0000001")
+        ensure_self({"sub": "admin@erp.edu", "role": ADMIN}, email="riya@erp.edu")
+        ensure_self(None, email="riya@erp.edu")
+        for other in ({"email": "amit@erp.edu"}, {"student_id": "STU0000002"}):
+            with self.subTest(other=other):
+                with self.assertRaises(HTTPException) as raised:
+                    ensure_self(student, **other)
+                self.assertEqual(raised.exception.status_code, 403)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,82 @@
+"""Per-worker TTL/LRU cache used for assembled profiles and search results.
+
+Run with: python -m unittest discover test
+"""
+import unittest
+from unittest import mock
+
+from lib.common.cache import TTLCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class TTLCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        patcher = mock.patch("lib.common.cache.time.monotonic", self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = TTLCache(maxsize=2, ttl=60)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        self.assertEqual(cache.get("a"), 1)  # "b" is now the least recently used
+
+        cache.set("c", 3)
+
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual((cache.get("a"), cache.get("c")), (1, 3))
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+    def test_entries_expire_after_ttl(self):
+        cache = TTLCache(maxsize=10, ttl=5)
+        cache.set("a", 1)
+
+        self.clock.now += 5
+        self.assertEqual(cache.get("a"), 1)
+        self.clock.now += 0.01
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.stats()["size"], 0)
+
+    def test_set_refreshes_the_expiry(self):
+        cache = TTLCache(maxsize=10, ttl=5)
+        cache.set("a", 1)
+        self.clock.now += 4
+        cache.set("a", 2)
+        self.clock.now += 4
+
+        self.assertEqual(cache.get("a"), 2)
+
+    def test_invalidate_and_clear(self):
+        cache = TTLCache(maxsize=10, ttl=60)
+        cache.set("a", 1)
+        cache.set("b", 2)
+
+        cache.invalidate("a")
+        cache.invalidate("missing")
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.get("b"), 2)
+
+        cache.clear()
+        self.assertIsNone(cache.get("b"))
+
+    def test_stats(self):
+        cache = TTLCache(maxsize=10, ttl=60)
+        cache.set("a", 1)
+        cache.get("a")
+        cache.get("a")
+        cache.get("b")
+
+        stats = cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["hit_ratio"]), (2, 1, 0.6667))
+
+
+if __name__ == "__main__":
+    unittest.main()
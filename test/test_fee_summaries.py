@@ -0,0 +1,139 @@
+"""Incrementally maintained fee summaries and their rebuild, against a throwaway MongoDB.
+
+Run with: python -m unittest discover test
+"""
+import unittest
+from datetime import datetime
+
+from bson import ObjectId
+from mongo_support import MongoTestCase
+
+from lib.common.fee_summaries import (
+    ALL_MONTHS,
+    STUDENT_FIELDS,
+    rebuild_handler,
+    record_admissions,
+    record_payment,
+    record_regroup,
+)
+from lib.common.payments import apply_payment
+
+FIELDS = ("students", "total_fees", "collected", "outstanding", "defaulters", "payments")
+
+
+def admitted(student_id: str, course: str, year: str, total: float) -> dict:
+    return {
+        "student_id": student_id,
+        "email": f"{student_id.lower()}@erp.edu",
+        "course": course,
+        "academic_year": year,
+        "total_fees": total,
+        "paid_fees": 0,
+        "remaining_fees": total,
+    }
+
+
+class FeeSummaryTests(MongoTestCase):
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        self.students = self.db.students
+        self.ledger = self.db.fee_payments
+        self.summaries = self.db.fee_summaries
+        self.month = datetime.utcnow().strftime("%Y-%m")
+
+    async def groups(self) -> dict:
+        """{(course, year, month): {field: value}} with zero counters dropped."""
+        groups = {}
+        async for summary in self.summaries.find({}, {"_id": 0}):
+            key = (summary["course"], summary["academic_year"], summary["month"])
+            groups[key] = {field: summary[field] for field in FIELDS if summary.get(field)}
+        return groups
+
+    async def admit(self, *students: dict):
+        await self.students.insert_many([dict(student) for student in students])
+        await record_admissions(self.summaries, students)
+
+    async def pay(self, student_id: str, amount: float):
+        result = await apply_payment(
+            self.students,
+            self.ledger,
+            {"student_id": student_id},
+            amount,
+            {"student_id": student_id, "source": "admin"},
+            projection=STUDENT_FIELDS,
+        )
+        await record_payment(self.summaries, result["document"], amount)
+
+    async def test_admissions_add_to_their_group(self):
+        await self.admit(
+            admitted("STU0000001", "CS", "FE", 1000),
+            admitted("STU0000002", "CS", "FE", 500),
+            admitted("STU0000003", "IT", "SE", 800),
+        )
+
+        self.assertEqual(await self.groups(), {
+            ("CS", "FE", ALL_MONTHS): {"students": 2, "total_fees": 1500, "outstanding": 1500, "defaulters": 2},
+            ("IT", "SE", ALL_MONTHS): {"students": 1, "total_fees": 800, "outstanding": 800, "defaulters": 1},
+        })
+
+    async def test_payment_increments(self):
+        await self.admit(admitted("STU0000001", "CS", "FE", 1000))
+
+        await self.pay("STU0000001", 400)
+        groups = await self.groups()
+        self.assertEqual(groups[("CS", "FE", ALL_MONTHS)], {
+            "students": 1, "total_fees": 1000, "collected": 400, "outstanding": 600, "defaulters": 1,
+        })
+        self.assertEqual(groups[("CS", "FE", self.month)], {"collected": 400, "payments": 1})
+
+        # Paying off the balance removes the defaulter; overpaying only lowers outstanding to 0
+        await self.pay("STU0000001", 700)
+        groups = await self.groups()
+        self.assertEqual(groups[("CS", "FE", ALL_MONTHS)], {"students": 1, "total_fees": 1000, "collected": 1100})
+        self.assertEqual(groups[("CS", "FE", self.month)], {"collected": 1100, "payments": 2})
+
+    async def test_regroup_moves_a_student_between_groups(self):
+        student = admitted("STU0000001", "CS", "FE", 1000)
+        await self.admit(student)
+        await self.pay("STU0000001", 400)
+        before = await self.students.find_one({"student_id": "STU0000001"}, STUDENT_FIELDS)
+
+        await record_regroup(self.summaries, [
+            (before, {**before, "academic_year": "SE"}),
+            (before, dict(before)),  # Unchanged group: no update
+        ])
+
+        groups = await self.groups()
+        self.assertEqual(groups[("CS", "FE", ALL_MONTHS)], {})  # Every counter back at zero
+        self.assertEqual(groups[("CS", "SE", ALL_MONTHS)], {
+            "students": 1, "total_fees": 1000, "collected": 400, "outstanding": 600, "defaulters": 1,
+        })
+
+    async def test_rebuild_matches_the_incremental_totals(self):
+        await self.admit(
+            admitted("STU0000001", "CS", "FE", 1000),
+            admitted("STU0000002", "CS", "FE", 500),
+            admitted("STU0000003", "IT", "SE", 800),
+        )
+        await self.pay("STU0000001", 1000)
+        await self.pay("STU0000002", 200)
+        await self.pay("STU0000003", 300)
+        before = await self.students.find_one_and_update(
+            {"student_id": "STU0000002"}, {"$set": {"academic_year": "SE"}}, projection=STUDENT_FIELDS
+        )
+        await record_regroup(self.summaries, [(before, {**before, "academic_year": "SE"})])
+        incremental = await self.groups()
+        # Payment months follow each student's current group, as the rebuild attributes them
+        incremental[("CS", "FE", self.month)] = {"collected": 1000, "payments": 1}
+        incremental[("CS", "SE", self.month)] = {"collected": 200, "payments": 1}
+
+        async def progress(done, total):
+            pass
+
+        await rebuild_handler(self.students, self.ledger, self.summaries)({"_id": ObjectId()}, progress)
+
+        self.assertEqual(await self.groups(), incremental)
+
+
+if __name__ == "__main__":
+    unittest.main()
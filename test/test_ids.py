@@ -0,0 +1,60 @@
+"""Block ID allocator behind admission student IDs, against a throwaway MongoDB.
+
+Run with: python -m unittest discover test
+"""
+import asyncio
+import re
+import unittest
+
+from mongo_support import MongoTestCase
+
+from lib.common.ids import BlockIdAllocator
+
+STUDENT_ID = re.compile(r"^STU\d{7}$")
+
+
+class BlockIdAllocatorTests(MongoTestCase):
+    def allocator(self, block_size: int = 3) -> BlockIdAllocator:
+        return BlockIdAllocator(self.db.counters, "student_id", prefix="STU", width=7, block_size=block_size)
+
+    async def reserved(self) -> int:
+        return (await self.db.counters.find_one({"_id": "student_id"}))["seq"]
+
+    async def test_ids_are_formatted_as_stu_and_seven_digits(self):
+        ids = await self.allocator().allocate(2)
+
+        self.assertEqual(ids, ["STU0000001", "STU0000002"])
+        self.assertTrue(all(STUDENT_ID.match(student_id) for student_id in ids))
+
+    async def test_block_is_refilled_when_used_up(self):
+        allocator = self.allocator(block_size=3)
+
+        self.assertEqual(await allocator.allocate(2), ["STU0000001", "STU0000002"])
+        self.assertEqual(await self.reserved(), 3)
+        self.assertEqual(await allocator.allocate(2), ["STU0000003", "STU0000004"])
+        self.assertEqual(await self.reserved(), 6)
+        self.assertEqual(await allocator.next_id(), "STU0000005")
+        self.assertEqual(await self.reserved(), 6)
+
+    async def test_request_larger_than_a_block_is_one_reservation(self):
+        allocator = self.allocator(block_size=3)
+
+        ids = await allocator.allocate(10)
+
+        self.assertEqual(ids, [f"STU{number:07d}" for number in range(1, 11)])
+        self.assertEqual(await self.reserved(), 10)
+
+    async def test_workers_never_hand_out_the_same_id(self):
+        # Two allocators stand in for two worker processes sharing the counter
+        workers = [self.allocator(block_size=5), self.allocator(block_size=5)]
+
+        batches = await asyncio.gather(*(workers[i % 2].allocate(1 + i % 4) for i in range(40)))
+
+        ids = [student_id for batch in batches for student_id in batch]
+        self.assertEqual(len(ids), sum(1 + i % 4 for i in range(40)))
+        self.assertEqual(len(set(ids)), len(ids))
+        self.assertTrue(all(STUDENT_ID.match(student_id) for student_id in ids))
+
+
+if __name__ == "__main__":
+    unittest.main()
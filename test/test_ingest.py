@@ -0,0 +1,178 @@
+"""Streaming CSV, NDJSON and JSON-array parsers used by the bulk upload endpoints.
+
+Run with: python -m unittest discover test
+"""
+import asyncio
+import json
+import unittest
+
+from fastapi import HTTPException
+
+from lib.common.ingest import MAX_RECORD_BYTES, UploadError, _iter_json_array, iter_batches, iter_upload_rows
+
+
+class FakeRequest:
+    def __init__(self, body: bytes, chunk_size: int, content_type: str = "application/json"):
+        self.body = body
+        self.chunk_size = chunk_size
+        self.headers = {"content-type": content_type}
+
+    async def stream(self):
+        for start in range(0, len(self.body), self.chunk_size):
+            yield self.body[start:start + self.chunk_size]
+
+
+def parse(body: str, chunk_size: int):
+    async def collect():
+        return [element async for element in _iter_json_array(FakeRequest(body.encode("utf-8"), chunk_size))]
+
+    return asyncio.run(collect())
+
+
+def parse_rows(body: str, chunk_size: int, content_type: str):
+    async def collect():
+        request = FakeRequest(body.encode("utf-8"), chunk_size, content_type)
+        return [row async for row in iter_upload_rows(request)]
+
+    return asyncio.run(collect())
+
+
+def batches_until_error(body: str, chunk_size: int, content_type: str, batch_size: int):
+    """The batches yielded before the upload failed, and the error."""
+    batches = []
+
+    async def collect():
+        request = FakeRequest(body.encode("utf-8"), chunk_size, content_type)
+        try:
+            async for batch in iter_batches(request, batch_size=batch_size):
+                batches.append(batch)
+        except UploadError as error:
+            return error
+
+    return batches, asyncio.run(collect())
+
+
+CHUNK_SIZES = (1, 2, 3, 5, 7, 1 << 16)
+
+
+class JsonArrayTests(unittest.TestCase):
+    def assertParses(self, body: str, expected):
+        for chunk_size in CHUNK_SIZES:
+            with self.subTest(body=body, chunk_size=chunk_size):
+                self.assertEqual(parse(body, chunk_size), expected)
+
+    def assertRejected(self, body: str, chunk_sizes=CHUNK_SIZES):
+        for chunk_size in chunk_sizes:
+            with self.subTest(body=body, chunk_size=chunk_size):
+                with self.assertRaises(HTTPException) as raised:
+                    parse(body, chunk_size)
+                self.assertEqual(raised.exception.status_code, 400)
+
+    def test_valid_arrays(self):
+        for body in (
+            "[]",
+            " [ ] ",
+            "[1]",
+            "[1.5e3]",
+            "[-0.25, 10, 1e-2]",
+            "[true, false, null]",
+            '["a,]", "\\"quoted\\""]',
+            '[{"name": "Riya", "tags": ["x", "]"]}, [1, [2]], 3]',
+            '\n[\n  {"a": 1},\n  {"b": 2}\n]\n',
+            '["Zo\\u00eb", "Ålle"]',
+        ):
+            self.assertParses(body, json.loads(body))
+
+    def test_rows_stream_before_the_array_ends(self):
+        rows = []
+
+        async def collect():
+            try:
+                async for row in _iter_json_array(FakeRequest(b'[{"a": 1}, {"b": 2}, oops', 3)):
+                    rows.append(row)
+            except HTTPException:
+                pass
+
+        asyncio.run(collect())
+        self.assertEqual(rows, [{"a": 1}, {"b": 2}])
+
+    def test_separators(self):
+        for body in ("[1 2]", "[,,1]", "[,1]", "[1,]", "[1,,2]", "[1 , , 2]", '[{"a": 1}{"b": 2}]', "[[1][2]]"):
+            self.assertRejected(body)
+
+    def test_malformed_scalars(self):
+        for body in ("[1.5.3]", "[tru]", "[nul, 1]", "[01]", "[1e]", "[-]", "[+1]"):
+            self.assertRejected(body)
+
+    def test_structure(self):
+        for body in ("", "   ", "{}", "1", "[", "[1", "[1,", "[1] 2", "[1]]", '["unterminated]', '[{"a": 1]'):
+            self.assertRejected(body)
+
+    def test_oversized_record(self):
+        self.assertRejected('["' + "x" * (MAX_RECORD_BYTES + 1) + '"]', chunk_sizes=(4096, 1 << 16))
+
+
+
+class CsvTests(unittest.TestCase):
+    def assertRows(self, body: str, expected):
+        for chunk_size in CHUNK_SIZES:
+            with self.subTest(body=body, chunk_size=chunk_size):
+                self.assertEqual(parse_rows(body, chunk_size, "text/csv"), expected)
+
+    def test_rows(self):
+        self.assertRows("name,email\r\nRiya,riya@x.edu\r\n\r\nAmit , amit@x.edu", [
+            {"name": "Riya", "email": "riya@x.edu"},
+            {"name": "Amit", "email": "amit@x.edu"},
+        ])
+
+    def test_quoted_fields(self):
+        self.assertRows('name,address\n"Shah, Riya","Flat 2\nMain Road"\n"Say ""hi""",x\n', [
+            {"name": "Shah, Riya", "address": "Flat 2\nMain Road"},
+            {"name": 'Say "hi"', "address": "x"},
+        ])
+
+    def test_quote_inside_unquoted_field(self):
+        # csv treats a quote inside an unquoted field literally; it must not swallow the next rows
+        self.assertRows('name,email\nO"Brien,o@x.edu\nRiya,riya@x.edu\n', [
+            {"name": 'O"Brien', "email": "o@x.edu"},
+            {"name": "Riya", "email": "riya@x.edu"},
+        ])
+
+    def test_unterminated_quote(self):
+        for chunk_size in CHUNK_SIZES:
+            with self.subTest(chunk_size=chunk_size):
+                with self.assertRaises(UploadError) as raised:
+                    parse_rows('name,email\nRiya,riya@x.edu\n"Amit,amit@x.edu\nZoe,zoe@x.edu\n', chunk_size, "text/csv")
+                self.assertEqual(raised.exception.line, 3)
+
+
+class MidStreamErrorTests(unittest.TestCase):
+    def test_rows_before_a_csv_error_are_still_batched(self):
+        body = "name\n" + "".join(f"s{i}\n" for i in range(5)) + '"' + "x" * (MAX_RECORD_BYTES + 1)
+        for chunk_size in (4096, 1 << 16):
+            with self.subTest(chunk_size=chunk_size):
+                batches, error = batches_until_error(body, chunk_size, "text/csv", batch_size=2)
+                self.assertEqual([[number for number, _ in batch] for batch in batches], [[1, 2], [3, 4], [5]])
+                self.assertEqual(error.result(), {
+                    "row": 6,
+                    "status": "malformed",
+                    "detail": "Upload contains an oversized record",
+                    "line": 7,
+                })
+
+    def test_json_error_reports_the_offset(self):
+        for chunk_size in CHUNK_SIZES:
+            with self.subTest(chunk_size=chunk_size):
+                batches, error = batches_until_error('[{"a": 1}, {"b": 2} {"c": 3}]', chunk_size, "application/json", 10)
+                self.assertEqual(batches, [[(1, {"a": 1}), (2, {"b": 2})]])
+                self.assertEqual(error.row, 3)
+                self.assertEqual(error.offset, 20)
+
+    def test_ndjson_keeps_going_past_bad_lines(self):
+        batches, error = batches_until_error('{"a": 1}\nnot json\n{"b": 2}\n', 3, "application/x-ndjson", 10)
+        self.assertIsNone(error)
+        self.assertEqual(batches, [[(1, {"a": 1}), (2, None), (3, {"b": 2})]])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,32 @@
+"""Date bounds of new leave requests.
+
+Run with: python -m unittest discover test
+"""
+import unittest
+from datetime import datetime
+
+from lib.common.leaves import leave_dates
+
+
+class LeaveDatesTests(unittest.TestCase):
+    def test_dates_are_normalized(self):
+        self.assertEqual(leave_dates("2025-03-04", "2025-03-06"), ("2025-03-04", "2025-03-06"))
+        self.assertEqual(leave_dates("2025-3-4", None), ("2025-03-04", "2025-03-04"))
+        self.assertEqual(leave_dates(None, "", today=datetime(2025, 1, 9, 15)), ("2025-01-09", "2025-01-09"))
+
+    def test_invalid_dates_are_rejected(self):
+        for from_date, to_date in (
+            ("2025-03-06", "2025-03-04"),  # Inverted
+            ("2025-02-30", None),
+            ("04/03/2025", None),
+            ("2025-03-04", "tomorrow"),
+            (20250304, None),
+            ("2025-03-04", ["2025-03-05"]),
+        ):
+            with self.subTest(from_date=from_date, to_date=to_date):
+                with self.assertRaises(ValueError):
+                    leave_dates(from_date, to_date)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,51 @@
+"""Per-collection labels of the Mongo command timer.
+
+Run with: python -m unittest discover test
+"""
+import unittest
+from types import SimpleNamespace
+
+from lib.common.metrics import Metrics, MongoCommandTimer
+
+
+def event(name: str, command: dict, request_id: int = 1, duration_micros: int = 1000) -> SimpleNamespace:
+    return SimpleNamespace(
+        command_name=name,
+        command={name: command.pop(name, 1), **command},
+        connection_id=("localhost", 27017),
+        request_id=request_id,
+        operation_id=request_id,
+        duration_micros=duration_micros,
+    )
+
+
+class MongoCommandTimerTests(unittest.TestCase):
+    def setUp(self):
+        self.registry = Metrics()
+        self.timer = MongoCommandTimer(self.registry)
+
+    def time(self, name: str, command: dict, failed: bool = False):
+        started = event(name, dict(command))
+        self.timer.started(started)
+        (self.timer.failed if failed else self.timer.succeeded)(started)
+
+    def test_commands_are_labelled_with_their_collection(self):
+        self.time("find", {"find": "students", "filter": {}})
+        self.time("getMore", {"getMore": 1234567890, "collection": "students"})
+        self.time("insert", {"insert": "fees", "documents": []}, failed=True)
+        self.time("ping", {"ping": 1})
+
+        self.assertEqual(set(self.registry.commands), {
+            ("students", "find"), ("students", "getMore"), ("fees", "insert"), ("-", "ping"),
+        })
+        self.assertEqual(dict(self.registry.command_failures), {("fees", "insert"): 1})
+        self.assertEqual(self.timer._pending, {})
+
+    def test_falls_back_to_the_collection_field(self):
+        self.time("aggregate", {"aggregate": 1, "collection": "fee_summaries"})
+
+        self.assertEqual(set(self.registry.commands), {("fee_summaries", "aggregate")})
+
+
+if __name__ == "__main__":
+    unittest.main()
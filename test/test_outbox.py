@@ -0,0 +1,173 @@
+"""Email outbox against a local aiosmtpd server and a throwaway MongoDB.
+
+Run with: python -m unittest discover test
+"""
+import asyncio
+import socket
+import unittest
+from datetime import datetime, timedelta
+
+from mongo_support import MongoTestCase
+
+from lib.common.outbox import FAILED, PENDING, SENDING, SENT, EmailOutbox, SMTPSender, new_email
+
+try:
+    from aiosmtpd.controller import Controller
+except ImportError:  # Only needed for these tests
+    Controller = None
+
+
+class RecordingHandler:
+    """Accepts mail, except for temp@ (451) and bad@ (550) recipients."""
+
+    def __init__(self):
+        self.delivered = []
+        self.sessions = 0
+
+    async def handle_EHLO(self, server, session, envelope, hostname, responses):
+        self.sessions += 1
+        session.host_name = hostname
+        return responses
+
+    async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+        if address.startswith("temp@"):
+            return "451 Mailbox busy, try later"
+        if address.startswith("bad@"):
+            return "550 No such user"
+        envelope.rcpt_tos.append(address)
+        return "250 OK"
+
+    async def handle_DATA(self, server, session, envelope):
+        self.delivered.extend(envelope.rcpt_tos)
+        return "250 Message accepted"
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@unittest.skipIf(Controller is None, "aiosmtpd is not installed")
+class EmailOutboxTests(MongoTestCase):
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        self.handler = RecordingHandler()
+        self.smtp = Controller(self.handler, hostname="127.0.0.1", port=free_port())
+        self.smtp.start()
+        self.outboxes = []
+
+    async def asyncTearDown(self):
+        for outbox in self.outboxes:
+            await outbox.shutdown()
+            outbox.sender.close()
+        self.smtp.stop()
+        await super().asyncTearDown()
+
+    def outbox(self, **options) -> EmailOutbox:
+        sender = SMTPSender(host="127.0.0.1", port=self.smtp.port, sender="erp@test.local")
+        outbox = EmailOutbox(self.db.email_outbox, self.db.email_rate, sender=sender, **options)
+        self.outboxes.append(outbox)
+        return outbox
+
+    async def queue(self, outbox: EmailOutbox, *recipients: str):
+        await outbox.enqueue([new_email(to, "Subject", "Body", "test") for to in recipients])
+
+    async def status_of(self, to: str) -> dict:
+        return await self.db.email_outbox.find_one({"to": to})
+
+    async def wait_for_next_minute_if_close(self):
+        # The rate counter is per wall-clock minute; keep a test inside one window
+        now = datetime.utcnow()
+        if now.second >= 57:
+            await asyncio.sleep(61 - now.second)
+
+    async def test_batches_are_claimed_by_one_sender_only(self):
+        first, second = self.outbox(), self.outbox()
+        await self.queue(first, *(f"s{i}@test.local" for i in range(5)))
+
+        claimed_first = await first._claim(3)
+        claimed_second = await second._claim(3)
+
+        self.assertEqual(len(claimed_first), 3)
+        self.assertEqual(len(claimed_second), 2)
+        self.assertFalse({email["_id"] for email in claimed_first} & {email["_id"] for email in claimed_second})
+        self.assertEqual(await second._claim(3), [])
+        leased = await self.db.email_outbox.find({"status": SENDING}).to_list(None)
+        self.assertEqual(len(leased), 5)
+        self.assertTrue(all(email["next_attempt_at"] > datetime.utcnow() for email in leased))
+
+    async def test_batch_is_sent_over_one_connection(self):
+        outbox = self.outbox()
+        await self.queue(outbox, "a@test.local", "b@test.local", "c@test.local")
+
+        await outbox._deliver(await outbox._claim(10))
+
+        self.assertEqual(sorted(self.handler.delivered), ["a@test.local", "b@test.local", "c@test.local"])
+        self.assertEqual(self.handler.sessions, 1)
+        self.assertEqual(outbox.sender.connections, 1)
+        for to in ("a@test.local", "b@test.local", "c@test.local"):
+            email = await self.status_of(to)
+            self.assertEqual((email["status"], email["attempts"]), (SENT, 1))
+
+    async def test_temporary_failure_is_retried_with_backoff(self):
+        outbox = self.outbox()
+        await self.queue(outbox, "temp@test.local", "ok@test.local")
+
+        before = datetime.utcnow()
+        await outbox._deliver(await outbox._claim(10))
+
+        email = await self.status_of("temp@test.local")
+        self.assertEqual((email["status"], email["attempts"]), (PENDING, 1))
+        self.assertIn("451", email["last_error"])
+        # First retry waits BACKOFF_SECONDS with up to 50% jitter
+        self.assertGreaterEqual(email["next_attempt_at"], before + timedelta(seconds=14))
+        self.assertLessEqual(email["next_attempt_at"], datetime.utcnow() + timedelta(seconds=31))
+        self.assertEqual((await self.status_of("ok@test.local"))["status"], SENT)
+        self.assertEqual(await outbox._claim(10), [])
+        self.assertEqual(outbox.retried, 1)
+
+    async def test_permanent_failure_is_not_retried(self):
+        outbox = self.outbox()
+        await self.queue(outbox, "bad@test.local")
+
+        await outbox._deliver(await outbox._claim(10))
+
+        email = await self.status_of("bad@test.local")
+        self.assertEqual((email["status"], email["attempts"]), (FAILED, 1))
+        self.assertIn("550", email["last_error"])
+        self.assertEqual(outbox.failed, 1)
+
+    async def test_rate_counter_is_shared_between_senders(self):
+        await self.wait_for_next_minute_if_close()
+        first, second = self.outbox(rate_per_minute=5), self.outbox(rate_per_minute=5)
+
+        window, granted_first = await first._reserve(4)
+        _, granted_second = await second._reserve(4)
+        self.assertEqual((granted_first, granted_second), (4, 1))
+
+        # Unused reservations go back to the shared counter
+        await first._release(window, 2)
+        await second._release(window, 3)
+        _, granted = await second._reserve(4)
+        self.assertEqual(granted, 2)
+
+    async def test_senders_stay_under_the_rate_together(self):
+        await self.wait_for_next_minute_if_close()
+        senders = [self.outbox(rate_per_minute=3, batch_size=2) for _ in range(2)]
+        await self.queue(senders[0], *(f"s{i}@test.local" for i in range(8)))
+
+        for outbox in senders:
+            await outbox.start()
+        for _ in range(50):
+            if len(self.handler.delivered) >= 3:
+                break
+            await asyncio.sleep(0.1)
+        await asyncio.sleep(0.5)
+
+        self.assertEqual(len(self.handler.delivered), 3)
+        self.assertEqual(await self.db.email_outbox.count_documents({"status": SENT}), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,146 @@
+"""Idempotent fee payments and the ledger sweeper, against a throwaway MongoDB.
+
+Run with: python -m unittest discover test
+"""
+import asyncio
+import unittest
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from fastapi import HTTPException
+from mongo_support import MongoTestCase
+
+from lib.common.payments import (
+    APPLIED_FIELD,
+    LEDGER_GRACE_SECONDS,
+    PaymentLedgerSweeper,
+    apply_payment,
+    payment_update,
+)
+
+FEES = {"email": "riya@erp.edu", "academic_year": "FE"}
+DETAILS = {**FEES, "source": "student"}
+
+
+class PaymentTests(MongoTestCase):
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        self.fees = self.db.fees
+        self.ledger = self.db.fee_payments
+        await self.ledger.create_index("idempotency_key", unique=True)
+        await self.fees.insert_many([
+            {**FEES, "total_fees": 1000, "paid_fees": 0, "remaining_fees": 1000},
+            {"email": "amit@erp.edu", "academic_year": "FE", "total_fees": 1000, "paid_fees": 0, "remaining_fees": 1000},
+        ])
+
+    async def pay(self, amount, key="key-1", match=FEES, details=DETAILS):
+        return await apply_payment(self.fees, self.ledger, match, amount, details, key, projection={"email": 1})
+
+    async def balance(self, email="riya@erp.edu"):
+        record = await self.fees.find_one({"email": email})
+        return record["paid_fees"], record["remaining_fees"]
+
+    async def apply_without_ledger(self, amount, key, at):
+        """The fee write of a request that died before its ledger entry was written."""
+        payment_id = str(ObjectId())
+        await self.fees.update_one(
+            {**FEES, f"{APPLIED_FIELD}.idempotency_key": {"$ne": key}},
+            payment_update(amount, payment_id, key, at),
+        )
+        return payment_id
+
+    async def test_payment_is_applied_and_recorded(self):
+        result = await self.pay(300)
+
+        self.assertEqual((result["paid_fees"], result["remaining_fees"], result["replayed"]), (300, 700, False))
+        self.assertEqual(result["document"]["email"], "riya@erp.edu")
+        self.assertEqual(await self.balance(), (300, 700))
+        entry = await self.ledger.find_one({"_id": ObjectId(result["payment_id"])})
+        self.assertEqual((entry["amount"], entry["status"], entry["source"]), (300, "applied", "student"))
+
+    async def test_retry_with_the_same_key_is_replayed(self):
+        first = await self.pay(300)
+        second = await self.pay(300)
+
+        self.assertTrue(second["replayed"])
+        self.assertNotIn("document", second)
+        self.assertEqual(second["payment_id"], first["payment_id"])
+        self.assertEqual(await self.balance(), (300, 700))
+        self.assertEqual(await self.ledger.count_documents({}), 1)
+
+    async def test_concurrent_retries_pay_once(self):
+        results = await asyncio.gather(*(self.pay(250) for _ in range(5)))
+
+        self.assertEqual(len({result["payment_id"] for result in results}), 1)
+        self.assertEqual(sum(not result["replayed"] for result in results), 1)
+        self.assertEqual(await self.balance(), (250, 750))
+
+    async def test_reused_key_with_a_different_amount_is_rejected(self):
+        await self.pay(300)
+
+        with self.assertRaises(HTTPException) as raised:
+            await self.pay(500)
+        self.assertEqual(raised.exception.status_code, 422)
+        self.assertEqual(await self.balance(), (300, 700))
+
+    async def test_reused_key_on_another_record_is_undone(self):
+        await self.pay(300)
+        amit = {"email": "amit@erp.edu", "academic_year": "FE"}
+
+        with self.assertRaises(HTTPException) as raised:
+            await self.pay(300, match=amit, details={**amit, "source": "student"})
+        self.assertEqual(raised.exception.status_code, 422)
+        self.assertEqual(await self.balance("amit@erp.edu"), (0, 1000))
+        self.assertEqual((await self.fees.find_one({"email": "amit@erp.edu"}))[APPLIED_FIELD], [])
+
+    async def test_missing_record(self):
+        self.assertIsNone(await self.pay(100, match={"email": "nobody@erp.edu", "academic_year": "FE"}))
+        self.assertEqual(await self.ledger.count_documents({}), 0)
+
+    async def test_invalid_amounts(self):
+        for amount in (True, float("nan"), float("inf"), 0, -5, "100", None):
+            with self.subTest(amount=amount):
+                with self.assertRaises(HTTPException) as raised:
+                    await self.pay(amount)
+                self.assertEqual(raised.exception.status_code, 400)
+        self.assertEqual(await self.balance(), (0, 1000))
+
+    async def test_retry_records_a_payment_whose_ledger_write_was_lost(self):
+        payment_id = await self.apply_without_ledger(400, "key-1", datetime.utcnow())
+
+        result = await self.pay(400)
+
+        self.assertEqual((result["payment_id"], result["replayed"]), (payment_id, False))
+        self.assertEqual(result["document"]["email"], "riya@erp.edu")
+        self.assertEqual(await self.balance(), (400, 600))
+        self.assertEqual(await self.ledger.count_documents({}), 1)
+
+    async def test_sweeper_records_a_stalled_payment(self):
+        stalled_at = datetime.utcnow() - timedelta(seconds=LEDGER_GRACE_SECONDS + 5)
+        payment_id = await self.apply_without_ledger(400, "key-1", stalled_at)
+        # Too recent: its request may still be writing the entry
+        await self.apply_without_ledger(100, "key-2", datetime.utcnow())
+        recorded = []
+
+        async def on_applied(result):
+            recorded.append(result)
+
+        sweeper = PaymentLedgerSweeper(self.fees, self.ledger, "student", ("email", "academic_year"), on_applied=on_applied)
+        self.assertEqual(await sweeper.sweep(), 1)
+
+        entry = await self.ledger.find_one({"_id": ObjectId(payment_id)})
+        self.assertEqual((entry["amount"], entry["paid_fees"], entry["source"]), (400, 400, "student"))
+        self.assertEqual((entry["email"], entry["academic_year"]), ("riya@erp.edu", "FE"))
+        self.assertEqual([result["payment_id"] for result in recorded], [payment_id])
+        self.assertEqual(recorded[0]["document"]["email"], "riya@erp.edu")
+
+        # Nothing is recorded twice, by this sweeper or by another worker's
+        self.assertEqual(await sweeper.sweep(), 0)
+        other = PaymentLedgerSweeper(self.fees, self.ledger, "student", ("email", "academic_year"))
+        self.assertEqual(await other.sweep(), 0)
+        self.assertEqual(await self.ledger.count_documents({}), 1)
+        self.assertEqual(await self.balance(), (500, 500))
+
+
+if __name__ == "__main__":
+    unittest.main()